@@ -0,0 +1,112 @@
+import os
+import re
+import csv
+import threading
+from functools import lru_cache
+from nltk.corpus import stopwords
+from nltk.stem import WordNetLemmatizer
+from nltk.tokenize import word_tokenize
+from config import analyzer_memo_size
+
+# Everything but letters, digits and spaces is replaced before tokenizing document fields
+CLEANUP_PATTERN = re.compile(r'[^A-Za-z0-9 ]+')
+
+
+class Analyzer:
+    """
+    Text -> index terms, shared by the indexer, the upload path and the query path.
+
+    Fields are cleaned with CLEANUP_PATTERN, tokenized, lemmatized and filtered (stop words and
+    terms of 2 characters or less). Lemmas come from a precomputed table for the lexicon's words,
+    then a bounded memo, and only then from WordNet (up to four lookups per word).
+    """
+
+    def __init__(self, stop_words, memo_size=analyzer_memo_size):
+        self.stop_words = stop_words
+        self.lemmatizer = WordNetLemmatizer()
+        self.lemma_table = {}
+        self.memoized_lemma = lru_cache(maxsize=memo_size)(self.wordnet_lemma)
+
+    # Verb, noun, adjective then adverb: the first lemma that differs from the word wins
+    def wordnet_lemma(self, word):
+        for pos in ("v", "n", "a"):
+            lemmatized_word = self.lemmatizer.lemmatize(word, pos=pos)
+            if lemmatized_word != word:
+                return lemmatized_word
+        return self.lemmatizer.lemmatize(word, pos="r")
+
+    def lemma(self, word):
+        word = word.lower()
+        lemma = self.lemma_table.get(word)
+        return lemma if lemma is not None else self.memoized_lemma(word)
+
+    def keep(self, term):
+        return term not in self.stop_words and len(term) > 2
+
+    # Terms of one field value
+    def terms(self, text):
+        return [term for term in map(self.lemma, word_tokenize(CLEANUP_PATTERN.sub(' ', text))) if self.keep(term)]
+
+    # Article text is tokenized paragraph by paragraph (scraped articles join them with a literal "\\n")
+    def text_terms(self, text, separator="\n"):
+        return [term for paragraph in text.split(separator) for term in self.terms(paragraph)]
+
+    def list_terms(self, values):
+        return [term for value in values for term in self.terms(str(value))]
+
+    def document_terms(self, title, text, tags, authors, separator="\n"):
+        """Tokens of a whole document with their sources, in title, text, tags, authors order"""
+        combined_tokens = []
+        sources = []
+        for tokens, source in ((self.terms(title), 'T'), (self.text_terms(text, separator), 'Te'),
+                               (self.list_terms(tags), 'Ta'), (self.list_terms(authors), 'A')):
+            combined_tokens.extend(tokens)
+            sources.extend([source] * len(tokens))
+        return combined_tokens, sources
+
+    def query_terms(self, query, lexicon, limit=10):
+        """Lemmas of the first `limit` distinct query words, keeping those in the lexicon"""
+        words = list(dict.fromkeys(word_tokenize(query.lower())))[:limit]
+        return [lemma for lemma in map(self.lemma, words) if lemma in lexicon]
+
+    # Lemma table for the lexicon's words, computed once and reused by every later run
+    def load_lemma_table(self, file_path):
+        if not os.path.exists(file_path):
+            return
+        with open(file_path, 'r', encoding='utf-8', newline='') as file:
+            reader = csv.reader(file)
+            next(reader, None)
+            self.lemma_table = {word: lemma for word, lemma in reader}
+        print(f"Lemma table loaded with {len(self.lemma_table)} words!")
+
+    def save_lemma_table(self, file_path, words):
+        table = {word: self.lemma(word) for word in words}
+        with open(file_path + '.tmp', 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['word', 'lemma'])
+            writer.writerows(table.items())
+        os.replace(file_path + '.tmp', file_path)
+        self.lemma_table = table
+
+    def memo_stats(self):
+        info = self.memoized_lemma.cache_info()
+        return {
+            'table_size': len(self.lemma_table),
+            'memo_size': info.currsize,
+            'memo_max_size': info.maxsize,
+            'memo_hits': info.hits,
+            'memo_misses': info.misses,
+        }
+
+
+# One analyzer per process, created on first use (stop words load lazily from NLTK)
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+def get_analyzer():
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                _analyzer = Analyzer(set(stopwords.words('english')))
+    return _analyzer
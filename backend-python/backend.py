@@ -1,36 +1,52 @@
 ############################################################
 # IMPORTS & ENVIRONMENT SETUP
 ############################################################
+import time as t
+boot_started = t.perf_counter()  # The startup report counts from here, imports included
+
 from fastapi import FastAPI, HTTPException
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from nltk import WordNetLemmatizer
-from heapq import nlargest
 
-from classes import QueryRequest, UrlRequest, SearchResult, QueryCache, SummarizeRequest, SummarizeArticleRequest, SummarizeResponse, GeminiRAGModule
-from lexicon_utils import load_lexicon, preprocess_word
-from config import inverted_index_folder, lexicon_file, processed_file, scrapped_file, received_file, lengths_file
-from csv_utils import load_processed_to_dict, load_scrapped_to_dict, load_lengths
-from medium_scraper import scrape_medium_article
+from classes import QueryRequest, UrlRequest, UrlsRequest, SearchResult, SummarizeRequest, SummarizeArticleRequest, SummarizeResponse, GeminiRAGModule
+from lexicon_utils import load_lexicon, save_word_ids
+from analyzer import get_analyzer
+from http_cache import get_http_cache
+from summary_cache import SummaryCache
+from config import inverted_index_folder, lexicon_file, processed_file, doc_id_file, scrapped_file, lengths_file, doc_store_folder, snapshot_file, lemma_table_file, delta_log_file, delta_compact_docs, upload_jobs_file, upload_workers, upload_batch_size, upload_batch_wait, upload_job_retention, barrel_size, posting_cache_bytes, query_cache_entries, query_cache_ttl, search_io_workers, search_cpu_workers, max_concurrent_searches, offline_boot, snapshot_boot, http_pool_size, http_dns_cache_seconds, http_keepalive_seconds, article_parse_workers, summary_cache_file, summary_cache_bytes, summary_cache_ttl
+from doc_store import DocStore
+from snapshot import Snapshot, capture_snapshot, write_captured_snapshot
+from medium_scraper import scrape_medium_article_async
+from segments import SegmentIndex
+from generations import IndexGenerations
+from bm25 import BM25Scorer, TOP_K
+from caches import PostingCache, QueryResultCache
+from coalesce import AsyncSingleFlight
+from inverted_index import read_csv_postings
+from update_barrels import barrel_update_listeners, notify_barrel_updated
+from delta_index import DeltaIndex
+from startup import StartupReport
+from upload_queue import UploadQueue
+from medium_scraper import scrape_article_for_upload_async, add_scraped_articles
+from update_barrels import add_scraped_article_to_index
+from csv_utils import load_latest_doc_id, canonical_url
 
 import threading
-import struct
 import csv
-import json
-import re
 import asyncio
+import aiohttp
 import os
-import math
-import time as t
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
 from typing import List, Dict, Any
 
-from downloads import download_nltk_resources
+from downloads import ensure_nltk_resources
 from dotenv import load_dotenv
 load_dotenv()
-download_nltk_resources()
+
+startup_report = StartupReport(boot_started)
+startup_report.record("imports", t.perf_counter() - boot_started)
 
 ############################################################
 # FAST API SETUP
@@ -39,44 +55,136 @@ download_nltk_resources()
 # Use FastAPI lifespan event for startup/shutdown logic
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global http_session
+    # One pooled HTTP client (keep-alive, DNS cache) for article scraping and Gemini calls
+    http_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(
+        limit=http_pool_size, ttl_dns_cache=http_dns_cache_seconds, keepalive_timeout=http_keepalive_seconds))
     # Startup: Initialize Gemini summarization service
     setup_gemini_summarization_service(
         api_key=os.getenv("GEMINI_API_KEY"),
         model_name="gemini-1.5-flash"  # Free tier model
     )
+    # The index loads in the background so the server accepts connections right away (see /ready)
+    index_loading = asyncio.get_running_loop().run_in_executor(None, load_index)
+    # Upload workers pick up the jobs a restart interrupted
+    await upload_queue.start()
     yield
-    # Shutdown: Add any cleanup logic here if needed
+    # Shutdown: stop the upload workers and the search pipeline's worker pools, then snapshot what was uploaded
+    await upload_queue.stop()
+    await asyncio.get_running_loop().run_in_executor(None, save_snapshot)
+    index_loading.cancel()
+    search_io_pool.shutdown(wait=False, cancel_futures=True)
+    search_cpu_pool.shutdown(wait=False, cancel_futures=True)
+    await http_session.close()
+    article_parse_pool.shutdown(wait=False, cancel_futures=True)
+
+# Set by the lifespan
+http_session = None
+
+# Article pages are parsed in separate processes: BeautifulSoup holds the GIL for the whole parse,
+# which in a thread would stall the event loop for every other request
+article_parse_pool = ProcessPoolExecutor(max_workers=article_parse_workers, mp_context=multiprocessing.get_context('spawn'))
 
 app = FastAPI(lifespan=lifespan)
-upload_lock = threading.Lock()
 
 
 ############################################################
 # GLOBAL VARIABLES & BM25 PARAMS
 ############################################################
 
-# Loading lexicon, processed data, scrapped data and lengths data
-lexicon = load_lexicon(lexicon_file)
-vocab = list(lexicon.keys())
-processed_dict = load_processed_to_dict(processed_file)
-scrapped_dict = load_scrapped_to_dict(scrapped_file)
-lengths_dict = load_lengths(lengths_file)
-
-# BM25 parameters
-k = 1.5
-b = 0.75
-N = len(processed_dict)
-WORD_IN_QUERY_VAR = 3
-INTERSECTION_VAR = 10
-TITLE_CONTAINS_QUERY_VAR = 100
-TITLE_VAR = 12
-AUTHOR_VAR = 6
-TAG_VAR = 8
-avgdl = sum(lengths_dict.values()) / N
-
-# Loading lemmatizer and intializing it (For some reason it takes too long to lemmatize the first time)
-lemmatizer = WordNetLemmatizer()
-preprocess_word('apple')
+# Set by load_index(): lexicon, document metadata, index generations (segments + delta) and the BM25 scorer
+lexicon = None
+doc_store = None
+processed_dict = None
+scrapped_dict = None
+lengths_dict = None
+index_generations = None
+delta_index = None
+N = None
+scorer = None
+avgdl = None
+
+# Sources a snapshot must have been taken from to be used
+snapshot_sources = {'lexicon': lexicon_file, 'processed': processed_file, 'scraped': scrapped_file, 'lengths': lengths_file}
+
+index_lock = threading.Lock()
+index_ready = threading.Event()
+
+# Loads everything searches need, once; callers arriving while it runs wait for it
+def load_index():
+    global lexicon, doc_store, processed_dict, scrapped_dict, lengths_dict, index_generations, delta_index, N, scorer, avgdl
+    if index_ready.is_set():
+        return
+    with index_lock:
+        if index_ready.is_set():
+            return
+        try:
+            # Vendored NLTK data only, unless offline boot is off and something is missing
+            with startup_report.stage("nltk resources"):
+                ensure_nltk_resources(offline=offline_boot)
+
+            # A snapshot taken from the current CSVs loads with a single mmap
+            snapshot = None
+            if snapshot_boot:
+                with startup_report.stage("snapshot"):
+                    snapshot = Snapshot.open_if_fresh(snapshot_file, snapshot_sources)
+                    if snapshot is not None:
+                        lexicon = snapshot.lexicon()
+                        doc_store = snapshot.doc_store()
+
+            if snapshot is None:
+                with startup_report.stage("lexicon"):
+                    lexicon = load_lexicon(lexicon_file)
+
+                # Document metadata is memory-mapped from the columnar store (built by build_doc_store.py if missing)
+                with startup_report.stage("document store"):
+                    doc_store = DocStore.open(doc_store_folder, processed_file, scrapped_file, lengths_file)
+            processed_dict = doc_store.processed_docs
+            scrapped_dict = doc_store.scraped_docs
+            lengths_dict = doc_store.doc_lengths
+
+            # Memory-mapping the posting segments once (compaction publishes remapped barrels as a new generation)
+            with startup_report.stage("posting segments"):
+                index_generations = IndexGenerations(SegmentIndex(inverted_index_folder, snapshot.meta['barrels'] if snapshot else None))
+
+            # Uploaded documents not compacted into the barrels yet
+            with startup_report.stage("delta index"):
+                delta_index = DeltaIndex(delta_log_file, inverted_index_folder, index_generations)
+                # New words are logged with their postings first: any a crash kept out of the lexicon file go in now
+                if save_word_ids(lexicon, delta_index.replayed_words):
+                    print("DEBUG: Restored new words from the delta log to the lexicon")
+                for word, word_id in delta_index.replayed_words.items():
+                    if word not in lexicon:
+                        lexicon[word] = word_id
+                delta_index.replayed_words.clear()
+
+            # BM25 scorer over a contiguous array of document lengths (parameters live in bm25.py)
+            with startup_report.stage("bm25 scorer"):
+                N = len(processed_dict)
+                scorer = BM25Scorer.from_length_array(doc_store.length_array(), N)
+                avgdl = scorer.avgdl
+
+            # Lemmas of the lexicon's words are precomputed (main.py), so queries rarely reach WordNet
+            with startup_report.stage("lemma table"):
+                get_analyzer().load_lemma_table(lemma_table_file)
+
+            # For some reason it takes too long to lemmatize the first time
+            with startup_report.stage("wordnet warmup"):
+                get_analyzer().wordnet_lemma('apple')
+        except Exception as e:
+            startup_report.mark_failed(e)
+            raise
+        index_ready.set()
+        startup_report.mark_ready()
+
+# Awaitable from the handlers: returns at once when the index is loaded
+async def wait_for_index():
+    if not index_ready.is_set():
+        await asyncio.get_running_loop().run_in_executor(None, load_index)
+
+# Decoded posting lists shared across requests, dropped per barrel when compaction rewrites it
+posting_cache = PostingCache(posting_cache_bytes)
+barrel_update_listeners.append(lambda folder, barrel, word_ids: posting_cache.invalidate_barrel(barrel))
 
 # Field size limit for CSV
 csv.field_size_limit(100_000_000)
@@ -97,95 +205,47 @@ app.add_middleware(
 ############################################################
 # SEARCH METHODS
 ############################################################
-def append_inverted_barrel_data(lexicon, inverted_index_folder, word, data_dict):
+def load_postings(word_id, segments):
+    # Binary segments are the primary format, CSV barrels are only read if not converted yet
+    postings = segments.postings(word_id)
+    if postings is None and not segments.has_barrel(word_id // barrel_size):
+        # Words added by uploads may live in a barrel that only exists once the delta is compacted
+        if not os.path.exists(f'{inverted_index_folder}/inverted_{word_id // barrel_size}.csv'):
+            return None
+        postings = read_csv_postings(inverted_index_folder, word_id)
+    return postings
+
+
+# I/O stage: postings of one query word in the generation the search pinned (None if it has none or could not be read)
+# Base postings are cached, recently uploaded documents are added on top from the delta index
+def fetch_postings(word, generation):
     try:
         word_id = lexicon[word]
-        barrel = word_id // 1001
-        if word_id >= 1001:
-            position = word_id % 1001 + 1
-        else:
-            position = word_id % 1001
-        print(f"Processing word: {word}")
-
-        with open(f'{inverted_index_folder}/inverted_{barrel}.bin', 'rb') as file:
-            file.seek(8 * position)
-            data = file.read(16)
-            position = struct.unpack('Q', data[:8])[0]
-            next_position = struct.unpack('Q', data[8:])[0]
-
-        with open(f'{inverted_index_folder}/inverted_{barrel}.csv', 'rb') as file:
-            file.seek(position)
-            content = file.read(next_position - position).decode()
-            
-        csv_reader = csv.reader([content])  # Treat line as a single CSV row
-        for row in csv_reader:
-            word_id = int(row[0])  # First column is the word ID
-            doc_ids = json.loads(row[1])  # Second column: Document IDs (JSON array)
-            frequencies = json.loads(row[2])  # Third column: Frequencies
-            positions = json.loads(row[3])  # Fourth column: Positions
-            types = re.sub("'", '"', row[4])
-            types = json.loads(types)  # Fifth column: Types (title, tags, etc.)
-            
-            data_dict[word_id] = {
-                'doc_ids': doc_ids,
-                'frequencies': frequencies,
-                'positions': positions,
-                'types': types
-            }
     except KeyError:
         print(f'Word {word} not in Lexicon')
+        return None
+    print(f"Processing word: {word}")
+    try:
+        segments = generation.segments
+        base = posting_cache.get_or_load(word_id, lambda word_id: load_postings(word_id, segments),
+                                         segments.version(word_id // barrel_size))
     except Exception as e:
         print(f'Error processing word {word}: {e}')
+        base = None
+    return generation.delta.merge(base, word_id)
 
 
-def calculate_bm25_scores(item, results_list, query_word_ids, intersection):
-    word_id, data = item
-    doc_ids = data['doc_ids']
-    frequencies = data['frequencies']
-    sources = data['types']
-    
-    # Calculate IDF
-    n = len(doc_ids)  # Number of documents containing the term
-    IDF = math.log10((N - n + 0.5) / (n + 0.5))
-    
-    # Calculate BM25 scores for each document
-    for doc_id, frequency, source in zip(doc_ids, frequencies, sources):
-        length = lengths_dict[doc_id]  # Length of the document
-        TF = frequency / (frequency + k * (1 - b + b * length / avgdl))
-        score = TF * IDF * 100
-        
-        if doc_id in intersection:
-            score *= INTERSECTION_VAR
-        
-        if word_id in query_word_ids:
-            score *= WORD_IN_QUERY_VAR
-        
-        if "T" in source: 
-            score *= TITLE_VAR
-        if "A" in source:
-            score *= AUTHOR_VAR
-        if "Ta" in source:
-            score *= TAG_VAR
-        
-        results_list.append((score, doc_id))
-
-def find_intersection(inverted_data, query_word_ids):    
-    if not query_word_ids:
-        return set()  # Return an empty set if no valid word IDs are found
-
-    # Find the intersection of document IDs
-    for word_id in query_word_ids:
-        if word_id in inverted_data:
-            doc_ids = set(inverted_data[word_id]['doc_ids'])
-            break
+# CPU stage: rank the fetched postings and build the result rows
+def rank_postings(inverted_data, query_word_ids, mode):
+    if mode == "blockmax":
+        sorted_list, pruning_stats = scorer.top_k_pruned(inverted_data, query_word_ids, TOP_K)
+        print(f"Block-max pruning scored {pruning_stats['scored']} postings and skipped {pruning_stats['skipped']}")
     else:
-        return set()
-    
-    for word_id in query_word_ids:
-        if word_id in inverted_data:
-            doc_ids &= set(inverted_data[word_id]['doc_ids'])
-    
-    return doc_ids
+        accumulator = scorer.score(inverted_data, query_word_ids)
+        sorted_list = scorer.top_k(accumulator, TOP_K)
+    results = []
+    make_results(sorted_list, results)
+    return results
 
 
 def make_results(sorted_list, results):
@@ -196,30 +256,27 @@ def make_results(sorted_list, results):
             continue  # Skip duplicate entries
         processed_doc_ids.add(doc_ids)
         
-        processed_data = processed_dict[doc_ids]
-        
         description = "No description available"
         thumbnail = "No thumbnail available"
         member = "No"
         
-        try:
-            description = scrapped_dict[int(doc_ids)]['description']
-            thumbnail = scrapped_dict[int(doc_ids)]['url']
-            member = scrapped_dict[int(doc_ids)]['member only']
+        # Fields are read from the document store's columns, checking the member flag before anything else
+        if doc_store.contains('scraped', doc_ids):
+            member = doc_store.field(doc_ids, 'member')
             if member == "Unknown":
                 continue
-        except (Exception):
-            pass
+            description = doc_store.field(doc_ids, 'description')
+            thumbnail = doc_store.field(doc_ids, 'thumbnail')
         
         results.append({
             "id": doc_ids,
-            "title": processed_data['title'],
+            "title": doc_store.field(doc_ids, 'title'),
             "description": description,
             "thumbnail": thumbnail,
-            "url": processed_data['url'],
-            "tags": processed_data['tags'],
-            "authors": processed_data['authors'],
-            "date": processed_data['timestamp'],
+            "url": doc_store.field(doc_ids, 'url'),
+            "tags": doc_store.field(doc_ids, 'tags'),
+            "authors": doc_store.field(doc_ids, 'authors'),
+            "date": doc_store.field(doc_ids, 'timestamp'),
             "member" : member
         })
         
@@ -227,157 +284,198 @@ def make_results(sorted_list, results):
         if counter >= 100:
             break
 
-def get_top_100_results(score_docid_list):
-    return nlargest(150, score_docid_list, key=lambda x: x[0])
-
-
 ############################################################
 # SEARCH APIs
 ############################################################
 
-query_cache = QueryCache()
+# Full top results per normalized query, plus the latest query for /summarize
+query_cache = QueryResultCache(query_cache_entries, query_cache_ttl)
+barrel_update_listeners.append(lambda folder, barrel, word_ids: query_cache.invalidate_words(word_ids))
+
+# Identical searches (and Gemini calls) in flight at the same time share one computation
+search_flight = AsyncSingleFlight()
+summary_flight = AsyncSingleFlight()
+summary_cache = SummaryCache(summary_cache_file, summary_cache_bytes, summary_cache_ttl)
+
+# A stored summary, or compute() once for every caller asking at the same time and store its result
+async def cached_summary(key, compute):
+    summary = summary_cache.get(key)
+    if summary is not None:
+        return summary
+
+    async def compute_and_store():
+        summary = await compute()
+        await asyncio.get_running_loop().run_in_executor(None, summary_cache.put, key, summary)
+        return summary
+    return await summary_flight.do(key, compute_and_store)
+
+# Search pipeline: fixed pools for posting reads and for scoring, and a cap on queries being computed at once
+search_io_pool = ThreadPoolExecutor(max_workers=search_io_workers, thread_name_prefix="search-io")
+search_cpu_pool = ThreadPoolExecutor(max_workers=search_cpu_workers, thread_name_prefix="search-cpu")
+search_slots = asyncio.Semaphore(max_concurrent_searches)
 
 # Search API
+# Retrieval modes selectable with ?mode=..., so block-max pruning can be A/B tested against the full scan
+SEARCH_MODES = ("exhaustive", "blockmax")
+
 @app.post("/search", response_model=SearchResult)
-def search_documents(request: QueryRequest):
+async def search_documents(request: QueryRequest, mode: str = "exhaustive"):
     a = t.time()
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown search mode '{mode}', expected one of {SEARCH_MODES}")
+    await wait_for_index()
     
     # Store original query and mark as processing
     original_query = request.query  # Store unprocessed query
     query_cache.set_processing(original_query)
     
-    query = request.query.lower()
-    results = []
-    bm25_scores = []
-    inverted_data = {}
-    results_list = []
-    query = word_tokenize(query)
-    query = list(set(query))
-    query = query[:10]
-    query = [preprocess_word(word) for word in query if preprocess_word(word) in lexicon]  # Preprocess each word in the query
-    query_word_ids = [lexicon[word] for word in query if word in lexicon]
+    # First 10 distinct words, lemmatized by the same analyzer as the index and kept if in the lexicon
+    query = get_analyzer().query_terms(request.query, lexicon)
+    query_word_ids = [lexicon[word] for word in query]
+    page = slice(request.offset, request.offset + request.limit)
    
     if not query:
         # Even for empty results, update cache
         query_cache.update_cache(original_query, [])
         return {"results": [], "count": 0, "time": t.time() - a}
-   
-    top_words_list = query
-   
-    threads = []
-    for word in top_words_list:
-        thread = threading.Thread(target=append_inverted_barrel_data, args=(lexicon, inverted_index_folder, word, inverted_data))
-        threads.append(thread)
-        thread.start()
-   
-    # Wait for all threads to complete
-    for thread in threads:
-        thread.join()
-    intersection = find_intersection(inverted_data, query_word_ids)
-   
-    bm25_threads = []
-    for item in inverted_data.items():
-        thread = threading.Thread(target=calculate_bm25_scores, args=(item, results_list, query_word_ids, intersection))
-        bm25_threads.append(thread)
-        thread.start()
-    # Wait for all BM25 threads to complete
-    for thread in bm25_threads:
-        thread.join()
-    sorted_list = get_top_100_results(results_list)
-    make_results(sorted_list, results)
-    total_results = sum(len(data['doc_ids']) for data in inverted_data.values())
-    
-    # Update cache with results
+
+    # Repeated (or paginated) queries are served from the result cache
+    cache_key = query_cache.make_key(query_word_ids, mode)
+    cached = query_cache.get(cache_key)
+    if cached is not None:
+        query_cache.update_cache(original_query, cached.results)
+        print(f"Displaying cached results for {query} in {t.time() - a} seconds.")
+        return {"results": cached.results[page], "count": cached.count, "time": t.time() - a}
+
+    # Concurrent misses for the same query wait on one computation instead of repeating it
+    results, total_results = await search_flight.do(cache_key, lambda: run_query(query, query_word_ids, mode, cache_key))
     query_cache.update_cache(original_query, results)
     
-    print(f"Displaying {len(results)} of {sum(len(data['doc_ids']) for data in inverted_data.values())} results in {t.time() - a} seconds.")
+    print(f"Displaying {len(results)} of {total_results} results in {t.time() - a} seconds.")
    
-    return {"results": results, "count": total_results, "time": t.time() - a}
+    return {"results": results[page], "count": total_results, "time": t.time() - a}
+
+# Fetch postings on the I/O pool, rank them on the CPU pool and store the results in the query cache
+async def run_query(query, query_word_ids, mode, cache_key):
+    async with search_slots:
+        loop = asyncio.get_running_loop()
+        generation = query_cache.generation
+
+        # Every word is read from the same index generation, whatever uploads or compaction publish meanwhile
+        with index_generations.pin() as index_generation:
+            postings = await asyncio.gather(*[loop.run_in_executor(search_io_pool, fetch_postings, word, index_generation) for word in query])
+            inverted_data = {lexicon[word]: word_postings for word, word_postings in zip(query, postings) if word_postings is not None}
+
+            results = await loop.run_in_executor(search_cpu_pool, rank_postings, inverted_data, query_word_ids, mode)
+        total_results = sum(len(word_postings) for word_postings in inverted_data.values())
+
+    # Update cache with results
+    query_cache.put(cache_key, results, total_results, generation)
+    return results, total_results
 
 
 ############################################################
 # UPLOAD APIS
 ############################################################
 
-# Shared upload status dictionary
-upload_status = {
-    "is_uploading": False,
-    "current_step": None,
-    "progress": 0,
-    "error": None,
-    "success": False,
-}
-
-def update_status(step=None, progress=None, error=None, success=None, is_uploading=None):
-    if step is not None:
-        upload_status["current_step"] = step
-    if progress is not None:
-        upload_status["progress"] = progress
-    if error is not None:
-        upload_status["error"] = error
-    if success is not None:
-        upload_status["success"] = success
-    if is_uploading is not None:
-        upload_status["is_uploading"] = is_uploading
-
-
-def threaded_upload(url):
+# Merge the delta index into the base barrels (in the background, once enough uploads piled up)
+def compact_delta():
     try:
-        update_status(is_uploading=True, step="Starting upload...", progress=5, error=None, success=False)
-
-        from medium_scraper import scrape_and_add_article
-        from update_barrels import add_scraped_article_to_index
+        delta_index.compact(lambda barrel, word_ids: notify_barrel_updated(inverted_index_folder, barrel, word_ids))
+        save_snapshot()
+    except Exception as e:
+        print(f"DEBUG: Delta compaction failed (the delta stays searchable and is retried later): {e}")
+
+# A single background compaction at a time: commits made while one is scheduled or running start none
+compaction_state_lock = threading.Lock()
+compaction_scheduled = False
+
+def schedule_compaction():
+    global compaction_scheduled
+    with compaction_state_lock:
+        if compaction_scheduled:
+            return
+        compaction_scheduled = True
+    threading.Thread(target=compaction_worker, daemon=True).start()
+
+def compaction_worker():
+    global compaction_scheduled
+    try:
+        compact_delta()
+    finally:
+        with compaction_state_lock:
+            compaction_scheduled = False
+
+# Retake the startup snapshot from the loaded lexicon and document store, after a compaction and at shutdown
+# (never per upload commit). It is captured under the commit lock, so it matches the CSVs it records, and
+# written after; if this fails, or uploads came after it, the next boot reads the CSVs instead
+def save_snapshot():
+    if not index_ready.is_set():
+        return
+    try:
+        with upload_commit_lock:
+            sections = capture_snapshot(snapshot_sources, lexicon, doc_store, sorted(index_generations.current.segments.segments))
+        write_captured_snapshot(snapshot_file, sections)
+    except Exception as e:
+        print(f"DEBUG: Failed to write snapshot: {e}")
 
-        latest_doc_id = 0
-        doc_id_file = "indexes/latest_doc_id.txt"
-        if os.path.exists(doc_id_file):
-            with open(doc_id_file, 'r') as f:
-                latest_doc_id = int(f.read().strip())
+# Commit one batch of scraped articles: metadata rows, delta postings, scorer and caches
+upload_commit_lock = threading.Lock()
 
-        update_status(step="Extracting article content...", progress=25)
-        result = scrape_and_add_article(
-            url, processed_dict, scrapped_dict, lengths_dict, latest_doc_id,
+def commit_uploads(articles):
+    load_index()
+    with upload_commit_lock:
+        results = add_scraped_articles(
+            articles, processed_dict, scrapped_dict, lengths_dict, load_latest_doc_id(),
             processed_file, scrapped_file, lengths_file, doc_id_file
         )
-
-        if result['success']:
-            update_status(step="Indexing article... This may take a few minutes", progress=70)
-            stop_words = set(stopwords.words('english'))
-            add_scraped_article_to_index(
-                result['data'], result['doc_id'], lexicon, inverted_index_folder, stop_words
+        for result in results:
+            if not result['success']:
+                continue
+            word_ids = add_scraped_article_to_index(
+                result['data'], result['doc_id'], lexicon, delta_index, get_analyzer()
             )
-            update_status(step="Completed", progress=100, success=True)
-        else:
-            update_status(step="Failed during scraping", error=result['message'], success=False)
+            scorer.add_document(result['doc_id'], lengths_dict[result['doc_id']])
+            query_cache.invalidate_words(word_ids)
+        if any(result['success'] for result in results):
+            if delta_index.document_count >= delta_compact_docs:
+                schedule_compaction()
+    print(f"DEBUG: Committed {sum(result['success'] for result in results)} of {len(articles)} uploaded articles")
+    return results
 
-    except Exception as e:
-        update_status(step="Error occurred", error=str(e), success=False)
+# Scraping an uploaded URL: fetched over the pooled session, parsed in the article parse processes
+async def scrape_upload(url):
+    return await scrape_article_for_upload_async(url, http_session, article_parse_pool)
 
-    finally:
-        upload_lock.release()
-        update_status(is_uploading=False)
+# Persistent upload jobs: URLs are scraped by a pool of workers and committed in batches
+upload_queue = UploadQueue(upload_jobs_file, scrape_upload, commit_uploads,
+                           upload_workers, upload_batch_size, upload_batch_wait, upload_job_retention)
 
 
 @app.post("/upload-url")
 async def upload_url(request: UrlRequest):
-    url = request.url
-
-    # Try to acquire the lock for upload
-    if not upload_lock.acquire(blocking=False):
-        raise HTTPException(status_code=400, detail="A process is already running. Please try again later.")
+    job = upload_queue.submit([request.url])
+    return JSONResponse(content={"message": "Upload started in background. You can continue searching.", "job_id": job.id})
 
-    # Reset status for new upload
-    update_status(is_uploading=True, step="Queued for upload...", progress=0, error=None, success=False)
 
-    # Start the upload in a separate thread
-    thread = threading.Thread(target=threaded_upload, args=(url,))
-    thread.start()
-    return JSONResponse(content={"message": "Upload started in background. You can continue searching."})
+# Bulk upload: one job for all the URLs, progress under /upload-status?job_id=...
+@app.post("/upload-urls")
+async def upload_urls(request: UrlsRequest):
+    if not request.urls:
+        raise HTTPException(status_code=400, detail="No URLs given")
+    job = upload_queue.submit(request.urls)
+    return JSONResponse(content={"message": f"{len(job.urls)} URLs queued for upload.", "job_id": job.id})
 
 
+# Status of a job (the latest one by default, which is what the upload box polls)
 @app.get("/upload-status")
-async def upload_status_endpoint():
-    return JSONResponse(content=upload_status)
+async def upload_status_endpoint(job_id: str = None):
+    job = upload_queue.job(job_id) if job_id else upload_queue.latest
+    if job is None:
+        if job_id:
+            raise HTTPException(status_code=404, detail=f"Unknown upload job '{job_id}'")
+        return JSONResponse(content={"is_uploading": False, "current_step": None, "progress": 0, "error": None, "success": False})
+    return JSONResponse(content=job.status(with_items=job_id is not None))
 
 
 
@@ -391,7 +489,7 @@ gemini_rag = None
 def initialize_gemini_rag(api_key: str, model_name: str = "gemini-1.5-flash"):
     """Initialize the Gemini RAG module - call this at startup"""
     global gemini_rag
-    gemini_rag = GeminiRAGModule(api_key, model_name)
+    gemini_rag = GeminiRAGModule(api_key, model_name, session=http_session)
     print("DEBUG: Gemini RAG module initialized")
 
 def convert_search_results_to_rag_format(search_results: List[Dict]) -> List[Dict]:
@@ -515,10 +613,18 @@ async def summarize_results(request: SummarizeRequest):
 
 @app.post("/summarize-article")
 async def summarize_article(request: SummarizeArticleRequest):
-    # Scrape the article
-    article_data = scrape_medium_article(request.url)
+    if gemini_rag is None:
+        raise HTTPException(status_code=500, detail="Gemini RAG module not initialized. Please configure the summarization service.")
+    # Articles summarized before are served from the summary cache; several readers opening the same
+    # new article share one scrape and one Gemini call
+    key = summary_cache.make_key("article", None, canonical_url(request.url), request.summary_length, gemini_rag.model_name)
+    return await cached_summary(key, lambda: summarize_article_once(request))
+
+async def summarize_article_once(request: SummarizeArticleRequest):
+    # Scrape the article (async, so other requests keep being served meanwhile)
+    article_data = await scrape_medium_article_async(request.url, http_session, article_parse_pool)
     if not article_data or "error" in article_data or not article_data.get("title"):
-        raise HTTPException(status_code=400, detail=f"Failed to scrape article: {article_data.get('error', 'No title found')}")
+        raise HTTPException(status_code=400, detail=f"Failed to scrape article: {(article_data or {}).get('error', 'No title found')}")
     
     # Prepare context for Gemini
     context = f"Title: {article_data['title']}\n\n{article_data['text']}\n\nDescription: {article_data.get('description', '')}"
@@ -562,8 +668,9 @@ async def generate_summary_with_gemini(query: str, search_results: List[Dict], s
         context = "\n\n".join(context_parts)
         print(f"DEBUG: Prepared context length: {len(context)} characters")
         
-        # Generate summary using Gemini
-        summary = await gemini_rag.generate_summary(query, context, summary_length)
+        # Generate summary using Gemini, unless this query over these documents was summarized before
+        key = summary_cache.make_key("results", query, [result['doc_id'] for result in search_results], summary_length, gemini_rag.model_name)
+        summary = await cached_summary(key, lambda: gemini_rag.generate_summary(query, context, summary_length))
         
         # Prepare sources
         sources = [
@@ -604,12 +711,34 @@ def get_search_status():
         "gemini_rag_initialized": gemini_rag is not None
     }
 
+# Readiness: 200 once the index is loaded and searches can be served, 503 while booting
+@app.get("/ready")
+def readiness():
+    report = startup_report.as_dict()
+    return JSONResponse(status_code=200 if report['ready'] else 503, content=report)
+
+# Hit/miss/eviction counters of the in-process caches
+@app.get("/cache/stats")
+def get_cache_stats():
+    return {
+        "postings": posting_cache.stats(),
+        "queries": query_cache.stats(),
+        "analyzer": get_analyzer().memo_stats(),
+        "uploads": upload_queue.stats(),
+        "http": get_http_cache().stats(),
+        "generations": index_generations.stats() if index_generations else None,
+        "coalescing": {
+            "search": search_flight.stats(),
+            "summaries": summary_flight.stats()
+        },
+        "summaries": summary_cache.stats()
+    }
+
 # Optional: Clear cache endpoint
 @app.post("/search/clear-cache")
 def clear_search_cache():
     """Clear the search cache"""
-    global query_cache
-    query_cache = QueryCache()
+    query_cache.clear()
     return {"message": "Search cache cleared successfully"}
 
 # Setup function for Gemini
@@ -0,0 +1,92 @@
+# Crawler benchmark against a local stand-in for Medium: a server that allows `limit` requests per second
+# per host and answers 429 with a Retry-After beyond that
+# Usage: python benchmark_crawler.py [articles] [limit per second]
+import sys
+import asyncio
+import time as t
+from aiohttp import web
+from bs4 import BeautifulSoup
+from crawler import Crawler
+from scrape import article_row, read_metadata
+from page_meta import extract_metadata
+
+# A Medium-sized page; a third say in the head whether they are free, a third show the member-only marker
+HEAD = ('<html><head><meta name="description" content="Article {id}">'
+        '<meta property="og:image" content="https://example.com/{id}.png"><style>' + 'a{{color:red}}' * 2000 + '</style>{schema}</head>')
+BODY = '<body><div><span>{marker}</span></div><article>' + '<p>Lorem ipsum dolor sit amet, consectetur adipiscing.</p>' * 4000 + '</article></body></html>'
+
+def page(article_id):
+    kind = int(article_id) % 3
+    schema = '<script type="application/ld+json">{"isAccessibleForFree": true}</script>' if kind == 0 else ''
+    return HEAD.format(id=article_id, schema=schema) + BODY.format(marker='Member-only story' if kind == 1 else '')
+
+
+# Server answering /p/{id} with page(id), and 429 with a Retry-After past `limit` requests per second per host
+def stand_in_app(limit):
+    windows = {}  # host -> (second, requests in it)
+    served = {'ok': 0, 'throttled': 0}
+
+    async def article(request):
+        second = int(t.monotonic())
+        window, count = windows.get(request.host, (second, 0))
+        if window != second:
+            window, count = second, 0
+        windows[request.host] = (window, count + 1)
+        if count >= limit:
+            served['throttled'] += 1
+            return web.Response(status=429, headers={'Retry-After': '1'})
+        served['ok'] += 1
+        return web.Response(text=page(request.match_info['id']), content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/p/{id}', article)
+    return app, served
+
+
+async def main(articles, limit):
+    app, served = stand_in_app(limit)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    # Two host names for the same server, so each gets its own bucket
+    jobs = [(str(i), f'http://{"localhost" if i % 2 else "127.0.0.1"}:{port}/p/{i}') for i in range(articles)]
+    transfer = {'bytes': 0, 'cpu': 0.0}
+    def handle(key, url, status, metadata):
+        if metadata is not None:
+            transfer['bytes'] += metadata['bytes']
+            transfer['cpu'] += metadata['cpu']
+        return article_row(key, url, status, metadata)
+
+    crawler = Crawler(read=read_metadata)
+    a = t.perf_counter()
+    rows = await crawler.crawl(jobs, handle)
+    elapsed = t.perf_counter() - a
+    await runner.cleanup()
+
+    ok = sum(1 for row in rows.values() if row[4] == 200)
+    print(f"{ok} of {articles} articles in {elapsed:.1f}s: {articles / elapsed:.1f}/s against a limit of {2 * limit:.0f}/s over 2 hosts")
+    print(f"Server answered {served['ok']} pages and {served['throttled']} 429s")
+    for host, stats in crawler.stats()['hosts'].items():
+        print(f"  {host}: settled at {stats['rate']}/s, {stats['throttled']} throttled of {stats['requests']} requests")
+
+    # Streaming extraction against parsing the whole page with BeautifulSoup
+    page_bytes = sum(len(page(key).encode('utf-8')) for key, _ in jobs) / articles
+    print(f"Streamed {transfer['bytes'] / articles / 1024:.1f} KB of {page_bytes / 1024:.1f} KB per page, "
+          f"{transfer['cpu'] / articles * 1000:.2f} ms CPU per article")
+    pages = [page(str(i)) for i in range(3)]
+    a = t.process_time()
+    for html in pages:
+        BeautifulSoup(html, 'html.parser')
+    print(f"Full BeautifulSoup parse: {(t.process_time() - a) / len(pages) * 1000:.2f} ms CPU per article")
+    for i, html in enumerate(pages):
+        metadata = extract_metadata([html.encode('utf-8')[j:j + 16384] for j in range(0, len(html.encode('utf-8')), 16384)])
+        print(f"  page kind {i}: member only {metadata['member_only']}, read {metadata['bytes'] // 1024} KB")
+
+
+if __name__ == "__main__":
+    articles = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    limit = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    asyncio.run(main(articles, limit))
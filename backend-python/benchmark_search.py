@@ -0,0 +1,48 @@
+# A/B benchmark of the search modes: latency and top-k overlap of block-max pruning vs the full scan
+# Usage: python benchmark_search.py "query one" "query two" ...   (defaults to a few common queries)
+import sys
+import io
+import contextlib
+import time as t
+import asyncio
+import numpy as np
+import backend
+from backend import search_documents, run_query, query_cache, SEARCH_MODES
+from classes import QueryRequest
+from analyzer import get_analyzer
+
+queries = sys.argv[1:] or ["python", "data science", "machine learning python", "javascript react tutorial", "how to learn programming"]
+repeats = 5
+
+latencies = {mode: [] for mode in SEARCH_MODES}
+overlaps = []
+
+async def run_benchmark():
+    for query in queries:
+        ranked = {}
+        for mode in SEARCH_MODES:
+            with contextlib.redirect_stdout(io.StringIO()):  # Keep the per-word debug output out of the report
+                response = await search_documents(QueryRequest(query=query), mode=mode)
+            ranked[mode] = [result['id'] for result in response['results']]
+
+            # Time the ranking itself: the result cache would answer every repeat of /search
+            terms = get_analyzer().query_terms(query, backend.lexicon)
+            word_ids = [backend.lexicon[word] for word in terms]
+            for _ in range(repeats):
+                a = t.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    await run_query(terms, word_ids, mode, query_cache.make_key(word_ids, mode))
+                latencies[mode].append(t.perf_counter() - a)
+
+        reference = ranked["exhaustive"]
+        overlap = len(set(reference) & set(ranked["blockmax"])) / len(reference) if reference else 1.0
+        overlaps.append(overlap)
+        print(f"{query!r}: overlap@{len(reference)} = {overlap:.3f}, identical order = {reference == ranked['blockmax']}")
+
+asyncio.run(run_benchmark())
+
+print()
+for mode, values in latencies.items():
+    values = np.array(values) * 1000
+    print(f"{mode:>10}: p50 {np.percentile(values, 50):.2f} ms, p95 {np.percentile(values, 95):.2f} ms, mean {values.mean():.2f} ms")
+print(f"Mean overlap: {np.mean(overlaps):.3f}")
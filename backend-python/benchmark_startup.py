@@ -0,0 +1,34 @@
+# Cold-start benchmark: boots the index in fresh interpreters, from the snapshot and from the CSV fallback path
+# Usage: python benchmark_startup.py [runs]   (write the snapshot first with python build_snapshot.py)
+import sys
+import os
+import json
+import subprocess
+import time as t
+import numpy as np
+from config import snapshot_file
+
+runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+boot = "import json, backend; backend.load_index(); print('STARTUP ' + json.dumps(backend.startup_report.as_dict()))"
+
+if not os.path.exists(snapshot_file):
+    sys.exit(f"No snapshot at {snapshot_file}, run python build_snapshot.py first")
+
+for label, snapshot_boot in (("snapshot", "1"), ("csv", "0")):
+    walls = []
+    stages = {}
+    for _ in range(runs):
+        a = t.perf_counter()
+        output = subprocess.run([sys.executable, "-c", boot], env={**os.environ, "SNAPSHOT_BOOT": snapshot_boot},
+                                capture_output=True, text=True, check=True).stdout
+        walls.append(t.perf_counter() - a)
+        report = json.loads(next(line for line in output.splitlines() if line.startswith("STARTUP "))[len("STARTUP "):])
+        for name, seconds in report["stages"].items():
+            stages.setdefault(name, []).append(seconds)
+
+    walls = np.array(walls) * 1000
+    print(f"{label}: process p50 {np.percentile(walls, 50):.1f} ms, min {walls.min():.1f} ms over {runs} runs")
+    for name, values in stages.items():
+        print(f"  {name:<20} {np.mean(values) * 1000:8.1f} ms")
+
+print("(Page cache stays warm between runs; the first run after a reboot is the truly cold one)")
@@ -0,0 +1,124 @@
+# Load test for /summarize-article: how long a cheap endpoint (/upload-status) takes to answer, polled every
+# 20 ms, with and without article summaries in flight. Articles and Gemini are served by a local stand-in
+# (each answering after a delay), and the backend runs in its own uvicorn process. The same articles are then
+# asked for again, which the summary cache answers without scraping or calling Gemini.
+# Usage: python benchmark_summaries.py [concurrent summaries] [rounds]
+import sys
+import os
+import socket
+import asyncio
+import subprocess
+import tempfile
+import time as t
+import numpy as np
+import aiohttp
+from aiohttp import web
+
+concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+ARTICLE = ('<html><head><title>Stand-in article {id}</title><meta name="description" content="Article {id}"></head><body><article>'
+           '<h1>Stand-in article {id}</h1>' + '<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>' * 3000 + '</article></body></html>')
+
+
+def stand_in_app():
+    async def article(request):
+        await asyncio.sleep(0.3)
+        return web.Response(text=ARTICLE.format(id=request.match_info['id']), content_type='text/html')
+
+    async def gemini(request):
+        await asyncio.sleep(0.5)
+        return web.json_response({'candidates': [{'content': {'parts': [{'text': 'A stand-in summary.'}]}}]})
+
+    app = web.Application()
+    app.router.add_get('/article/{id}', article)
+    app.router.add_post('/models/{model}', gemini)
+    return app
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def probe(session, backend_url, stop, latencies):
+    while not stop.is_set():
+        a = t.perf_counter()
+        async with session.get(f'{backend_url}/upload-status') as response:
+            await response.read()
+        latencies.append((t.perf_counter() - a) * 1000)
+        await asyncio.sleep(0.02)
+
+
+async def measure(session, backend_url, load=None):
+    stop = asyncio.Event()
+    latencies = []
+    prober = asyncio.create_task(probe(session, backend_url, stop, latencies))
+    a = t.perf_counter()
+    result = await load() if load else await asyncio.sleep(2)
+    elapsed = t.perf_counter() - a
+    stop.set()
+    await prober
+    latencies = np.array(latencies)
+    print(f"  /upload-status p50 {np.percentile(latencies, 50):.1f} ms, p95 {np.percentile(latencies, 95):.1f} ms, "
+          f"max {latencies.max():.1f} ms over {len(latencies)} polls")
+    return result, elapsed
+
+
+async def main():
+    runner = web.AppRunner(stand_in_app())
+    await runner.setup()
+    stand_in_port = free_port()
+    await web.TCPSite(runner, '127.0.0.1', stand_in_port).start()
+    stand_in_url = f'http://127.0.0.1:{stand_in_port}'
+
+    backend_port = free_port()
+    backend_url = f'http://127.0.0.1:{backend_port}'
+    env = {**os.environ, 'GEMINI_API_KEY': 'stand-in', 'GEMINI_BASE_URL': f'{stand_in_url}/models',
+           'HTTP_CACHE_FOLDER': tempfile.mkdtemp(prefix='http_cache_'), 'HTTP_CACHE_OFFLINE': '0',
+           'SUMMARY_CACHE_FILE': os.path.join(tempfile.mkdtemp(prefix='summary_cache_'), 'summary_cache.log')}
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'backend:app', '--port', str(backend_port), '--log-level', 'warning'],
+                              env=env, stdout=subprocess.DEVNULL)
+    try:
+        async with aiohttp.ClientSession() as session:
+            for _ in range(300):
+                try:
+                    async with session.get(f'{backend_url}/upload-status') as response:
+                        if response.status == 200:
+                            break
+                except aiohttp.ClientError:
+                    await asyncio.sleep(0.1)
+
+            print("Idle:")
+            await measure(session, backend_url)
+
+            async def summaries():
+                statuses = []
+                for round_number in range(rounds):
+                    requests = [session.post(f'{backend_url}/summarize-article',
+                                             json={'url': f'{stand_in_url}/article/{round_number}-{i}', 'summary_length': 'short'})
+                                for i in range(concurrency)]
+                    for response in await asyncio.gather(*requests):
+                        statuses.append(response.status)
+                        response.release()
+                return statuses
+
+            print(f"{rounds} rounds of {concurrency} concurrent /summarize-article calls:")
+            statuses, elapsed = await measure(session, backend_url, summaries)
+            print(f"  {statuses.count(200)} of {len(statuses)} summaries succeeded in {elapsed:.1f}s "
+                  f"({len(statuses) / elapsed:.1f}/s; each waits 0.3 s for the article and 0.5 s for Gemini)")
+
+            print("The same articles again:")
+            statuses, elapsed = await measure(session, backend_url, summaries)
+            print(f"  {statuses.count(200)} of {len(statuses)} summaries succeeded in {elapsed:.2f}s")
+            async with session.get(f'{backend_url}/cache/stats') as response:
+                stats = (await response.json())['summaries']
+            print(f"  Summary cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%}), {stats['entries']} entries")
+    finally:
+        server.terminate()
+        server.wait()
+        await runner.cleanup()
+
+
+asyncio.run(main())
@@ -0,0 +1,238 @@
+import math
+import numpy as np
+from segments import TITLE_BIT, AUTHOR_BIT, TAG_BIT, BLOCK_SIZE
+
+# BM25 parameters
+k = 1.5
+b = 0.75
+WORD_IN_QUERY_VAR = 3
+INTERSECTION_VAR = 10
+TITLE_CONTAINS_QUERY_VAR = 100
+TITLE_VAR = 12
+AUTHOR_VAR = 6
+TAG_VAR = 8
+
+# Number of (score, doc id) pairs handed to make_results
+TOP_K = 150
+
+# Largest field boost any posting with a given mask can receive (indexed by field mask)
+FIELD_BOOST_BOUNDS = np.array([
+    (TITLE_VAR if mask & TITLE_BIT else 1) * (AUTHOR_VAR if mask & AUTHOR_BIT else 1) * (TAG_VAR if mask & TAG_BIT else 1)
+    for mask in range(256)
+], dtype=np.float64)
+
+# Bounds are inflated slightly so float rounding can never make them undercut a real score
+BOUND_SLACK = 1 + 1e-6
+
+
+class BM25Scorer:
+    """
+    Vectorized BM25 over decoded posting lists.
+
+    Document lengths live in one contiguous array indexed by doc id. A document's score
+    is its best single-term score (boosted by INTERSECTION_VAR when it contains every
+    query term), which is the ranking the per-posting loop used to produce.
+    """
+
+    def __init__(self, lengths, N, avgdl):
+        self.lengths = lengths
+        self.N = N
+        self.avgdl = avgdl
+
+    # `lengths` indexed by doc id, 0 where a document has no length
+    @classmethod
+    def from_length_array(cls, lengths, N):
+        avgdl = int(lengths.sum()) / N
+        return cls(lengths.astype(np.float32), N, avgdl)
+
+    @property
+    def num_docs(self):
+        return len(self.lengths)
+
+    # Register an uploaded document (corpus statistics stay fixed until restart)
+    def add_document(self, doc_id, length):
+        if doc_id >= len(self.lengths):
+            grown = np.zeros(max(doc_id + 1, 2 * len(self.lengths)), dtype=np.float32)
+            grown[:len(self.lengths)] = self.lengths
+            self.lengths = grown
+        self.lengths[doc_id] = length
+
+    def idf(self, n):
+        return math.log10((self.N - n + 0.5) / (n + 0.5))
+
+    # Lengths of the given documents; ids uploaded after the array was sized count as average length
+    def lengths_of(self, doc_ids):
+        if len(doc_ids) and doc_ids[-1] >= len(self.lengths):
+            lengths = np.full(len(doc_ids), self.avgdl, dtype=np.float64)
+            known = doc_ids < len(self.lengths)
+            lengths[known] = self.lengths[doc_ids[known]]
+            return lengths
+        return self.lengths[doc_ids]
+
+    # Doc ids present in every query term's postings
+    def intersection(self, inverted_data, query_word_ids):
+        doc_ids = None
+        for word_id in query_word_ids:
+            if word_id in inverted_data:
+                postings = inverted_data[word_id].doc_ids
+                doc_ids = postings if doc_ids is None else np.intersect1d(doc_ids, postings, assume_unique=True)
+        return doc_ids if doc_ids is not None else np.empty(0, dtype=np.uint32)
+
+    # Scores for a run of postings, with the boosts applied in the same order as the original loop
+    def term_scores(self, frequencies, masks, lengths, idf, in_query, in_intersection):
+        frequencies = frequencies.astype(np.float64)
+        TF = frequencies / (frequencies + k * (1 - b + b * lengths / self.avgdl))
+        scores = TF * idf * 100
+
+        if in_intersection is not None:
+            scores[in_intersection] *= INTERSECTION_VAR
+        if in_query:
+            scores *= WORD_IN_QUERY_VAR
+
+        scores[(masks & TITLE_BIT) != 0] *= TITLE_VAR
+        scores[(masks & AUTHOR_BIT) != 0] *= AUTHOR_VAR
+        scores[(masks & TAG_BIT) != 0] *= TAG_VAR
+        return scores
+
+    # Per-query float32 accumulator indexed by doc id; untouched documents stay at -inf
+    def score(self, inverted_data, query_word_ids):
+        max_doc_id = max((int(postings.doc_ids[-1]) for postings in inverted_data.values() if len(postings)), default=0)
+        accumulator = np.full(max(self.num_docs, max_doc_id + 1), -np.inf, dtype=np.float32)
+        intersection = self.intersection(inverted_data, query_word_ids)
+        query_word_ids = set(query_word_ids)
+
+        for word_id, postings in inverted_data.items():
+            doc_ids = postings.doc_ids
+            in_intersection = np.isin(doc_ids, intersection, assume_unique=True) if len(intersection) else None
+            scores = self.term_scores(postings.frequencies, postings.masks, self.lengths_of(doc_ids),
+                                      self.idf(len(postings)), word_id in query_word_ids, in_intersection)
+            # Doc ids are unique within a posting list, so plain fancy indexing is safe here
+            accumulator[doc_ids] = np.maximum(accumulator[doc_ids], scores)
+        return accumulator
+
+    # Best `count` (score, doc_id) pairs, highest score first and ties broken by doc id
+    def top_k(self, accumulator, count=TOP_K):
+        scored = np.count_nonzero(accumulator > -np.inf)
+        count = min(count, scored)
+        if count == 0:
+            return []
+        if count < len(accumulator):
+            candidates = np.argpartition(-accumulator, count - 1)[:count]
+            # Pull in every document tied with the cutoff so ties always resolve by doc id
+            cutoff = accumulator[candidates].min()
+            candidates = np.flatnonzero(accumulator >= cutoff)
+        else:
+            candidates = np.arange(len(accumulator))
+        candidates = candidates[np.lexsort((candidates, -accumulator[candidates]))][:count]
+        return [(float(accumulator[doc_id]), int(doc_id)) for doc_id in candidates]
+
+    # Upper bound of every block's scores for one term (block-max table + field-boost table)
+    def block_upper_bounds(self, postings, idf, in_query, intersection_boost):
+        blocks = postings.block_maxima()
+        if idf <= 0:
+            return np.zeros(len(blocks))
+        max_freq = blocks['max_freq'].astype(np.float64)
+        min_length = blocks['min_length'].astype(np.float64)
+        TF = max_freq / (max_freq + k * (1 - b + b * min_length / self.avgdl))
+        bounds = TF * idf * 100 * FIELD_BOOST_BOUNDS[blocks['mask']] * intersection_boost
+        if in_query:
+            bounds *= WORD_IN_QUERY_VAR
+        return bounds * BOUND_SLACK
+
+    # Same ranking as score() + top_k(), skipping blocks whose bound cannot reach the current top-k
+    def top_k_pruned(self, inverted_data, query_word_ids, count=TOP_K):
+        query_word_ids = set(query_word_ids)
+        terms = [(word_id, postings) for word_id, postings in inverted_data.items() if len(postings)]
+        if not terms:
+            return [], {'scored': 0, 'skipped': 0}
+        topk = TopKCandidates(count)
+        stats = {'scored': 0, 'skipped': 0}
+
+        # Documents holding every query term are boosted by INTERSECTION_VAR, so they are scored
+        # exactly first; with a single term every posting is in the intersection
+        intersection = self.intersection(inverted_data, query_word_ids)
+        single_term = len(inverted_data) == 1
+        if not single_term and len(intersection):
+            best = np.full(len(intersection), -np.inf)
+            for word_id, postings in terms:
+                index = np.searchsorted(postings.doc_ids, intersection)
+                scores = self.term_scores(postings.frequencies[index], postings.masks[index], self.lengths_of(intersection),
+                                          self.idf(len(postings)), word_id in query_word_ids,
+                                          np.ones(len(index), dtype=bool))
+                best = np.maximum(best, scores)
+            topk.add(intersection, best)
+            stats['scored'] += len(intersection) * len(terms)
+
+        # Remaining postings, highest-bound terms first so the threshold rises quickly
+        intersection_boost = INTERSECTION_VAR if single_term else 1
+        bounded = []
+        for word_id, postings in terms:
+            idf = self.idf(len(postings))
+            bounds = self.block_upper_bounds(postings, idf, word_id in query_word_ids, intersection_boost)
+            bounded.append((float(bounds.max()), word_id, postings, idf, bounds))
+        bounded.sort(key=lambda term: term[0], reverse=True)
+
+        for position, (term_bound, word_id, postings, idf, bounds) in enumerate(bounded):
+            threshold = topk.threshold()
+            if term_bound < threshold:
+                stats['skipped'] += sum(len(term[2]) for term in bounded[position:])
+                break
+
+            keep = np.repeat(bounds >= threshold, BLOCK_SIZE)[:len(postings)]
+            if not single_term and len(intersection):
+                keep &= ~np.isin(postings.doc_ids, intersection, assume_unique=True)
+            doc_ids = postings.doc_ids[keep]
+            stats['skipped'] += len(postings) - len(doc_ids)
+            stats['scored'] += len(doc_ids)
+            if not len(doc_ids):
+                continue
+
+            in_intersection = np.ones(len(doc_ids), dtype=bool) if single_term else None
+            scores = self.term_scores(postings.frequencies[keep], postings.masks[keep], self.lengths_of(doc_ids),
+                                      idf, word_id in query_word_ids, in_intersection)
+            topk.add(doc_ids, scores)
+
+        return topk.results(), stats
+
+
+class TopKCandidates:
+    """Best score per document among the candidates seen so far, trimmed to the top `count`."""
+
+    def __init__(self, count):
+        self.count = count
+        self.doc_ids = np.empty(0, dtype=np.uint32)
+        self.scores = np.empty(0, dtype=np.float32)
+
+    # `doc_ids` must be unique within one call (one term's postings)
+    def add(self, doc_ids, scores):
+        scores = scores.astype(np.float32)
+        # Scores under the threshold can never make the final top-k; neither can anything below
+        # the count-th best of this batch, since the batch alone already fills the top-k
+        cutoff = self.threshold()
+        if len(scores) > self.count:
+            cutoff = max(cutoff, float(np.partition(scores, len(scores) - self.count)[len(scores) - self.count]))
+        keep = scores >= cutoff
+        doc_ids = np.concatenate([self.doc_ids, doc_ids[keep].astype(np.uint32)])
+        scores = np.concatenate([self.scores, scores[keep]])
+
+        # Keep each document's best score, then everything tied with or above the count-th best
+        order = np.lexsort((-scores, doc_ids))
+        doc_ids, scores = doc_ids[order], scores[order]
+        first = np.ones(len(doc_ids), dtype=bool)
+        first[1:] = doc_ids[1:] != doc_ids[:-1]
+        doc_ids, scores = doc_ids[first], scores[first]
+        if len(scores) > self.count:
+            cutoff = np.partition(scores, len(scores) - self.count)[len(scores) - self.count]
+            keep = scores >= cutoff
+            doc_ids, scores = doc_ids[keep], scores[keep]
+        self.doc_ids, self.scores = doc_ids, scores
+
+    # Score a document must reach to still matter; -inf until the top-k is full
+    def threshold(self):
+        if len(self.scores) < self.count:
+            return -np.inf
+        return float(np.partition(self.scores, len(self.scores) - self.count)[len(self.scores) - self.count])
+
+    def results(self):
+        order = np.lexsort((self.doc_ids, -self.scores))[:self.count]
+        return [(float(self.scores[i]), int(self.doc_ids[i])) for i in order]
@@ -0,0 +1,8 @@
+from config import doc_store_folder, processed_file, scrapped_file, lengths_file
+from doc_store import build_doc_store
+import time as t
+
+# Building the memory-mapped document store from the processed, scraped and lengths CSVs
+a = t.time()
+build_doc_store(doc_store_folder, processed_file, scrapped_file, lengths_file)
+print(t.time() - a)
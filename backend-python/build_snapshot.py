@@ -0,0 +1,8 @@
+from config import snapshot_file, lexicon_file, processed_file, scrapped_file, lengths_file, inverted_index_folder
+from snapshot import write_snapshot
+import time as t
+
+# Writing the startup snapshot (lexicon, document store, corpus statistics, barrel directory) from the CSVs
+a = t.time()
+write_snapshot(snapshot_file, lexicon_file, processed_file, scrapped_file, lengths_file, inverted_index_folder)
+print(t.time() - a)
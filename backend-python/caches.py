@@ -0,0 +1,226 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Dict, Optional
+from config import barrel_size
+
+
+###
+### Decoded posting lists shared across requests
+###
+class PostingCache:
+    """LRU cache of decoded posting lists keyed by word id, bounded by their decoded size in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # word_id -> (posting list, size in bytes, barrel version)
+        self.current_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # `version` is the version of the word's barrel the caller reads (SegmentIndex.version)
+    def get(self, word_id, version=0):
+        with self.lock:
+            entry = self.entries.get(word_id)
+            if entry is None or entry[2] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(word_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, word_id, postings, version=0):
+        size = postings.decoded_nbytes
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if word_id in self.entries:
+                # A search pinned to an older generation never replaces postings of a newer barrel
+                if self.entries[word_id][2] > version:
+                    return
+                self.current_bytes -= self.entries.pop(word_id)[1]
+            self.entries[word_id] = (postings, size, version)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    # Cached postings, or load them (outside the lock) and cache the result
+    def get_or_load(self, word_id, loader, version=0):
+        postings = self.get(word_id, version)
+        if postings is not None:
+            return postings
+        postings = loader(word_id)
+        if postings is not None:
+            self.put(word_id, postings, version)
+        return postings
+
+    # Drop every word of a barrel that was rewritten on disk
+    def invalidate_barrel(self, barrel_num):
+        with self.lock:
+            stale = [word_id for word_id in self.entries if word_id // barrel_size == barrel_num]
+            for word_id in stale:
+                self.current_bytes -= self.entries.pop(word_id)[1]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+###
+### Search results keyed by the normalized query terms
+###
+class QueryCacheEntry:
+    __slots__ = ('word_ids', 'results', 'count', 'created')
+
+    def __init__(self, word_ids, results, count, created):
+        self.word_ids = word_ids
+        self.results = results
+        self.count = count
+        self.created = created
+
+
+class QueryResultCache:
+    """
+    TTL + LRU cache of full search results keyed by the sorted, lemmatized term-id set and
+    the retrieval mode (exhaustive and block-max results are kept apart for A/B comparisons).
+
+    Entries are tied to an index generation: an upload bumps the generation and drops
+    the entries sharing a term with it, and results computed against an older generation
+    are never stored. It also remembers the most recent query for /summarize, which is
+    what the old single-slot QueryCache was used for.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # key -> QueryCacheEntry
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        # Most recent query, read by /summarize
+        self.last_query: Optional[str] = None
+        self.last_query_timestamp: Optional[datetime] = None
+        self.last_results: List[Dict] = []
+        self.query_id: Optional[str] = None
+        self.is_processing = False
+
+    @staticmethod
+    def make_key(word_ids, mode):
+        return tuple(sorted(set(word_ids))), mode
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry.created > self.ttl_seconds:
+                del self.entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, results, count, generation):
+        with self.lock:
+            if generation != self.generation:
+                return  # The index changed while these results were computed
+            self.entries[key] = QueryCacheEntry(set(key[0]), results, count, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    # New index generation: drop every entry that shares a term with the update
+    def invalidate_words(self, word_ids):
+        word_ids = set(word_ids)
+        with self.lock:
+            self.generation += 1
+            stale = [key for key, entry in self.entries.items() if not entry.word_ids.isdisjoint(word_ids)]
+            for key in stale:
+                del self.entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.last_query = None
+            self.last_query_timestamp = None
+            self.last_results = []
+            self.query_id = None
+            self.is_processing = False
+
+    def update_cache(self, query: str, results: List[Dict]):
+        """Record the latest query and its top results for /summarize"""
+        with self.lock:
+            self.last_query = query
+            self.last_query_timestamp = datetime.now()
+            self.last_results = results[:5]  # Keep top 5 results
+            self.query_id = str(uuid.uuid4())
+            self.is_processing = False
+            print(f"DEBUG: Cache updated - Query: '{query[:50]}...', Results: {len(results)}")
+
+    def set_processing(self, query: str):
+        """Mark that a query is being processed"""
+        with self.lock:
+            self.is_processing = True
+            self.last_query = query
+            self.query_id = str(uuid.uuid4())
+            print(f"DEBUG: Started processing query: '{query[:50]}...'")
+
+    def get_cache_status(self):
+        """Get the status of the latest query"""
+        with self.lock:
+            return {
+                'has_query': self.last_query is not None,
+                'query': self.last_query,
+                'query_id': self.query_id,
+                'results_count': len(self.last_results),
+                'timestamp': self.last_query_timestamp,
+                'is_processing': self.is_processing
+            }
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'generation': self.generation,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
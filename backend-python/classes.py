@@ -2,10 +2,9 @@ from pydantic import BaseModel
 from typing import List
 from typing import List, Dict, Optional, Any
 from datetime import datetime
-import threading
 import asyncio
 import aiohttp
-import uuid
+from config import gemini_base_url
 
 
 ###
@@ -13,10 +12,15 @@ import uuid
 ###
 class QueryRequest(BaseModel):
     query: str
+    offset: int = 0    # Pagination over the cached top results
+    limit: int = 100
 
 class UrlRequest(BaseModel):
     url: str
 
+class UrlsRequest(BaseModel):
+    urls: List[str]
+
 class Result(BaseModel):
     id: int
     title: str
@@ -33,48 +37,6 @@ class SearchResult(BaseModel):
     count: int
     time: float
 
-###
-### Global cache for query results
-###
-class QueryCache:
-    def __init__(self):
-        self.last_query: Optional[str] = None
-        self.last_query_timestamp: Optional[datetime] = None
-        self.last_results: List[Dict] = []
-        self.query_id: Optional[str] = None
-        self.processing_lock = threading.Lock()
-        self.is_processing = False
-        
-    def update_cache(self, query: str, results: List[Dict]):
-        """Update cache with new query and results"""
-        with self.processing_lock:
-            self.last_query = query
-            self.last_query_timestamp = datetime.now()
-            self.last_results = results[:5]  # Keep top 5 results
-            self.query_id = str(uuid.uuid4())
-            self.is_processing = False
-            print(f"DEBUG: Cache updated - Query: '{query[:50]}...', Results: {len(results)}")
-    
-    def set_processing(self, query: str):
-        """Mark that a query is being processed"""
-        with self.processing_lock:
-            self.is_processing = True
-            self.last_query = query
-            self.query_id = str(uuid.uuid4())
-            print(f"DEBUG: Started processing query: '{query[:50]}...'")
-    
-    def get_cache_status(self):
-        """Get current cache status"""
-        with self.processing_lock:
-            return {
-                'has_query': self.last_query is not None,
-                'query': self.last_query,
-                'query_id': self.query_id,
-                'results_count': len(self.last_results),
-                'timestamp': self.last_query_timestamp,
-                'is_processing': self.is_processing
-            }
-
 ###
 ### New models for summarization
 ###
@@ -100,10 +62,12 @@ class SummarizeResponse(BaseModel):
 
 # Gemini RAG module
 class GeminiRAGModule:
-    def __init__(self, api_key: str, model_name: str = "gemini-1.5-flash"):
+    # `session` is the app's pooled aiohttp session (set in the lifespan); without one each call opens its own
+    def __init__(self, api_key: str, model_name: str = "gemini-1.5-flash", session: Optional[aiohttp.ClientSession] = None):
         self.api_key = api_key
         self.model_name = model_name
-        self.base_url = "https://generativelanguage.googleapis.com/v1beta/models"
+        self.base_url = gemini_base_url
+        self.session = session
         print(f"DEBUG: Initialized Gemini RAG with model: {model_name}")
     
     async def generate_summary(self, query: str, context: str, summary_length: str = "short") -> str:
@@ -154,21 +118,26 @@ Summary:"""
                 }
             }
             
+            if self.session is not None:
+                return await self._post(self.session, url, payload)
             async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        
-                        if 'candidates' in data and len(data['candidates']) > 0:
-                            summary = data['candidates'][0]['content']['parts'][0]['text'].strip()
-                            print(f"DEBUG: Generated summary length: {len(summary)} characters")
-                            return summary
-                        else:
-                            raise Exception("No candidates in Gemini response")
-                    else:
-                        error_text = await response.text()
-                        raise Exception(f"Gemini API error {response.status}: {error_text}")
+                return await self._post(session, url, payload)
                         
         except Exception as e:
             print(f"DEBUG: Gemini API error: {e}")
             raise Exception(f"Failed to generate summary: {str(e)}")
+
+    async def _post(self, session: aiohttp.ClientSession, url: str, payload: dict) -> str:
+        async with session.post(url, json=payload) as response:
+            if response.status == 200:
+                data = await response.json()
+                
+                if 'candidates' in data and len(data['candidates']) > 0:
+                    summary = data['candidates'][0]['content']['parts'][0]['text'].strip()
+                    print(f"DEBUG: Generated summary length: {len(summary)} characters")
+                    return summary
+                else:
+                    raise Exception("No candidates in Gemini response")
+            else:
+                error_text = await response.text()
+                raise Exception(f"Gemini API error {response.status}: {error_text}")
@@ -0,0 +1,37 @@
+import asyncio
+
+
+###
+### Single-flight: identical calls in flight at the same time share one execution
+###
+class AsyncSingleFlight:
+    """Merges concurrent calls with the same key on one event loop (e.g. the Gemini requests)."""
+
+    def __init__(self):
+        self.calls = {}  # key -> asyncio.Task in flight
+        self.executions = 0
+        self.coalesced = 0
+
+    # Await coroutine_fn() once per key; callers arriving while it runs await the same task
+    async def do(self, key, coroutine_fn):
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coroutine_fn())
+            self.calls[key] = task
+            self.executions += 1
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        # A waiter that disconnects must not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+
+    def stats(self):
+        return {
+            'executions': self.executions,
+            'coalesced': self.coalesced,
+            'in_flight': len(self.calls),
+        }
@@ -1,5 +1,7 @@
+import os
+
 # File locations
-csv_file = "datasets/1000_dataset.csv"
+csv_file = os.getenv('DATASET_FILE', "datasets/1000_dataset.csv")  # .csv or .jsonl (optionally .gz/.zst) or .parquet
 lexicon_file = "indexes/lexicon.csv"
 forward_index_folder = 'indexes/forward'
 inverted_index_folder = 'indexes/inverted'
@@ -8,4 +10,66 @@ doc_id_file = 'indexes/latest_doc_id.txt'
 processed_file = 'indexes/processed.csv'
 scrapped_file = 'indexes/scraped.csv'
 received_file = 'received.csv'
-lengths_file = 'indexes/lengths.csv'
\ No newline at end of file
+lengths_file = 'indexes/lengths.csv'
+doc_store_folder = 'indexes/docstore'
+snapshot_file = 'indexes/snapshot.bin'
+lemma_table_file = 'indexes/lemmas.csv'
+delta_log_file = 'indexes/delta.log'
+upload_jobs_file = 'indexes/upload_jobs.log'
+summary_cache_file = os.getenv('SUMMARY_CACHE_FILE', 'indexes/summary_cache.log')
+http_cache_folder = os.getenv('HTTP_CACHE_FOLDER', 'indexes/http_cache')
+
+# Index layout
+barrel_size = 1001
+
+# Caches
+posting_cache_bytes = 256 * 1024 * 1024
+query_cache_entries = 1024
+query_cache_ttl = 10 * 60  # seconds
+analyzer_memo_size = 200_000  # Surface forms whose lemma is remembered
+http_cache_bytes = 512 * 1024 * 1024  # Scraped page bodies kept on disk
+http_cache_fresh_seconds = 10 * 60    # Stored pages served without revalidating for this long
+http_cache_offline = os.getenv('HTTP_CACHE_OFFLINE') == '1'  # Replay stored pages only, never touch the network
+summary_cache_bytes = 16 * 1024 * 1024    # Gemini summaries kept (in memory and in summary_cache_file)
+summary_cache_ttl = 24 * 60 * 60          # seconds a summary is served before Gemini is asked again
+
+# Search pipeline
+search_io_workers = 8        # Threads reading postings
+search_cpu_workers = 2       # Threads scoring (NumPy releases the GIL for most of the work)
+max_concurrent_searches = 16 # Queries computed at once, the rest wait their turn
+
+# Boot
+nltk_data_folder = 'nltk_data'                  # Vendored NLTK resources (python downloads.py)
+offline_boot = os.getenv('OFFLINE_BOOT') == '1' # Never download anything at startup
+snapshot_boot = os.getenv('SNAPSHOT_BOOT', '1') == '1' # Load from the snapshot when it matches the CSVs
+
+# Indexing
+index_workers = int(os.getenv('INDEX_WORKERS', os.cpu_count() or 1)) # Processes analyzing rows, 1 for serial
+index_batch_size = 64                                                 # Rows sent to a worker at a time
+ingest_chunk_rows = 10_000                                            # Rows per record batch read from Parquet datasets
+index_memory_bytes = int(os.getenv('INDEX_MEMORY_MB', 256)) * 1024 * 1024  # Postings buffered before a sorted run is spilled
+delta_compact_docs = 64                                               # Uploaded documents kept in the delta before compaction
+
+# Uploads
+upload_workers = 4       # Articles scraped at once
+upload_batch_size = 16   # Scraped articles committed to the index together
+upload_batch_wait = 2.0  # Seconds a batch waits for more articles before committing
+upload_job_retention = 3600  # Seconds a finished upload job stays in the log and under /upload-status?job_id=...
+
+# Crawler (scrape.py)
+crawl_concurrency = 16        # Requests in flight over the pooled session
+crawl_rate = 2.0              # Starting requests per second per host
+crawl_max_rate = 10.0         # Ceiling the per-host rate grows towards while the host does not throttle
+crawl_burst = 5               # Requests a host's token bucket can save up
+crawl_max_retries = 5         # Attempts after a failed request (no response)
+crawl_max_throttles = 100     # Throttled answers (429/503) a URL may get before it is given up, with its status
+crawl_timeout = 30            # Seconds per request
+crawl_checkpoint_every = 50   # Finished rows per checkpoint append
+metadata_body_bytes = 64 * 1024  # Body bytes read looking for the member-only marker when the head does not tell
+
+# HTTP client (one pooled aiohttp session owned by the app, for article scraping and Gemini)
+http_pool_size = 32           # Connections kept open across all hosts
+http_dns_cache_seconds = 300  # How long resolved host names are reused
+http_keepalive_seconds = 30   # Idle time before a pooled connection is closed
+article_parse_workers = 2     # Processes parsing scraped article pages for /summarize-article
+gemini_base_url = os.getenv('GEMINI_BASE_URL', "https://generativelanguage.googleapis.com/v1beta/models")
@@ -0,0 +1,9 @@
+from config import inverted_index_folder, lengths_file
+from csv_utils import load_length_array
+from segments import convert_inverted_index
+import time as t
+
+# Converting the existing CSV inverted barrels into binary posting segments
+a = t.time()
+convert_inverted_index(inverted_index_folder, load_length_array(lengths_file))
+print(t.time() - a)
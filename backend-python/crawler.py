@@ -0,0 +1,251 @@
+import asyncio
+import json
+import os
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import aiohttp
+from http_cache import cached_fetch, StoredContent, OfflineCacheMiss
+from config import crawl_concurrency, crawl_rate, crawl_max_rate, crawl_burst, crawl_max_retries, crawl_max_throttles, crawl_timeout, crawl_checkpoint_every
+
+#
+#   ASYNC CRAWLER
+#
+#   One pooled aiohttp session for the whole crawl, at most `concurrency` requests in flight and a
+#   token bucket per host. Buckets adapt AIMD-style: every success adds a little to the host's rate,
+#   a 429 (or 503) halves it and pauses the host for its Retry-After (or an exponential backoff when
+#   there is none), and the throttled URL is retried. So the rate settles just under what each host
+#   really allows instead of stopping everything for a fixed 15 minutes. Finished rows are appended
+#   to a checkpoint (one JSON object per line) and skipped when a crawl is resumed.
+#
+#   With a `cache` (http_cache.HttpCache) pages go through it like every other scraper: fresh pages
+#   are served from disk without touching the host's bucket, stale ones are revalidated with
+#   ETag / Last-Modified, whole 200 pages are stored, and offline mode replays them. Readers then
+#   parse the fetched body instead of the live stream.
+#
+THROTTLED = (429, 503)
+
+
+def retry_after_seconds(value):
+    """Seconds asked for by a Retry-After header (delta seconds or an HTTP date), None if missing or unreadable"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Requests per second to one host, adapted to how often the host throttles."""
+
+    def __init__(self, rate, max_rate, burst):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.throttles = 0  # in a row, for the backoff when there is no Retry-After
+        self.requests = 0
+        self.throttled = 0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.requests += 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    # Additive increase: about one more request per second every `max_rate` successes
+    def succeeded(self):
+        self.throttles = 0
+        self.rate = min(self.max_rate, self.rate + 1 / self.max_rate)
+
+    # Multiplicative decrease, and a pause before the host is tried again
+    def throttle(self, retry_after=None):
+        self.throttles += 1
+        self.throttled += 1
+        self.rate = max(self.max_rate / 100, self.rate / 2)
+        self.tokens = 0
+        delay = retry_after if retry_after is not None else min(900, 2 ** self.throttles)
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+    def stats(self):
+        return {
+            'rate': round(self.rate, 3),
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'throttle_rate': self.throttled / self.requests if self.requests else 0.0,
+        }
+
+
+class Crawler:
+    """
+    Fetches many URLs over one pooled session. `crawl(jobs, handle)` takes (key, url) pairs and
+    `handle(key, url, status, body)`, which turns a final response (body None when the URL was given up,
+    status None too if no response came at all) into the row stored for the key. The body is the page's text, or what
+    `read(content)` returns when given: `content` is read like aiohttp's response.content (e.g. to stop early).
+    """
+
+    def __init__(self, checkpoint_file=None, concurrency=crawl_concurrency, rate=crawl_rate, max_rate=crawl_max_rate,
+                 burst=crawl_burst, max_retries=crawl_max_retries, max_throttles=crawl_max_throttles, timeout=crawl_timeout,
+                 headers=None, read=None, cache=None):
+        self.checkpoint_file = checkpoint_file
+        self.read = read
+        self.cache = cache
+        self.concurrency = concurrency
+        self.rate = rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.max_throttles = max_throttles
+        self.timeout = timeout
+        self.headers = headers
+        self.buckets = {}
+        self.fetched = 0
+        self.failed = 0
+
+    def bucket(self, url):
+        host = urlparse(url).netloc.lower()
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.max_rate, self.burst)
+        return self.buckets[host]
+
+    ###
+    ### Checkpoint
+    ###
+    def load_checkpoint(self):
+        """Rows of a crawl that was cut short, by key"""
+        done = {}
+        if self.checkpoint_file and os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # A torn last line from a crash mid-append
+                    done[entry['key']] = entry['row']
+        return done
+
+    def _append_checkpoint(self, entries):
+        if not self.checkpoint_file or not entries:
+            return
+        with open(self.checkpoint_file, 'a', encoding='utf-8') as file:
+            file.write(''.join(json.dumps({'key': key, 'row': row}) + '\n' for key, row in entries))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def clear_checkpoint(self):
+        if self.checkpoint_file and os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+
+    ###
+    ### Crawl
+    ###
+    # One request: (status, headers, body read by `read`, whether the server was asked); no body for a throttled response
+    async def _get(self, session, url, bucket):
+        if self.cache is not None:
+            page = await cached_fetch(session, url, headers=self.headers, timeout=self.timeout, cache=self.cache,
+                                      before_request=bucket.acquire)
+            if page.status in THROTTLED:
+                return page.status, page.headers, None, True
+            body = await self.read(StoredContent(page.body)) if self.read is not None else page.body.decode('utf-8', errors='replace')
+            return page.status, page.headers, body, not page.cached
+
+        await bucket.acquire()
+        async with session.get(url) as response:
+            if response.status in THROTTLED:
+                return response.status, response.headers, None, True
+            body = await self.read(response.content) if self.read is not None else await response.text(errors='replace')
+            return response.status, response.headers, body, True
+
+    async def _fetch(self, session, url):
+        """
+        (status, body) of the final response. Throttled answers have their own budget (`max_throttles`), since
+        the host's pause and rate already adapt to them; failed requests have `max_retries`. A URL out of
+        either ends with the last status it got (None if none) and no body.
+        """
+        bucket = self.bucket(url)
+        status = None
+        failures = throttles = 0
+        while True:
+            try:
+                status, headers, body, requested = await self._get(session, url, bucket)
+            except OfflineCacheMiss as e:
+                print(f"Error fetching URL {url}: {e}")
+                return None, None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                failures += 1
+                print(f"Error fetching URL {url} (attempt {failures}): {e}")
+                if failures > self.max_retries:
+                    return status, None
+                await asyncio.sleep(min(60, 2 ** (failures - 1)))
+                continue
+            if status in THROTTLED:
+                throttles += 1
+                bucket.throttle(retry_after_seconds(headers.get('Retry-After')))
+                if throttles > self.max_throttles:
+                    print(f"Giving up on URL {url} after {throttles} throttled answers ({status})")
+                    return status, None
+                continue
+            if requested:
+                bucket.succeeded()
+            return status, body
+
+    async def crawl(self, jobs, handle):
+        """Rows by key for every job, those in the checkpoint included"""
+        rows = self.load_checkpoint()
+        pending = [(key, url) for key, url in jobs if key not in rows]
+        if rows:
+            print(f"Resuming crawl: {len(rows)} rows from the checkpoint, {len(pending)} URLs to go")
+
+        queue = asyncio.Queue()
+        for job in pending:
+            queue.put_nowait(job)
+        finished = []
+        started = time.monotonic()
+
+        async def worker(session):
+            while True:
+                try:
+                    key, url = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                status, body = await self._fetch(session, url)
+                row = handle(key, url, status, body)
+                if status is None or status in THROTTLED:
+                    self.failed += 1
+                self.fetched += 1
+                rows[key] = row
+                finished.append((key, row))
+                if len(finished) >= crawl_checkpoint_every:
+                    self._append_checkpoint(finished)
+                    finished.clear()
+                    elapsed = time.monotonic() - started
+                    print(f"Crawled {self.fetched} of {len(pending)} ({self.fetched / elapsed:.1f}/s, {self.failed} failed)")
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self.headers) as session:
+            await asyncio.gather(*[worker(session) for _ in range(min(self.concurrency, len(pending)) or 1)])
+        self._append_checkpoint(finished)
+        return rows
+
+    def stats(self):
+        return {
+            'fetched': self.fetched,
+            'failed': self.failed,
+            'hosts': {host: bucket.stats() for host, bucket in self.buckets.items()},
+        }
@@ -2,7 +2,10 @@ import csv
 import os
 import json
 import re
-from config import id_file, doc_id_file, processed_file
+import hashlib
+from urllib.parse import urlparse
+from config import id_file, doc_id_file, processed_file, lengths_file, csv_file, lexicon_file, forward_index_folder
+from dataset_reader import read_dataset
 import numpy as np
 
 #
@@ -29,32 +32,275 @@ def load_latest_doc_id():
     return latest_doc_id
 
 
-def save_processed_docs(new_entries, latest_doc_id):
-    os.makedirs("indexes", exist_ok=True)
+# Counters are replaced atomically (write + fsync + rename), so a crash leaves the old or the new value
+def save_counter(file_name, value):
+    temp_file = file_name + '.tmp'
+    with open(temp_file, 'w') as file:
+        file.write(str(value))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_file, file_name)
 
-    # Append new entries to the CSV
-    with open(processed_file, mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        if os.stat(processed_file).st_size == 0:
-            writer.writerow(['ID', 'title', 'url', 'authors', 'timestamp', 'tags'])
-        writer.writerows(new_entries)
 
-    # Save the latest ID
-    with open(doc_id_file, 'w') as file:
-        file.write(str(latest_doc_id))
+class ProcessedDocsWriter:
+    """
+    Buffers processed rows (and document lengths) and writes them with one append per commit
+    (once per barrel while indexing).
+
+    The doc id counter is the commit point: rows are appended and fsynced first, then the counter is
+    moved. Rows past the counter are left over from an interrupted commit, and load_processed_entries drops them
+    (drop_uncommitted_rows does the same for the lengths and the forward barrels written before them).
+    """
+
+    def __init__(self):
+        self.pending = []
+        self.pending_lengths = []
+
+    def add(self, entry, length=None):
+        self.pending.append(entry)
+        if length is not None:
+            self.pending_lengths.append([entry[0], length])
+
+    def commit(self, latest_doc_id):
+        os.makedirs("indexes", exist_ok=True)
+        if self.pending_lengths:
+            with open(lengths_file, mode='a', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                if os.stat(lengths_file).st_size == 0:
+                    writer.writerow(['ID', 'length'])
+                writer.writerows(self.pending_lengths)
+                file.flush()
+                os.fsync(file.fileno())
+            self.pending_lengths.clear()
+        if self.pending:
+            with open(processed_file, mode='a', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                if os.stat(processed_file).st_size == 0:
+                    writer.writerow(['ID', 'title', 'url', 'authors', 'timestamp', 'tags'])
+                writer.writerows(self.pending)
+                file.flush()
+                os.fsync(file.fileno())
+            self.pending.clear()
+        save_counter(doc_id_file, latest_doc_id)
+
+
+# Fixed-size (8 byte) hash of a processed entry: (title, url, authors, timestamp, tags)
+def entry_hash(entry):
+    return int.from_bytes(hashlib.blake2b('\x1f'.join(entry).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class EntryHashes:
+    """
+    Deduplication set of processed entries, holding only their hashes: a sorted uint64 array for
+    the entries loaded from disk and a set for those added since (instead of a set of string tuples).
+    """
+
+    def __init__(self, hashes=()):
+        self.loaded = np.unique(np.array(hashes, dtype=np.uint64))
+        self.added = set()
+
+    def __contains__(self, entry):
+        key = entry_hash(entry)
+        if key in self.added:
+            return True
+        i = np.searchsorted(self.loaded, np.uint64(key))
+        return i < len(self.loaded) and int(self.loaded[i]) == key
+
+    def add(self, entry):
+        self.added.add(entry_hash(entry))
+
+    def __len__(self):
+        return len(self.loaded) + len(self.added)
 
 
 def load_processed_entries():
-    processed_set = set()
+    """Hashes of the committed processed entries, dropping rows an interrupted commit left past the doc id counter"""
+    hashes = []
+    if not os.path.exists(processed_file):
+        return EntryHashes()
+
+    latest_doc_id = load_latest_doc_id()
+    uncommitted = None
+    with open(processed_file, mode='r', newline='', encoding='utf-8') as file:
+        # Lines are read one by one so the offset where each row starts is known
+        def lines():
+            while True:
+                line = file.readline()
+                if not line:
+                    return
+                yield line
+        reader = csv.reader(lines())
+        next(reader, None)
+        row_start = file.tell()
+        for row in reader:
+            if int(row[0]) > latest_doc_id:
+                uncommitted = row_start
+                break
+            hashes.append(entry_hash(row[1:]))
+            row_start = file.tell()
+
+    if uncommitted is not None:
+        print(f"Dropping processed rows past doc id {latest_doc_id} (interrupted commit)")
+        with open(processed_file, 'r+b') as file:
+            file.truncate(uncommitted)
+    return EntryHashes(hashes)
+
+
+# (offset, line) of a binary file from its last line to its first, read in blocks from the end
+def reversed_lines(file, block_size=1 << 16):
+    position = file.seek(0, os.SEEK_END)
+    head = b''
+    while position > 0:
+        start = max(0, position - block_size)
+        file.seek(start)
+        lines = (file.read(position - start) + head).split(b'\n')
+        end = start + sum(len(line) + 1 for line in lines) - 1
+        for line in reversed(lines[1:]):
+            end -= len(line)
+            yield end, line
+            end -= 1
+        head = lines[0]
+        position = start
+    yield 0, head
+
+
+def drop_rows_past(file_name, last_id):
+    """
+    Truncate the trailing rows of a CSV file with one line per row whose leading id is past `last_id`
+    (left by an interrupted commit), and a torn last line. Only the tail of the file is read.
+    """
+    if not os.path.exists(file_name):
+        return False
+    with open(file_name, 'r+b') as file:
+        size = file.seek(0, os.SEEK_END)
+        keep = size
+        for offset, line in reversed_lines(file):
+            if offset + len(line) == size and line:
+                keep = offset  # No line break at the end: the last row was cut short
+                continue
+            if not line.strip():
+                keep = offset
+                continue
+            try:
+                row_id = int(line.split(b',', 1)[0])
+            except ValueError:
+                break  # The header
+            if row_id <= last_id:
+                break
+            keep = offset
+        if keep < size:
+            file.truncate(keep)
+            return True
+    return False
 
-    if os.path.exists(processed_file):
-        with open(processed_file, mode='r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            next(reader, None)
-            for row in reader:
-                processed_set.add(tuple(row[1:]))
-    return processed_set
 
+def drop_uncommitted_rows():
+    """
+    Drop the lexicon rows past the word id counter, and the document lengths and forward barrel rows
+    past the doc id counter, so that a run interrupted between its writes does not leave duplicates
+    behind when it is repeated (processed rows are dropped by load_processed_entries).
+    """
+    latest_id = load_latest_id()
+    latest_doc_id = load_latest_doc_id()
+    if drop_rows_past(lexicon_file, latest_id):
+        print(f"Dropping lexicon rows past word id {latest_id} (interrupted commit)")
+    forward_files = sorted(os.listdir(forward_index_folder)) if os.path.isdir(forward_index_folder) else []
+    for file_name in [lengths_file] + [os.path.join(forward_index_folder, name) for name in forward_files if name.endswith('.csv')]:
+        if drop_rows_past(file_name, latest_doc_id):
+            print(f"Dropping rows of {file_name} past doc id {latest_doc_id} (interrupted commit)")
+
+
+# Article URL reduced to host and path: scheme, 'www.', query string (Medium's ?source=...), fragment and
+# trailing slash dropped; a Freedium mirror URL maps to the article it mirrors
+def canonical_url(url):
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if host == 'freedium.cfd' and parsed.path.startswith('/http'):
+        return canonical_url(parsed.path[1:])
+    return host + parsed.path.rstrip('/')
+
+def normalized_title(title):
+    return ' '.join(title.lower().split())
+
+
+class DuplicateIndex:
+    """
+    Hashes of the canonical URLs and normalized titles of the processed documents, for the upload
+    path's duplicate check: sorted uint64 arrays for the documents the document store was built
+    with (persisted with its columns) and sets for those added since.
+    """
+
+    def __init__(self, url_hashes=(), title_hashes=()):
+        self.loaded_urls = np.asarray(url_hashes, dtype=np.uint64)
+        self.loaded_titles = np.asarray(title_hashes, dtype=np.uint64)
+        self.added_urls = set()
+        self.added_titles = set()
+
+    @staticmethod
+    def url_hash(url):
+        return entry_hash([canonical_url(url)])
+
+    # None for an empty title, which never counts as a duplicate
+    @staticmethod
+    def title_hash(title):
+        title = normalized_title(title or '')
+        return entry_hash([title]) if title else None
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Index of processed rows (dicts with 'url' and 'title'), as sorted arrays"""
+        url_hashes, title_hashes = set(), set()
+        for row in rows:
+            url_hashes.add(cls.url_hash(row.get('url', '')))
+            title_hash = cls.title_hash(row.get('title', ''))
+            if title_hash is not None:
+                title_hashes.add(title_hash)
+        return cls(np.array(sorted(url_hashes), dtype=np.uint64), np.array(sorted(title_hashes), dtype=np.uint64))
+
+    @staticmethod
+    def _has(loaded, added, key):
+        if key in added:
+            return True
+        i = np.searchsorted(loaded, np.uint64(key))
+        return i < len(loaded) and int(loaded[i]) == key
+
+    def contains(self, url, title):
+        if self._has(self.loaded_urls, self.added_urls, self.url_hash(url)):
+            return True
+        title_hash = self.title_hash(title)
+        return title_hash is not None and self._has(self.loaded_titles, self.added_titles, title_hash)
+
+    def add(self, url, title):
+        self.added_urls.add(self.url_hash(url))
+        title_hash = self.title_hash(title)
+        if title_hash is not None:
+            self.added_titles.add(title_hash)
+
+    def __len__(self):
+        return len(self.loaded_urls) + len(self.added_urls)
+
+
+def parse_processed_row(row):
+    tags = re.sub('\'', '"', row['tags'])
+    authors = re.sub('\'', '"', row['authors'])
+    try:
+        return {
+            'title': row['title'],
+            'url': row['url'],
+            'authors': json.loads(authors),
+            'timestamp': row['timestamp'],
+            'tags': json.loads(tags)
+        }
+    except:
+        return {
+            'title': row['title'],
+            'url': row['url'],
+            'authors': [],
+            'timestamp': row['timestamp'],
+            'tags': json.loads(tags)
+        }
 
 def load_processed_to_dict(file_path):
     data_dict = {}
@@ -62,49 +308,34 @@ def load_processed_to_dict(file_path):
         csv_reader = csv.DictReader(csv_file)  # Read rows as dictionaries
         for row in csv_reader:
             row_id = int(row['ID'])  # Use the 'ID' column as the key
-            tags = re.sub('\'', '"', row['tags'])
-            authors = re.sub('\'', '"', row['authors'])
-            try:
-                data_dict[row_id] = {
-                    'title': row['title'],
-                    'url': row['url'],
-                    'authors': json.loads(authors),
-                    'timestamp': row['timestamp'],
-                    'tags': json.loads(tags)
-                }
-            except:
-                data_dict[row_id] = {
-                    'title': row['title'],
-                    'url': row['url'],
-                    'authors': [],
-                    'timestamp': row['timestamp'],
-                    'tags': json.loads(tags)
-                }
+            data_dict[row_id] = parse_processed_row(row)
     print("Processed data loaded!")
     return data_dict
 
+def parse_scrapped_row(row):
+    return {
+        'url': row['URL'],
+        'description': row['Description'],
+        'member only': row['Member Only'],
+        'code': row['Code']
+    }
+
 def load_scrapped_to_dict(file_path):
     data_dict = {}
     with open(file_path, 'r', encoding='utf-8') as csv_file:
         csv_reader = csv.DictReader(csv_file)  # Read rows as dictionaries 
         for row in csv_reader:
             row_id = int(row['ID'])  # Use the 'ID' column as the key
-            data_dict[row_id] = {
-                'url': row['URL'],
-                'description': row['Description'],
-                'member only': row['Member Only'],
-                'code': row['Code']
-            }
+            data_dict[row_id] = parse_scrapped_row(row)
     print("Scrapped data loaded!")
     return data_dict
 
-def calculate_lengths():
-    with open('datasets/medium_articles.csv', 'r', encoding='utf-8') as infile, \
-        open('indexes/lengths.csv', 'w', newline='', encoding='utf-8') as outfile:
-        reader = csv.DictReader(infile)
+# Word counts by row number, for indexes built before iterate_dataset recorded lengths itself
+def calculate_lengths(dataset_file=csv_file):
+    with open(lengths_file, 'w', newline='', encoding='utf-8') as outfile:
         writer = csv.DictWriter(outfile, fieldnames=['ID', 'length'])
         writer.writeheader()
-        for idx, row in enumerate(reader, start=1):
+        for idx, row in enumerate(read_dataset(dataset_file), start=1):
             text = row.get('text', '')
             word_count = len(text.split())
             writer.writerow({'ID': idx, 'length': word_count})
@@ -120,3 +351,12 @@ def load_lengths(file_path):
     print("Lengths data loaded!")
     return data_dict
 
+
+# Lengths as an array indexed by doc id (0 for unknown ids), used for the block-max tables
+def load_length_array(file_path):
+    if not os.path.exists(file_path):
+        return None
+    lengths_dict = load_lengths(file_path)
+    lengths = np.zeros(max(lengths_dict, default=0) + 1, dtype=np.uint32)
+    lengths[list(lengths_dict.keys())] = list(lengths_dict.values())
+    return lengths
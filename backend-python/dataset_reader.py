@@ -0,0 +1,89 @@
+import csv
+import gzip
+import io
+import json
+from config import ingest_chunk_rows
+
+# Optional: zstd-compressed datasets need `zstandard`, Parquet datasets need `pyarrow`
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+#
+#   STREAMING DATASET READER
+#
+#   Rows come out one at a time as dicts of strings with the CSV dataset's columns, whatever the
+#   format: CSV or JSON Lines (plain, .gz or .zst) and Parquet (read in record batches). Only one
+#   chunk of rows is held in memory at a time.
+#
+DATASET_COLUMNS = ('title', 'text', 'url', 'authors', 'timestamp', 'tags')
+
+
+# Text stream of a possibly compressed file
+def open_text(file_name):
+    if file_name.endswith('.gz'):
+        return gzip.open(file_name, 'rt', encoding='utf-8', newline='')
+    if file_name.endswith(('.zst', '.zstd')):
+        if zstandard is None:
+            raise ImportError(f"Reading {file_name} needs the zstandard package (pip install zstandard)")
+        raw = open(file_name, 'rb')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True), encoding='utf-8', newline='')
+    return open(file_name, 'r', encoding='utf-8', newline='')
+
+
+def dataset_format(file_name):
+    name = file_name.lower()
+    for suffix in ('.gz', '.zst', '.zstd'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    if name.endswith('.parquet'):
+        return 'parquet'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return 'csv'
+
+
+# Lists (authors, tags) are stored the way the CSV dataset writes them: "['a', 'b']"
+def normalize_row(record):
+    row = {}
+    for column in DATASET_COLUMNS:
+        value = record.get(column)
+        if value is None:
+            value = [] if column in ('authors', 'tags') else ''
+        row[column] = value if isinstance(value, str) else str(value)
+    return row
+
+
+def read_csv(file_name):
+    with open_text(file_name) as file:
+        yield from csv.DictReader(file)
+
+def read_jsonl(file_name):
+    with open_text(file_name) as file:
+        for line in file:
+            if line.strip():
+                yield normalize_row(json.loads(line))
+
+def read_parquet(file_name, chunk_rows):
+    if pq is None:
+        raise ImportError(f"Reading {file_name} needs the pyarrow package (pip install pyarrow)")
+    parquet_file = pq.ParquetFile(file_name)
+    columns = [column for column in DATASET_COLUMNS if column in parquet_file.schema_arrow.names]
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+        for record in batch.to_pylist():
+            yield normalize_row(record)
+
+
+def read_dataset(file_name, chunk_rows=ingest_chunk_rows):
+    """Stream the rows of a dataset file (format picked from its extension)"""
+    file_format = dataset_format(file_name)
+    if file_format == 'parquet':
+        return read_parquet(file_name, chunk_rows)
+    if file_format == 'jsonl':
+        return read_jsonl(file_name)
+    return read_csv(file_name)
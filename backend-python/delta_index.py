@@ -0,0 +1,251 @@
+import csv
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+import numpy as np
+from segments import Segment, SegmentWriter, PostingList, segment_file
+from index_builder import BarrelWriter
+from csv_utils import load_length_array
+from config import barrel_size, lengths_file
+
+#
+#   DELTA SEGMENT (log-structured updates for uploaded articles)
+#
+#   Uploaded documents are appended to a log and kept in memory, where searches see them at once
+#   (each change is published as a new index generation, see generations.py). Compaction freezes
+#   the current delta, merges it into the base barrels (CSV, offsets and segment, one rewrite per
+#   touched barrel) and then drops it. Log lines look like
+#   {"doc_id": 7, "words": {"12": [frequency, positions, sources]}, "new_words": {"kubectl": 12}},
+#   "new_words" being the words the document added to the lexicon (written to lexicon.csv after the line).
+#
+#   delta.log             documents added since the last freeze
+#   delta.log.compacting  the frozen delta being merged; replayed at startup if a compaction was cut short
+#
+
+
+class DeltaView:
+    """The delta as one index generation sees it (never changed once published)."""
+
+    __slots__ = ('active', 'frozen')
+
+    def __init__(self, active=None, frozen=None):
+        self.active = active or {}  # word_id -> {doc_id: (frequency, positions, sources)}
+        self.frozen = frozen or {}  # the same, for the delta being compacted
+
+    # Delta postings of a word (None if no recent document has it)
+    def postings(self, word_id):
+        entries = {**self.frozen.get(word_id, {}), **self.active.get(word_id, {})}
+        if not entries:
+            return None
+        doc_ids = sorted(entries)
+        return PostingList.from_lists(word_id, doc_ids, [entries[doc_id][0] for doc_id in doc_ids],
+                                      [entries[doc_id][1] for doc_id in doc_ids], [entries[doc_id][2] for doc_id in doc_ids])
+
+    # Base postings with the delta's on top (a document in both is taken from the delta)
+    # Only the delta's few documents are looked up in the base; positions are gathered if someone asks
+    def merge(self, base, word_id):
+        delta = self.postings(word_id)
+        if delta is None:
+            return base
+        if base is None or not len(base):
+            return delta
+        keep = np.ones(len(base), dtype=bool)
+        found = np.minimum(np.searchsorted(base.doc_ids, delta.doc_ids), len(base) - 1)
+        keep[found[base.doc_ids[found] == delta.doc_ids]] = False
+        doc_ids = np.concatenate([base.doc_ids[keep], delta.doc_ids])
+        frequencies = np.concatenate([base.frequencies[keep], delta.frequencies])
+        order = np.argsort(doc_ids, kind='stable')
+        return PostingList(word_id, doc_ids[order], frequencies[order],
+                           np.concatenate([base.masks[keep], delta.masks])[order],
+                           gather_positions=lambda: merged_positions(base, delta, keep, order))
+
+
+# Flat positions of a merged posting list: every document's run of positions, copied in one gather
+def merged_positions(base, delta, keep, order):
+    if base.flat_positions is None:
+        return None
+    base_starts = np.cumsum(base.frequencies, dtype=np.int64) - base.frequencies
+    delta_starts = np.cumsum(delta.frequencies, dtype=np.int64) - delta.frequencies + len(base.flat_positions)
+    starts = np.concatenate([base_starts[keep], delta_starts])[order]
+    lengths = np.concatenate([base.frequencies[keep], delta.frequencies])[order].astype(np.int64)
+    output_starts = np.cumsum(lengths) - lengths
+    source = np.concatenate([base.flat_positions, delta.flat_positions])
+    return source[np.repeat(starts - output_starts, lengths) + np.arange(int(lengths.sum()))]
+
+
+class DeltaIndex:
+    """Recently added documents, searchable before they are merged into the base barrels."""
+
+    # Every change is published to `generations` (IndexGenerations) as a new DeltaView
+    def __init__(self, log_file, inverted_index_folder, generations):
+        self.log_file = log_file
+        self.frozen_file = log_file + '.compacting'
+        self.inverted_index_folder = inverted_index_folder
+        self.generations = generations
+        self.lock = threading.Lock()
+        self.compaction_lock = threading.Lock()
+        # Copied on write, so published views never change under a search
+        self.active = {}  # word_id -> {doc_id: (frequency, positions, sources)}
+        self.frozen = {}  # the same, for the delta being compacted
+        self.active_docs = set()
+        self.frozen_docs = set()
+        self.replayed_words = {}  # word -> word_id, new words of the replayed documents (see save_word_ids)
+
+        # Replay what was logged but not compacted yet (an interrupted compaction is simply redone)
+        for file_name, table, docs in ((self.frozen_file, self.frozen, self.frozen_docs),
+                                       (self.log_file, self.active, self.active_docs)):
+            for doc_id, words, new_words in self._read_log(file_name):
+                for word_id, (frequency, positions, sources) in words.items():
+                    table.setdefault(word_id, {})[doc_id] = (frequency, positions, sources)
+                docs.add(doc_id)
+                self.replayed_words.update(new_words)
+        if self.active_docs or self.frozen_docs:
+            print(f"Delta index replayed with {len(self.active_docs) + len(self.frozen_docs)} documents")
+        generations.publish(delta=self.view())
+
+    @staticmethod
+    def _read_log(file_name):
+        if not os.path.exists(file_name):
+            return
+        with open(file_name, 'r+b') as file:
+            while True:
+                line_start = file.tell()
+                line = file.readline()
+                if not line:
+                    return
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-append, cut off so later appends start clean
+                    file.truncate(line_start)
+                    return
+                yield entry['doc_id'], {int(word_id): data for word_id, data in entry['words'].items()}, entry.get('new_words', {})
+
+    def view(self):
+        return DeltaView(self.active, self.frozen)
+
+    @property
+    def document_count(self):
+        return len(self.active_docs | self.frozen_docs)
+
+    def add_document(self, doc_id, words, new_words=None):
+        """Log and insert one document, words being {word_id: (frequency, positions, sources)} and new_words {word: word_id}"""
+        entry = {'doc_id': doc_id, 'words': {str(word_id): list(data) for word_id, data in words.items()}}
+        if new_words:
+            entry['new_words'] = new_words
+        line = json.dumps(entry)
+        with self.lock:
+            with open(self.log_file, 'a', encoding='utf-8') as file:
+                file.write(line + '\n')
+                file.flush()
+                os.fsync(file.fileno())
+            active = dict(self.active)
+            for word_id, (frequency, positions, sources) in words.items():
+                active[word_id] = {**active.get(word_id, {}), doc_id: (frequency, positions, sources)}
+            self.active = active
+            self.active_docs = self.active_docs | {doc_id}
+            self.generations.publish(delta=self.view())
+
+    ###
+    ### Compaction
+    ###
+    def compact(self, on_barrel_compacted=None):
+        """Merge the delta into the base barrels; returns the barrels rewritten"""
+        with self.compaction_lock:
+            with self.lock:
+                # Freeze the current delta (unless a frozen one was left by an interrupted compaction)
+                if not self.frozen_docs:
+                    if not self.active_docs:
+                        return []
+                    if os.path.exists(self.log_file):
+                        os.replace(self.log_file, self.frozen_file)
+                    self.frozen, self.active = self.active, {}
+                    self.frozen_docs, self.active_docs = self.active_docs, set()
+                frozen = self.frozen
+
+            by_barrel = defaultdict(dict)
+            for word_id, entries in frozen.items():
+                by_barrel[word_id // barrel_size][word_id] = entries
+
+            # New segments are mapped right away; the new CSV barrels are kept aside for now
+            lengths = load_length_array(lengths_file)
+            barrel_writers = [compact_barrel(self.inverted_index_folder, barrel_num, by_barrel[barrel_num], lengths)
+                              for barrel_num in sorted(by_barrel)]
+            segments = self.generations.current.segments.with_reloaded(sorted(by_barrel))
+
+            # The new segments and the delta without the frozen documents go out as one generation
+            with self.lock:
+                self.frozen = {}
+                self.frozen_docs = set()
+                generation = self.generations.publish(segments=segments, delta=self.view())
+            if on_barrel_compacted is not None:
+                for barrel_num in sorted(by_barrel):
+                    on_barrel_compacted(barrel_num, list(by_barrel[barrel_num]))
+
+            # Searches pinned to older generations may still read the old CSV barrels
+            self.generations.wait_for_readers(generation)
+            for barrel_writer in barrel_writers:
+                barrel_writer.publish()
+
+            # Everything frozen is in the base barrels now
+            if os.path.exists(self.frozen_file):
+                os.remove(self.frozen_file)
+            print(f"Compacted the delta index into {len(by_barrel)} barrels")
+            return sorted(by_barrel)
+
+
+# Merge delta postings {word_id: {doc_id: (frequency, positions, sources)}} into one barrel, streaming
+# its CSV rows (in word id order) into a new segment and a new CSV and offsets file; returns the
+# BarrelWriter, whose files are only swapped in by its publish()
+def compact_barrel(inverted_index_folder, barrel_num, updates, lengths=None):
+    csv_file = f'{inverted_index_folder}/inverted_{barrel_num}.csv'
+    pending = sorted(updates)
+
+    def merged_row(word_id, doc_ids, frequencies, positions, sources):
+        postings = dict(zip(doc_ids, zip(frequencies, positions, sources)))
+        postings.update(updates[word_id])
+        doc_ids = sorted(postings)
+        return [word_id, doc_ids, [postings[doc_id][0] for doc_id in doc_ids],
+                [postings[doc_id][1] for doc_id in doc_ids], [postings[doc_id][2] for doc_id in doc_ids]]
+
+    def rows():
+        next_update = 0
+        if os.path.exists(csv_file):
+            with open(csv_file, 'r', newline='', encoding='utf-8') as file:
+                reader = csv.reader(file)
+                next(reader, None)
+                for row in reader:
+                    if len(row) < 5:
+                        continue
+                    word_id = int(row[0])
+                    # Words only the delta has come before the first base word after them
+                    while next_update < len(pending) and pending[next_update] < word_id:
+                        yield merged_row(pending[next_update], [], [], [], [])
+                        next_update += 1
+                    if next_update < len(pending) and pending[next_update] == word_id:
+                        next_update += 1
+                        yield merged_row(word_id, json.loads(row[1]), json.loads(row[2]), json.loads(row[3]),
+                                         json.loads(re.sub("'", '"', row[4])))
+                    else:
+                        yield row
+        for word_id in pending[next_update:]:
+            yield merged_row(word_id, [], [], [], [])
+
+    # Unchanged words are copied from the current segment instead of being parsed again
+    seg_file = segment_file(inverted_index_folder, barrel_num)
+    base_segment = Segment(seg_file) if os.path.exists(seg_file) else None
+
+    with BarrelWriter(csv_file, deferred=True) as barrel_writer, SegmentWriter(seg_file, lengths) as segment_writer:
+        for row in rows():
+            barrel_writer.writerow(row)
+            if not isinstance(row[1], str):
+                segment_writer.add(PostingList.from_lists(*row))
+                continue
+            postings = base_segment.postings(int(row[0])) if base_segment is not None else None
+            if postings is None:
+                postings = PostingList.from_lists(int(row[0]), json.loads(row[1]), json.loads(row[2]), json.loads(row[3]),
+                                                  json.loads(re.sub("'", '"', row[4])))
+            segment_writer.add(postings)
+    return barrel_writer
@@ -0,0 +1,462 @@
+import os
+import io
+import csv
+import json
+import mmap
+import shutil
+import numpy as np
+from collections.abc import MutableMapping
+from csv_utils import load_processed_to_dict, load_scrapped_to_dict, load_lengths, parse_processed_row, parse_scrapped_row, DuplicateIndex
+
+DOC_STORE_VERSION = 2  # 2: duplicate check hashes (url_hashes, title_hashes)
+META_FILE = 'meta.json'
+
+# Result field -> (table, key in that table's row dicts)
+FIELDS = {
+    'title': ('processed', 'title'),
+    'url': ('processed', 'url'),
+    'authors': ('processed', 'authors'),
+    'timestamp': ('processed', 'timestamp'),
+    'tags': ('processed', 'tags'),
+    'thumbnail': ('scraped', 'url'),
+    'description': ('scraped', 'description'),
+    'member': ('scraped', 'member only'),
+    'code': ('scraped', 'code'),
+}
+STRING_FIELDS = ('title', 'url', 'timestamp', 'thumbnail', 'description')  # Offset-indexed heaps
+LIST_FIELDS = ('tags', 'authors')                                           # Interned id lists
+INTERNED_FIELDS = ('member', 'code')                                        # One interned id per doc
+TABLES = ('processed', 'scraped', 'lengths')
+
+MISSING = -1  # Interned id / length of a document without a row in that table
+
+
+###
+### Column files
+###
+def _path(folder, name):
+    return os.path.join(folder, name)
+
+def _map_file(file_name):
+    with open(file_name, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class StringColumn:
+    """UTF-8 strings stored back to back in a heap, the i-th spanning offsets[i]:offsets[i + 1] (after `base`)."""
+
+    def __init__(self, offsets, heap, base=0):
+        self.offsets = offsets
+        self.heap = heap
+        self.base = base
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.heap[self.base + int(self.offsets[i]):self.base + int(self.offsets[i + 1])].decode('utf-8')
+
+
+class ListColumn:
+    """Per-document lists of interned strings (tags, authors)."""
+
+    def __init__(self, vocab, offsets, ids):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.ids = ids
+
+    def __getitem__(self, i):
+        return [self.vocab[int(j)] for j in self.ids[int(self.offsets[i]):int(self.offsets[i + 1])]]
+
+
+class FolderColumns:
+    """Columns stored as one .npy (arrays) or raw file (string heaps) each, as written by build_doc_store."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(_path(folder, META_FILE)) as file:
+            self.meta = json.load(file)
+
+    def array(self, name):
+        return np.load(_path(self.folder, f'{name}.npy'), mmap_mode='r')
+
+    def strings(self, name):
+        return StringColumn(self.array(f'{name}.offsets'), _map_file(_path(self.folder, f'{name}.heap')))
+
+
+class StringColumnWriter:
+    def __init__(self):
+        self.heap = bytearray()
+        self.offsets = [0]
+
+    def append(self, value):
+        self.heap += value.encode('utf-8')
+        self.offsets.append(len(self.heap))
+
+    def columns(self, name):
+        return {f'{name}.offsets': np.array(self.offsets, dtype=np.uint64), f'{name}.heap': bytes(self.heap)}
+
+
+class InternedWriter:
+    def __init__(self):
+        self.ids = {}
+        self.vocab = StringColumnWriter()
+
+    def intern(self, value):
+        value = str(value)
+        if value not in self.ids:
+            self.ids[value] = len(self.ids)
+            self.vocab.append(value)
+        return self.ids[value]
+
+
+class ListColumnWriter(InternedWriter):
+    def __init__(self):
+        super().__init__()
+        self.flat_ids = []
+        self.offsets = [0]
+
+    def append(self, values):
+        self.flat_ids.extend(self.intern(value) for value in values)
+        self.offsets.append(len(self.flat_ids))
+
+    def columns(self, name):
+        columns = self.vocab.columns(f'{name}.vocab')
+        columns[f'{name}.offsets'] = np.array(self.offsets, dtype=np.uint64)
+        columns[f'{name}.ids'] = np.array(self.flat_ids, dtype=np.uint32)
+        return columns
+
+
+# The first `count` strings of a column followed by the strings of a written column (offsets, heap)
+def _join_strings(column, count, tail_offsets, tail_heap):
+    end = int(column.offsets[count])
+    offsets = np.concatenate([np.asarray(column.offsets[:count + 1], dtype=np.uint64), tail_offsets[1:] + np.uint64(end)])
+    return offsets, bytes(column.heap[column.base:column.base + end]) + tail_heap
+
+
+###
+### Offline build
+###
+def _source_sizes(processed_file, scrapped_file, lengths_file):
+    return {
+        'processed': [processed_file, os.path.getsize(processed_file)],
+        'scraped': [scrapped_file, os.path.getsize(scrapped_file)],
+        'lengths': [lengths_file, os.path.getsize(lengths_file)],
+    }
+
+class ColumnsWriter:
+    """Columns of consecutive documents, appended one at a time (rows as the CSV loaders produce them, None if missing)."""
+
+    def __init__(self):
+        self.strings = {name: StringColumnWriter() for name in STRING_FIELDS}
+        self.lists = {name: ListColumnWriter() for name in LIST_FIELDS}
+        self.interned = {name: InternedWriter() for name in INTERNED_FIELDS}
+        self.interned_ids = {name: [] for name in INTERNED_FIELDS}
+        self.has_processed = []
+        self.lengths = []
+
+    def append(self, processed, scraped, length):
+        rows = {'processed': processed, 'scraped': scraped}
+        for name, (table, key) in FIELDS.items():
+            row = rows[table]
+            if name in STRING_FIELDS:
+                self.strings[name].append(str(row[key]) if row else '')
+            elif name in LIST_FIELDS:
+                self.lists[name].append(row[key] if row else [])
+            else:
+                self.interned_ids[name].append(self.interned[name].intern(row[key]) if row else MISSING)
+        self.has_processed.append(processed is not None)
+        self.lengths.append(length if length is not None else MISSING)
+
+    def columns(self):
+        columns = {'processed': np.array(self.has_processed, dtype=bool), 'lengths': np.array(self.lengths, dtype=np.int32)}
+        for name, writer in self.strings.items():
+            columns.update(writer.columns(name))
+        for name, writer in self.lists.items():
+            columns.update(writer.columns(name))
+        for name, writer in self.interned.items():
+            columns.update(writer.vocab.columns(f'{name}.vocab'))
+            columns[name] = np.array(self.interned_ids[name], dtype=np.int32)
+        return columns
+
+
+def build_doc_store_columns(processed_file, scrapped_file, lengths_file):
+    """Columns (name -> array, or bytes for string heaps) and metadata for everything currently in the three CSVs"""
+    # Sizes are taken first: rows appended while building are picked up again as a tail, never lost
+    sources = _source_sizes(processed_file, scrapped_file, lengths_file)
+    processed = load_processed_to_dict(processed_file)
+    scraped = load_scrapped_to_dict(scrapped_file)
+    lengths = load_lengths(lengths_file)
+    size = max(max(table, default=0) for table in (processed, scraped, lengths)) + 1
+
+    writer = ColumnsWriter()
+    for doc_id in range(size):
+        writer.append(processed.get(doc_id), scraped.get(doc_id), lengths.get(doc_id))
+    columns = writer.columns()
+
+    # Sorted hashes of canonical URLs and normalized titles, so the duplicate check needs no scan
+    duplicates = DuplicateIndex.from_rows(processed.values())
+    columns['url_hashes'] = duplicates.loaded_urls
+    columns['title_hashes'] = duplicates.loaded_titles
+    meta = {
+        'version': DOC_STORE_VERSION,
+        'size': size,
+        'counts': {'processed': len(processed), 'scraped': len(scraped), 'lengths': len(lengths)},
+        'sources': sources,
+    }
+    return columns, meta
+
+def build_doc_store(folder, processed_file, scrapped_file, lengths_file):
+    """Write the columnar store for everything currently in the three CSVs"""
+    columns, meta = build_doc_store_columns(processed_file, scrapped_file, lengths_file)
+
+    # Written next to the live store and swapped in at the end
+    temp_folder = folder + '.tmp'
+    shutil.rmtree(temp_folder, ignore_errors=True)
+    os.makedirs(temp_folder)
+    for name, column in columns.items():
+        if isinstance(column, bytes):
+            with open(_path(temp_folder, name), 'wb') as file:
+                file.write(column)
+        else:
+            np.save(_path(temp_folder, f'{name}.npy'), column)
+    with open(_path(temp_folder, META_FILE), 'w') as file:
+        json.dump(meta, file)
+
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(temp_folder, folder)
+    print(f"Document store built with {meta['counts']['processed']} documents")
+
+
+###
+### Reader
+###
+def _read_csv_tail(file_name, offset):
+    """Rows appended to a CSV after byte `offset` (the header is read from the start of the file)"""
+    with open(file_name, 'r', encoding='utf-8', newline='') as file:
+        fieldnames = next(csv.reader(file))
+    with open(file_name, 'rb') as file:
+        file.seek(offset)
+        yield from csv.DictReader(io.TextIOWrapper(file, encoding='utf-8', newline=''), fieldnames=fieldnames)
+
+
+class DocStore:
+    """
+    Memory-mapped document metadata (processed, scraped and lengths tables) built by build_doc_store.py,
+    read from a FolderColumns or from the columns embedded in a snapshot.
+
+    Fields are read straight from the columns, so a row dict is only built for documents that are
+    rendered. Documents added after the build (uploads, or CSV rows appended since) live in small
+    per-table overlays. `processed_docs`, `scraped_docs` and `doc_lengths` are dict-like views for
+    the code that used to receive the three dicts.
+    """
+
+    def __init__(self, columns):
+        self.meta = columns.meta
+        if self.meta['version'] != DOC_STORE_VERSION:
+            raise ValueError(f"Unsupported document store version {self.meta['version']}")
+        self.size = self.meta['size']
+        self.strings = {name: columns.strings(name) for name in STRING_FIELDS}
+        self.lists = {name: ListColumn(columns.strings(f'{name}.vocab'), columns.array(f'{name}.offsets'), columns.array(f'{name}.ids'))
+                      for name in LIST_FIELDS}
+        self.interned_ids = {name: columns.array(name) for name in INTERNED_FIELDS}
+        self.interned_vocab = {}
+        for name in INTERNED_FIELDS:
+            vocab = columns.strings(f'{name}.vocab')
+            self.interned_vocab[name] = [vocab[i] for i in range(len(vocab))]
+        self.has_processed = columns.array('processed')
+        self.length_column = columns.array('lengths')
+        self.duplicates = DuplicateIndex(columns.array('url_hashes'), columns.array('title_hashes'))
+
+        self.overlays = {table: {} for table in TABLES}
+        self.processed_docs = DocStoreView(self, 'processed')
+        self.scraped_docs = DocStoreView(self, 'scraped')
+        self.doc_lengths = DocStoreView(self, 'lengths')
+
+    @classmethod
+    def open(cls, folder, processed_file, scrapped_file, lengths_file):
+        """Open the store, building it first if missing or if a CSV was rewritten since, and load appended rows"""
+        store = None
+        if os.path.exists(_path(folder, META_FILE)):
+            columns = FolderColumns(folder)
+            if columns.meta['version'] != DOC_STORE_VERSION:
+                print(f"Document store version {columns.meta['version']} is outdated, rebuilding it")
+            else:
+                store = cls(columns)
+                if not store.sources_intact():
+                    print("Source CSVs shrank since the document store was built, rebuilding it")
+                    store = None
+        if store is None:
+            build_doc_store(folder, processed_file, scrapped_file, lengths_file)
+            store = cls(FolderColumns(folder))
+        store.load_appended_rows()
+        return store
+
+    # False if a source CSV is now shorter than when the columns were built (rewritten, not appended to)
+    def sources_intact(self):
+        return all(os.path.exists(file_name) and os.path.getsize(file_name) >= size
+                   for file_name, size in self.meta['sources'].values())
+
+    # Rows appended to the CSVs after the build (e.g. uploads) go to the overlays
+    def load_appended_rows(self):
+        parsers = {
+            'processed': parse_processed_row,
+            'scraped': parse_scrapped_row,
+            'lengths': lambda row: int(row['length']),
+        }
+        for table, (file_name, size) in self.meta['sources'].items():
+            if os.path.getsize(file_name) > size:
+                for row in _read_csv_tail(file_name, size):
+                    self.overlays[table][int(row['ID'])] = parsers[table](row)
+                    if table == 'processed':
+                        self.duplicates.add(row['url'], row['title'])
+
+    def _in_base(self, table, doc_id):
+        if not 0 <= doc_id < self.size:
+            return False
+        if table == 'processed':
+            return bool(self.has_processed[doc_id])
+        if table == 'scraped':
+            return self.interned_ids['member'][doc_id] != MISSING
+        return self.length_column[doc_id] != MISSING
+
+    def contains(self, table, doc_id):
+        return doc_id in self.overlays[table] or self._in_base(table, doc_id)
+
+    # One field of a document, read from its column (KeyError if the document has no row for it)
+    def field(self, doc_id, name):
+        table, key = FIELDS[name]
+        row = self.overlays[table].get(doc_id)
+        if row is not None:
+            return row[key]
+        if not self._in_base(table, doc_id):
+            raise KeyError(doc_id)
+        if name in STRING_FIELDS:
+            return self.strings[name][doc_id]
+        if name in LIST_FIELDS:
+            return self.lists[name][doc_id]
+        return self.interned_vocab[name][self.interned_ids[name][doc_id]]
+
+    def length(self, doc_id):
+        if doc_id in self.overlays['lengths']:
+            return self.overlays['lengths'][doc_id]
+        if not self._in_base('lengths', doc_id):
+            raise KeyError(doc_id)
+        return int(self.length_column[doc_id])
+
+    # Full row dict of a table, in the shape the old CSV loaders produced
+    def row(self, table, doc_id):
+        if table == 'lengths':
+            return self.length(doc_id)
+        return {key: self.field(doc_id, name) for name, (field_table, key) in FIELDS.items() if field_table == table}
+
+    def doc_ids(self, table):
+        overlay = self.overlays[table]
+        if table == 'processed':
+            present = self.has_processed
+        elif table == 'scraped':
+            present = self.interned_ids['member'] != MISSING
+        else:
+            present = self.length_column != MISSING
+        for doc_id in np.flatnonzero(present):
+            if int(doc_id) not in overlay:
+                yield int(doc_id)
+        yield from list(overlay)
+
+    def count(self, table):
+        added = sum(1 for doc_id in self.overlays[table] if not self._in_base(table, doc_id))
+        return self.meta['counts'][table] + added
+
+    # Lengths indexed by doc id, 0 for documents without one
+    def length_array(self):
+        size = max([self.size] + [doc_id + 1 for doc_id in self.overlays['lengths']])
+        lengths = np.zeros(size, dtype=np.int64)
+        lengths[:self.size] = np.maximum(self.length_column, 0)
+        for doc_id, length in self.overlays['lengths'].items():
+            lengths[doc_id] = length
+        return lengths
+
+    def columns(self):
+        """
+        Columns and metadata in the shape build_doc_store_columns returns, for everything in the store
+        (overlays included) without reading the CSVs: the mapped columns are copied up to the first
+        document an overlay touches, and only the documents from there on are rendered row by row.
+        Uploads only add new doc ids, so that is normally just the uploaded documents.
+        """
+        touched = [doc_id for overlay in self.overlays.values() for doc_id in overlay]
+        size = max([self.size] + [doc_id + 1 for doc_id in touched])
+        start = min([self.size] + touched)
+        writer = ColumnsWriter()
+        for doc_id in range(start, size):
+            writer.append(*(self.row(table, doc_id) if self.contains(table, doc_id) else None for table in TABLES))
+        tail = writer.columns()
+
+        columns = {
+            'processed': np.concatenate([self.has_processed[:start], tail['processed']]),
+            'lengths': np.concatenate([self.length_column[:start], tail['lengths']]),
+        }
+        for name in STRING_FIELDS:
+            columns[f'{name}.offsets'], columns[f'{name}.heap'] = _join_strings(
+                self.strings[name], start, tail[f'{name}.offsets'], tail[f'{name}.heap'])
+        # Vocabularies are the stored ones followed by the tail's (a value may then appear twice, which is harmless)
+        for name in LIST_FIELDS:
+            column = self.lists[name]
+            columns[f'{name}.vocab.offsets'], columns[f'{name}.vocab.heap'] = _join_strings(
+                column.vocab, len(column.vocab), tail[f'{name}.vocab.offsets'], tail[f'{name}.vocab.heap'])
+            end = int(column.offsets[start])
+            columns[f'{name}.offsets'] = np.concatenate([np.asarray(column.offsets[:start + 1], dtype=np.uint64),
+                                                         tail[f'{name}.offsets'][1:] + np.uint64(end)])
+            columns[f'{name}.ids'] = np.concatenate([np.asarray(column.ids[:end], dtype=np.uint32),
+                                                     tail[f'{name}.ids'] + np.uint32(len(column.vocab))])
+        for name in INTERNED_FIELDS:
+            vocab = StringColumnWriter()
+            for value in self.interned_vocab[name] + list(writer.interned[name].ids):
+                vocab.append(value)
+            columns.update(vocab.columns(f'{name}.vocab'))
+            ids = tail[name]
+            columns[name] = np.concatenate([self.interned_ids[name][:start],
+                                            np.where(ids == MISSING, MISSING, ids + len(self.interned_vocab[name])).astype(np.int32)])
+
+        duplicates = self.duplicates
+        columns['url_hashes'] = np.union1d(duplicates.loaded_urls, np.array(sorted(duplicates.added_urls), dtype=np.uint64))
+        columns['title_hashes'] = np.union1d(duplicates.loaded_titles, np.array(sorted(duplicates.added_titles), dtype=np.uint64))
+        meta = {
+            'version': DOC_STORE_VERSION,
+            'size': size,
+            'counts': {table: self.count(table) for table in TABLES},
+            'sources': {table: [file_name, os.path.getsize(file_name)] for table, (file_name, _) in self.meta['sources'].items()},
+        }
+        return columns, meta
+
+
+class DocStoreView(MutableMapping):
+    """Dict-like view of one table; rows are rendered on access and writes go to the overlay."""
+
+    def __init__(self, store, table):
+        self.store = store
+        self.table = table
+
+    # Hash index for the upload path's duplicate check (kept up to date by medium_scraper.add_to_processed_dict)
+    @property
+    def duplicates(self):
+        return self.store.duplicates
+
+    def __getitem__(self, doc_id):
+        return self.store.row(self.table, doc_id)
+
+    def __setitem__(self, doc_id, value):
+        self.store.overlays[self.table][doc_id] = value
+
+    def __delitem__(self, doc_id):
+        del self.store.overlays[self.table][doc_id]
+
+    def __contains__(self, doc_id):
+        return isinstance(doc_id, (int, np.integer)) and self.store.contains(self.table, doc_id)
+
+    def __iter__(self):
+        return self.store.doc_ids(self.table)
+
+    def __len__(self):
+        return self.store.count(self.table)
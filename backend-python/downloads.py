@@ -1,8 +1,46 @@
+import os
 import nltk
+from config import nltk_data_folder
+
+# NLTK package -> resource path checked with nltk.data.find
+NLTK_RESOURCES = {
+    'punkt': 'tokenizers/punkt',
+    'punkt_tab': 'tokenizers/punkt_tab',
+    'stopwords': 'corpora/stopwords',
+    'wordnet': 'corpora/wordnet',
+}
 
 # NLTK downloads
-def download_nltk_resources():
-    nltk.download('punkt')
-    nltk.download('stopwords')
-    nltk.download('wordnet')
-    nltk.download('punkt_tab')
\ No newline at end of file
+def download_nltk_resources(download_dir=None):
+    for package in NLTK_RESOURCES:
+        nltk.download(package, download_dir=download_dir)
+
+
+def missing_nltk_resources():
+    missing = []
+    for package, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            missing.append(package)
+    return missing
+
+
+# Use the vendored data folder first and only download what is missing (never in offline mode)
+def ensure_nltk_resources(offline=False):
+    data_folder = os.path.abspath(nltk_data_folder)
+    if os.path.isdir(data_folder) and data_folder not in nltk.data.path:
+        nltk.data.path.insert(0, data_folder)
+
+    missing = missing_nltk_resources()
+    if not missing:
+        return
+    if offline:
+        raise RuntimeError(f"NLTK resources {missing} are missing and offline boot is on, vendor them with `python downloads.py`")
+    for package in missing:
+        nltk.download(package, quiet=True)
+
+
+if __name__ == '__main__':
+    # Vendoring the resources next to the code so the server can boot without network access
+    download_nltk_resources(nltk_data_folder)
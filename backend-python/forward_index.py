@@ -4,21 +4,20 @@ import os
 import json
 
 
-# Load existing forward index from a file
-def load_forward_barrel(file_name):
-    forward_barrel = {}
-    if os.path.exists(file_name):
-        with open(file_name, mode='r', encoding='utf-8') as file:
-            csv_reader = csv.DictReader(file)
-            for row in csv_reader:
-                doc_id = int(row['DocID'])
-                word_ids = json.loads(row['WordIDs'])  # Convert string to list
-                frequencies = json.loads(row['Frequencies'])
-                positions = json.loads(row['Positions'])
-                sources = re.sub('\'', '"', row['Sources'])
-                sources = json.loads(sources)  # New Sources column
-                forward_barrel[doc_id] = [word_ids, frequencies, positions, sources]
-    return forward_barrel
+# Stream (doc id, word ids, frequencies, positions, sources) rows of a forward barrel
+def iterate_forward_barrel(file_name):
+    if not os.path.exists(file_name):
+        return
+    with open(file_name, mode='r', encoding='utf-8') as file:
+        csv_reader = csv.DictReader(file)
+        for row in csv_reader:
+            doc_id = int(row['DocID'])
+            word_ids = json.loads(row['WordIDs'])  # Convert string to list
+            frequencies = json.loads(row['Frequencies'])
+            positions = json.loads(row['Positions'])
+            sources = re.sub('\'', '"', row['Sources'])
+            sources = json.loads(sources)  # New Sources column
+            yield doc_id, word_ids, frequencies, positions, sources
 
 
 # Save forward index to a file
@@ -41,4 +40,6 @@ def save_forward_index(forward_index, folder_name):
                 sources = [data['sources'] for data in word_data.values()]
                 forward_entries.append([doc_id, word_ids, frequencies, positions, sources])
                 
-            writer.writerows(forward_entries)
\ No newline at end of file
+            writer.writerows(forward_entries)
+            file.flush()
+            os.fsync(file.fileno())  # Durable before the doc id counter commits the batch
\ No newline at end of file
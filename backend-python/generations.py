@@ -0,0 +1,76 @@
+import threading
+from contextlib import contextmanager
+
+#
+#   INDEX GENERATIONS (snapshot isolation for searches)
+#
+#   A generation is one published version of what searches read: the mapped barrel segments and
+#   the delta index. A search pins the current generation when it starts and reads only from it,
+#   so an upload or a compaction publishing a newer one mid-query never shows it half-written
+#   barrels. Generations are never changed once published; a writer builds the next one aside and
+#   swaps it in at once. Old generations are dropped (and their mapped segments unmapped) when the
+#   last search pinning them is done, and writers that must replace files an old generation may
+#   still read (the CSV barrels) wait for that first.
+#
+
+
+class IndexGeneration:
+    """One published version of the index."""
+
+    __slots__ = ('number', 'segments', 'delta', 'readers')
+
+    def __init__(self, number, segments, delta):
+        self.number = number
+        self.segments = segments  # SegmentIndex
+        self.delta = delta        # DeltaView
+        self.readers = 0
+
+
+class IndexGenerations:
+    """The current generation, plus the older ones searches still have pinned."""
+
+    def __init__(self, segments, delta=None):
+        self.condition = threading.Condition()
+        self.current = IndexGeneration(0, segments, delta)
+        self.pinned = {}  # number -> generation, for generations with readers
+        self.published = 0
+
+    # Pin the current generation for the duration of a search
+    @contextmanager
+    def pin(self):
+        with self.condition:
+            generation = self.current
+            generation.readers += 1
+            self.pinned[generation.number] = generation
+        try:
+            yield generation
+        finally:
+            with self.condition:
+                generation.readers -= 1
+                if not generation.readers:
+                    del self.pinned[generation.number]
+                    self.condition.notify_all()
+
+    def publish(self, segments=None, delta=None):
+        """Swap in a new generation with the given parts replaced; returns it"""
+        with self.condition:
+            previous = self.current
+            self.current = IndexGeneration(previous.number + 1,
+                                           previous.segments if segments is None else segments,
+                                           previous.delta if delta is None else delta)
+            self.published += 1
+            return self.current
+
+    # Block until no search reads a generation older than `generation`
+    def wait_for_readers(self, generation, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: all(number >= generation.number for number in self.pinned), timeout)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'current': self.current.number,
+                'published': self.published,
+                'pinned': {number: generation.readers for number, generation in self.pinned.items()},
+            }
@@ -0,0 +1,313 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import aiohttp
+import requests
+from collections import namedtuple
+from requests.structures import CaseInsensitiveDict
+from config import http_cache_folder, http_cache_bytes, http_cache_fresh_seconds, http_cache_offline
+
+#
+#   ON-DISK HTTP RESPONSE CACHE (shared by the scrapers and /summarize-article)
+#
+#   objects/ab/abcdef...   response bodies, named by the SHA-256 of their content (pages that
+#                          came back identical are stored once)
+#   entries/12/1234....json  one entry per URL (named by the SHA-256 of the URL): status, validators
+#                          (ETag, Last-Modified), body hash, size, when it was stored; the file's
+#                          mtime is the last access, for LRU eviction
+#
+#   A stored page younger than `fresh_seconds` is served as is; an older one is revalidated with
+#   If-None-Match / If-Modified-Since and a 304 serves it again. Offline mode (HTTP_CACHE_OFFLINE=1)
+#   replays stored pages whatever their age and never touches the network, so scraper tests and
+#   benchmarks run without it. Only 200 responses are stored.
+#
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Date')
+
+
+class OfflineCacheMiss(requests.ConnectionError):
+    """A URL that is not in the cache was requested in offline mode."""
+
+
+class HttpCache:
+    """Content-addressed response bodies plus one small entry per URL, bounded by `max_bytes` of bodies."""
+
+    def __init__(self, folder, max_bytes, fresh_seconds, offline=False):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.current_bytes = None  # Counted on first store
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+
+    ###
+    ### Files
+    ###
+    @staticmethod
+    def _digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def _entry_file(self, url):
+        key = self._digest(url.encode('utf-8'))
+        return os.path.join(self.folder, 'entries', key[:2], key + '.json')
+
+    def _object_file(self, body_hash):
+        return os.path.join(self.folder, 'objects', body_hash[:2], body_hash)
+
+    @staticmethod
+    def _write_atomic(file_name, data):
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        temp_file = f'{file_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_file, 'wb') as file:
+            file.write(data)
+        os.replace(temp_file, file_name)
+
+    def _entries(self):
+        root = os.path.join(self.folder, 'entries')
+        if not os.path.isdir(root):
+            return
+        for bucket in os.scandir(root):
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith('.json'):
+                    yield entry
+
+    def _objects(self):
+        root = os.path.join(self.folder, 'objects')
+        if not os.path.isdir(root):
+            return
+        for bucket in os.scandir(root):
+            for item in os.scandir(bucket.path):
+                if not item.name.endswith('.tmp'):
+                    yield item
+
+    ###
+    ### Lookups
+    ###
+    def lookup(self, url):
+        """The stored entry of a URL (its last access is bumped), or None"""
+        entry_file = self._entry_file(url)
+        try:
+            with open(entry_file, 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+            if not os.path.exists(self._object_file(entry['body'])):
+                return None
+            os.utime(entry_file)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return self.offline or time.time() - entry['stored'] < self.fresh_seconds
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry['headers'].get('ETag'):
+            headers['If-None-Match'] = entry['headers']['ETag']
+        if entry['headers'].get('Last-Modified'):
+            headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    def body(self, entry):
+        with open(self._object_file(entry['body']), 'rb') as file:
+            return file.read()
+
+    ###
+    ### Updates
+    ###
+    def store(self, url, status, headers, body):
+        """Keep a 200 response; returns its entry"""
+        body_hash = self._digest(body)
+        object_file = self._object_file(body_hash)
+        added = 0
+        if not os.path.exists(object_file):
+            self._write_atomic(object_file, body)
+            added = len(body)
+        entry = {
+            'url': url,
+            'status': status,
+            'headers': {name: headers[name] for name in KEPT_HEADERS if headers.get(name)},
+            'body': body_hash,
+            'size': len(body),
+            'stored': time.time(),
+        }
+        self._write_atomic(self._entry_file(url), json.dumps(entry).encode('utf-8'))
+
+        with self.lock:
+            if self.current_bytes is None:
+                self.current_bytes = sum(item.stat().st_size for item in self._objects())
+            else:
+                self.current_bytes += added
+            over_budget = self.current_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+        return entry
+
+    # A 304: the stored page is current again (with any validators the server sent along)
+    def refresh(self, url, entry, headers):
+        for name in KEPT_HEADERS:
+            if headers.get(name):
+                entry['headers'][name] = headers[name]
+        entry['stored'] = time.time()
+        self._write_atomic(self._entry_file(url), json.dumps(entry).encode('utf-8'))
+        return entry
+
+    def evict(self):
+        """Drop the least recently used entries until the bodies fit in 90% of the budget"""
+        with self.lock:
+            entries = sorted(self._entries(), key=lambda item: item.stat().st_mtime)
+            referenced = {}
+            for item in entries:
+                try:
+                    with open(item.path, 'r', encoding='utf-8') as file:
+                        referenced[item.path] = json.load(file)['body']
+                except (OSError, ValueError):
+                    referenced[item.path] = None
+            objects = {item.name: item.stat().st_size for item in self._objects()}
+            users = {}
+            for body_hash in referenced.values():
+                users[body_hash] = users.get(body_hash, 0) + 1
+
+            # Bodies no entry points to (e.g. left by a crash between the two writes) go before any entry
+            for body_hash in [body_hash for body_hash in objects if not users.get(body_hash)]:
+                os.remove(self._object_file(body_hash))
+                objects.pop(body_hash)
+
+            total = sum(objects.values())
+            for item in entries:
+                if total <= 0.9 * self.max_bytes:
+                    break
+                body_hash = referenced[item.path]
+                os.remove(item.path)
+                self.evictions += 1
+                users[body_hash] = users.get(body_hash, 1) - 1
+                if body_hash in objects and users[body_hash] <= 0:
+                    os.remove(self._object_file(body_hash))
+                    total -= objects.pop(body_hash)
+            self.current_bytes = total
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.revalidated + self.misses
+            return {
+                'hits': self.hits,
+                'revalidated': self.revalidated,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.revalidated) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'offline': self.offline,
+            }
+
+    def count(self, outcome):
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+
+def cached_response(url, entry, body):
+    """A requests.Response for a stored page (iter_content, text, raise_for_status... all work)"""
+    response = requests.Response()
+    response.status_code = entry['status']
+    response.reason = 'OK'
+    response.url = url
+    response.headers = CaseInsensitiveDict(entry['headers'])
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response._content = body
+    response._content_consumed = True
+    return response
+
+
+_http_cache = None
+_http_cache_lock = threading.Lock()
+
+def get_http_cache():
+    global _http_cache
+    if _http_cache is None:
+        with _http_cache_lock:
+            if _http_cache is None:
+                _http_cache = HttpCache(http_cache_folder, http_cache_bytes, http_cache_fresh_seconds, http_cache_offline)
+    return _http_cache
+
+
+def cached_get(url, headers=None, timeout=15, cache=None):
+    """requests.get through the response cache (raises OfflineCacheMiss for an unknown URL in offline mode)"""
+    cache = cache or get_http_cache()
+    entry = cache.lookup(url)
+    if entry is not None and cache.is_fresh(entry):
+        cache.count('hits')
+        return cached_response(url, entry, cache.body(entry))
+    if cache.offline:
+        cache.count('misses')
+        raise OfflineCacheMiss(f"{url} is not in the HTTP cache (offline mode)")
+
+    request_headers = dict(headers or {})
+    if entry is not None:
+        request_headers.update(cache.conditional_headers(entry))
+    response = requests.get(url, headers=request_headers, timeout=timeout)
+    if entry is not None and response.status_code == 304:
+        cache.count('revalidated')
+        entry = cache.refresh(url, entry, response.headers)
+        return cached_response(url, entry, cache.body(entry))
+
+    cache.count('misses')
+    if response.status_code == 200:
+        cache.store(url, response.status_code, response.headers, response.content)
+    return response
+
+
+# A page fetched by cached_fetch (`cached` when it was served without asking the server)
+Page = namedtuple('Page', 'status headers body cached', defaults=(False,))
+
+class StoredContent:
+    """A body already in memory, read like aiohttp's response.content (iter_chunked) by readers written for live responses"""
+
+    def __init__(self, body):
+        self.body = body
+
+    async def iter_chunked(self, size):
+        for start in range(0, len(self.body), size):
+            yield self.body[start:start + size]
+
+    async def read(self):
+        return self.body
+
+
+async def cached_fetch(session, url, headers=None, timeout=15, cache=None, before_request=None):
+    """
+    cached_get over an aiohttp session; the cache's disk work runs in the default executor, off the event loop.
+    `before_request` is awaited right before the server is asked (e.g. a per-host rate limiter), never for a fresh hit.
+    """
+    cache = cache or get_http_cache()
+    loop = asyncio.get_running_loop()
+    entry = await loop.run_in_executor(None, cache.lookup, url)
+    if entry is not None and cache.is_fresh(entry):
+        cache.count('hits')
+        return Page(entry['status'], entry['headers'], await loop.run_in_executor(None, cache.body, entry), True)
+    if cache.offline:
+        cache.count('misses')
+        raise OfflineCacheMiss(f"{url} is not in the HTTP cache (offline mode)")
+
+    if before_request is not None:
+        await before_request()
+    request_headers = dict(headers or {})
+    if entry is not None:
+        request_headers.update(cache.conditional_headers(entry))
+    async with session.get(url, headers=request_headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+        status, response_headers = response.status, response.headers
+        body = await response.read()
+    if entry is not None and status == 304:
+        cache.count('revalidated')
+        entry = await loop.run_in_executor(None, cache.refresh, url, entry, response_headers)
+        return Page(entry['status'], entry['headers'], await loop.run_in_executor(None, cache.body, entry))
+
+    cache.count('misses')
+    if status == 200:
+        await loop.run_in_executor(None, cache.store, url, status, response_headers, body)
+    return Page(status, response_headers, body)
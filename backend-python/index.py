@@ -1,13 +1,13 @@
 # Comments GPT-ed, but hey, it does a decent job of explaining our unrecognizable code so why not
-import csv
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from csv_utils import load_latest_id, load_latest_doc_id, save_processed_docs, load_processed_entries
-from lexicon_utils import load_lexicon, preprocess_word, save_words_to_lexicon
+from csv_utils import load_latest_id, load_latest_doc_id, ProcessedDocsWriter, load_processed_entries, drop_uncommitted_rows, load_length_array
+from lexicon_utils import load_lexicon, save_words_to_lexicon
+from dataset_reader import read_dataset
+from analyzer import get_analyzer
 from forward_index import save_forward_index
-from inverted_index import update_inverted_barrel, create_offsets
-from config import forward_index_folder, inverted_index_folder
-import re
+from index_builder import build_inverted_barrel
+from config import forward_index_folder, inverted_index_folder, lengths_file, lemma_table_file, index_workers, index_batch_size
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 import ast
 import os
 
@@ -15,96 +15,120 @@ import os
 # Barrel size determines how many documents each forward index file contains (arbitrary)
 barrel_size = 1001
 
-# Function to process and iteratively index a dataset
-def iterate_dataset(dataset_file, lexicon_file):
-    # Load necessary resources: stop words, processed entries, and the lexicon
-    stop_words = set(stopwords.words('english'))
+# Function to process and iteratively index a dataset (returns the number of documents indexed)
+def iterate_dataset(dataset_file, lexicon_file, workers=index_workers):
+    # Load necessary resources: the analyzer (stop words, lemma table), processed entries, and the lexicon
+    analyzer = get_analyzer()
+    analyzer.load_lemma_table(lemma_table_file)
+    # The doc id counter is committed last: rows an interrupted run wrote past it are dropped first
+    drop_uncommitted_rows()
     processed_set = load_processed_entries()
     lexicon = load_lexicon(lexicon_file)
     latest_doc_id = load_latest_doc_id()
     latest_id = load_latest_id()
+    processed_writer = ProcessedDocsWriter()
+    indexed = 0
     
-    # Open the dataset file for reading
-    with open(dataset_file, mode='r', encoding='utf-8') as file:    
-        csv_reader = csv.DictReader(file)
-        forward_entries = []
-        lexicon_entries = []
-        
-        for row in csv_reader:
-            # Check if the current document has already been processed
-            current_entry = (row['title'], row['url'], row['authors'], row['timestamp'], row['tags'])
-            if current_entry in processed_set:
-                continue  # Skip already processed entries
-            
-            # Index the current dataset row and update IDs
-            latest_id, latest_doc_id = index_dataset(row, stop_words, latest_doc_id, latest_id, lexicon, lexicon_entries, forward_entries)
-
-            # Mark the document as processed and save it
-            processed_set.add(current_entry)
-            save_processed_docs([[latest_doc_id, row['title'], row['url'], row['authors'], row['timestamp'], row['tags']]], latest_doc_id)
-            
-            # Write batches of data to disk after every `barrel_size` documents
-            if latest_doc_id % barrel_size == 0:
-                save_words_to_lexicon(lexicon, lexicon_entries, latest_id)
-                save_forward_index(forward_entries, forward_index_folder)
-                lexicon_entries.clear()
-                forward_entries.clear()
-                print(f"Writing batch {latest_doc_id - barrel_size} to {latest_doc_id}...")
+    # Stream the dataset (CSV, JSON Lines or Parquet, possibly compressed) in a single pass
+    dataset_rows = read_dataset(dataset_file)
+    forward_entries = []
+    lexicon_entries = []
+    
+    # Rows are analyzed (possibly in worker processes) but ids are only ever assigned here, in file order
+    for row, combined_tokens, sources in analyzed_rows(new_rows(dataset_rows, processed_set), analyzer, workers):
+        latest_id, latest_doc_id = add_document(combined_tokens, sources, latest_doc_id, latest_id, lexicon, lexicon_entries, forward_entries)
+        indexed += 1
+
+        # Buffer the processed document and its length (written with the rest of its batch)
+        processed_writer.add([latest_doc_id, row['title'], row['url'], row['authors'], row['timestamp'], row['tags']], len(row['text'].split()))
         
-        # Save any remaining data after processing all rows
-        if forward_entries:
+        # Write batches of data to disk after every `barrel_size` documents, committing the processed rows last
+        if latest_doc_id % barrel_size == 0:
             save_words_to_lexicon(lexicon, lexicon_entries, latest_id)
             save_forward_index(forward_entries, forward_index_folder)
-            print(f"Writing batch {latest_doc_id - (latest_doc_id % barrel_size)} to {latest_doc_id}...")
+            processed_writer.commit(latest_doc_id)
+            lexicon_entries.clear()
+            forward_entries.clear()
+            print(f"Writing batch {latest_doc_id - barrel_size} to {latest_doc_id}...")
+    
+    # Save any remaining data after processing all rows
+    if forward_entries:
+        save_words_to_lexicon(lexicon, lexicon_entries, latest_id)
+        save_forward_index(forward_entries, forward_index_folder)
+        print(f"Writing batch {latest_doc_id - (latest_doc_id % barrel_size)} to {latest_doc_id}...")
+    if processed_writer.pending:
+        processed_writer.commit(latest_doc_id)
+    return indexed
 
 
-# Processing the tokens to encode their source and position in the articles
-def process_tokens(current_position, tokens, combined_tokens, sources, positions, type):
-    combined_tokens.extend(tokens)
-    sources.extend([type] * len(tokens))
-    positions.extend(list(range(current_position, current_position + len(tokens))))
-    return current_position + len(tokens)
+# Rows that have not been processed yet, marked as processed as they are handed out (same order as the file)
+def new_rows(rows, processed_set):
+    for row in rows:
+        current_entry = (row['title'], row['url'], row['authors'], row['timestamp'], row['tags'])
+        if current_entry in processed_set:
+            continue  # Skip already processed entries
+        processed_set.add(current_entry)
+        yield row
 
 
-# Function to index a single dataset row
-def index_dataset(row, stop_words, latest_doc_id, latest_id, lexicon, lexicon_entries, forward_entries):
-    pattern = r'[^A-Za-z0-9 ]+'
-    combined_tokens = []
-    
-    # Process the title field: tokenize, clean, and filter stop words
-    title_tokens = [preprocess_word(token) for token in word_tokenize(re.sub(pattern, ' ', row['title']))]
-    title_tokens = [w for w in title_tokens if w.lower() not in stop_words and len(w) > 2]
-
-    # Process the text field: tokenize each paragraph, clean, and filter stop words
-    text_tokens = []
-    for paragraph in row['text'].split("\n"):
-        for token in word_tokenize(re.sub(pattern, ' ', paragraph)):
-            text_tokens.append(preprocess_word(token))
-    text_tokens = [w for w in text_tokens if w.lower() not in stop_words and len(w) > 2]
-    
+# (row, tokens, sources) for every row, in order; with more than one worker, batches of rows are
+# analyzed in a process pool while a bounded number of batches is in flight
+def analyzed_rows(rows, analyzer, workers):
+    if workers <= 1:
+        for row in rows:
+            yield (row, *analyze_row(row, analyzer))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        pending = deque()
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == index_batch_size:
+                pending.append((batch, pool.submit(analyze_batch, batch)))
+                batch = []
+                if len(pending) >= 2 * workers:
+                    yield from finished_batch(pending.popleft())
+        if batch:
+            pending.append((batch, pool.submit(analyze_batch, batch)))
+        while pending:
+            yield from finished_batch(pending.popleft())
+
+
+def finished_batch(pending_batch):
+    batch, future = pending_batch
+    for row, (combined_tokens, sources) in zip(batch, future.result()):
+        yield row, combined_tokens, sources
+
+
+# Worker processes use their own analyzer (inherited with its lemma table when forked)
+def init_worker():
+    analyzer = get_analyzer()
+    if not analyzer.lemma_table:
+        analyzer.load_lemma_table(lemma_table_file)
+
+def analyze_batch(rows):
+    analyzer = get_analyzer()
+    return [analyze_row(row, analyzer) for row in rows]
+
+
+# Tokenizing, cleaning and lemmatizing a row into its tokens and their sources (no shared state, safe in workers)
+def analyze_row(row, analyzer):
     # Handle potential errors in tags and authors fields (json.loads would've been better)
-    tags_tokens = []
-    authors_tokens = []
+    tags = []
+    authors = []
     try:
-        tags_tokens = [preprocess_word(token) for tag in ast.literal_eval(row['tags']) for token in word_tokenize(re.sub(pattern, ' ', tag))]
-        authors_tokens = [preprocess_word(token) for author in ast.literal_eval(row['authors']) for token in word_tokenize(re.sub(pattern, ' ', author))]
+        tags = ast.literal_eval(row['tags'])
+        authors = ast.literal_eval(row['authors'])
     except (ValueError, SyntaxError):   
         print(f"Skipping row due to invalid tags format: {row['tags']}")
-    tags_tokens = [w for w in tags_tokens if w.lower() not in stop_words and len(w) > 2]
-    authors_tokens = [w for w in authors_tokens if w.lower() not in stop_words and len(w) > 2]
-
-    # Combine tokens from all fields, recording their sources and positions
-    combined_tokens = []
-    sources = []
-    positions = []
-    current_position = 0
-    
-    # Add title, text, tags, and authors tokens
-    current_position = process_tokens(current_position, title_tokens, combined_tokens, sources, positions, 'T')
-    current_position = process_tokens(current_position, text_tokens, combined_tokens, sources, positions, 'Te')
-    current_position = process_tokens(current_position, tags_tokens, combined_tokens, sources, positions, 'Ta')
-    current_position = process_tokens(current_position, authors_tokens, combined_tokens, sources, positions, 'A')
 
+    # Title, text, tags and authors tokens, recording their sources
+    return analyzer.document_terms(row['title'], row['text'], tags, authors)
+
+
+# Assigning the next doc id and ids for unseen words, and adding the document to the forward entries
+def add_document(combined_tokens, sources, latest_doc_id, latest_id, lexicon, lexicon_entries, forward_entries):
     # Increment the document ID for the current row
     latest_doc_id += 1
 
@@ -141,13 +165,17 @@ def index_dataset(row, stop_words, latest_doc_id, latest_id, lexicon, lexicon_en
 
 # Function to create inverted indexes from forward indexes
 def create_inverted_index():
+    # Document lengths (if already computed) tighten the block-max tables of the segments
+    lengths = load_length_array(lengths_file)
+    os.makedirs(inverted_index_folder, exist_ok=True)
     barrel = 0
     while True:
         # Check if the forward index for the current barrel exists
         if os.path.isfile(forward_index_folder + f'/forward_{barrel}.csv'):
             print(f"Creating inverted barrel {barrel}...")
-            update_inverted_barrel(forward_index_folder + f'/forward_{barrel}.csv', inverted_index_folder + f'/inverted_{barrel}.csv')
-            create_offsets(inverted_index_folder, barrel)
+            # The forward barrel is streamed and inverted through sorted runs on disk, under index_memory_bytes
+            runs = build_inverted_barrel(forward_index_folder + f'/forward_{barrel}.csv', inverted_index_folder + f'/inverted_{barrel}.csv', lengths)
+            print(f"Inverted barrel {barrel} has been saved ({runs} runs merged).")
             barrel += 1
         else:
             break
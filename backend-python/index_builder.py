@@ -0,0 +1,147 @@
+import csv
+import heapq
+import io
+import os
+import pickle
+import re
+import struct
+import tempfile
+from itertools import groupby
+from operator import itemgetter
+from forward_index import iterate_forward_barrel
+from segments import SegmentWriter, PostingList
+from config import index_memory_bytes
+
+#
+#   BOUNDED-MEMORY INVERTED BARREL BUILDER (SPIMI with an external merge)
+#
+#   Forward rows are streamed into a buffer of (word id, doc id, frequency, positions, sources)
+#   postings. When the buffer's estimated size passes the memory cap it is sorted by word id
+#   and spilled to a run file. The runs are then k-way merged, and every word's posting list
+#   goes straight to the CSV barrel, its offsets file and the binary segment, so nothing has to
+#   be re-read afterwards. Memory is bounded by the cap plus the largest single posting list.
+#
+
+# Rough in-memory size of a buffered posting and of each of its positions (bytes)
+POSTING_BYTES = 250
+POSITION_BYTES = 80
+# Postings per pickled chunk of a run (what a run holds in memory while merging)
+RUN_CHUNK = 4096
+
+
+def posting_bytes(positions):
+    return POSTING_BYTES + POSITION_BYTES * len(positions)
+
+
+# Sort a buffer by word id (stable, so doc order is kept) and write it as pickled chunks
+def spill_run(postings, run_folder, run_number):
+    postings.sort(key=itemgetter(0))
+    file_name = f'{run_folder}/run_{run_number}.pkl'
+    with open(file_name, 'wb') as file:
+        for start in range(0, len(postings), RUN_CHUNK):
+            pickle.dump(postings[start:start + RUN_CHUNK], file, protocol=pickle.HIGHEST_PROTOCOL)
+    return file_name
+
+def read_run(file_name):
+    with open(file_name, 'rb') as file:
+        while True:
+            try:
+                chunk = pickle.load(file)
+            except EOFError:
+                return
+            yield from chunk
+
+
+# The forward barrel as sorted runs on disk, each at most about `memory_bytes` while it was buffered
+def write_runs(forward_barrel_file, run_folder, memory_bytes):
+    runs = []
+    buffer = []
+    buffered_bytes = 0
+    for doc_id, word_ids, frequencies, positions, sources in iterate_forward_barrel(forward_barrel_file):
+        for i in range(len(word_ids)):
+            buffer.append((word_ids[i], doc_id, frequencies[i], positions[i], sources[i]))
+            buffered_bytes += posting_bytes(positions[i])
+        if buffered_bytes >= memory_bytes:
+            runs.append(spill_run(buffer, run_folder, len(runs)))
+            buffer = []
+            buffered_bytes = 0
+    if buffer:
+        runs.append(spill_run(buffer, run_folder, len(runs)))
+    return runs
+
+
+# Merged (word id, doc ids, frequencies, positions, sources) in increasing word id order; runs are
+# merged in the order they were written, so each list keeps the forward barrel's doc order
+def merged_postings(runs):
+    for word_id, group in groupby(heapq.merge(*map(read_run, runs), key=itemgetter(0)), key=itemgetter(0)):
+        doc_ids, frequencies, positions, sources = [], [], [], []
+        for _, doc_id, frequency, doc_positions, doc_sources in group:
+            doc_ids.append(doc_id)
+            frequencies.append(frequency)
+            positions.append(doc_positions)
+            sources.append(doc_sources)
+        yield word_id, doc_ids, frequencies, positions, sources
+
+
+class BarrelWriter:
+    """Writes the CSV barrel and its .bin row offsets together (offsets are counted, never re-scanned)."""
+
+    # `deferred` leaves the new files aside on close, for the caller to publish() when no reader needs the old ones
+    def __init__(self, csv_file, deferred=False):
+        self.csv_file = csv_file
+        self.deferred = deferred
+        self.bin_file = re.sub(r'\.csv$', '.bin', csv_file)
+        self.file = open(csv_file + '.tmp', 'wb')
+        self.offsets = open(self.bin_file + '.tmp', 'wb')
+        self.line = io.StringIO()
+        self.writer = csv.writer(self.line)
+        self.offset = 0
+        self.writerow(['WordID', 'DocIDs', 'Frequencies', 'Positions', 'Sources'])
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+        data = self.line.getvalue().encode('utf-8')
+        self.line.seek(0)
+        self.line.truncate()
+        self.offsets.write(struct.pack('Q', self.offset))
+        self.file.write(data)
+        self.offset += len(data)
+
+    def close(self):
+        for file in (self.file, self.offsets):
+            file.flush()
+            os.fsync(file.fileno())
+            file.close()
+        if not self.deferred:
+            self.publish()
+
+    def publish(self):
+        os.replace(self.csv_file + '.tmp', self.csv_file)
+        os.replace(self.bin_file + '.tmp', self.bin_file)
+
+    def abort(self):
+        for file in (self.file, self.offsets):
+            file.close()
+            os.remove(file.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def build_inverted_barrel(forward_barrel_file, inverted_barrel_file, lengths=None, memory_bytes=index_memory_bytes):
+    """Invert one forward barrel into inverted_{n}.csv, .bin and .seg; returns the number of runs spilled"""
+    folder = os.path.dirname(inverted_barrel_file) or '.'
+    with tempfile.TemporaryDirectory(dir=folder, prefix='runs_') as run_folder:
+        runs = write_runs(forward_barrel_file, run_folder, memory_bytes)
+        with BarrelWriter(inverted_barrel_file) as barrel_writer, \
+                SegmentWriter(re.sub(r'\.csv$', '.seg', inverted_barrel_file), lengths) as segment_writer:
+            for word_id, doc_ids, frequencies, positions, sources in merged_postings(runs):
+                barrel_writer.writerow([word_id, doc_ids, frequencies, positions, sources])
+                segment_writer.add(PostingList.from_lists(word_id, doc_ids, frequencies, positions, sources))
+    return len(runs)
@@ -1,11 +1,13 @@
-from config import lexicon_file, csv_file
+from config import lexicon_file, csv_file, index_workers
 from index import iterate_dataset, create_inverted_index
 import time as t
 
 # Iterating the dataset, then making the inverted index!!!!!!!!!!!
 a = t.time()
-iterate_dataset(csv_file, lexicon_file)
-print(t.time() - a)
+indexed = iterate_dataset(csv_file, lexicon_file)
+elapsed = t.time() - a
+print(elapsed)
+print(f"Indexed {indexed} documents ({indexed / elapsed if elapsed else 0:.1f} docs/sec, {index_workers} workers)")
 
 b = t.time()
 create_inverted_index()
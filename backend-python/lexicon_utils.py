@@ -1,30 +1,13 @@
 import os
 import csv
-from nltk.stem import WordNetLemmatizer
+import threading
+from analyzer import get_analyzer
+from csv_utils import save_counter, load_latest_id
 from config import lexicon_file, id_file
 
-# Initialize lemmatizer
-lemmatizer = WordNetLemmatizer()
-
+# Lemma of a single word, through the shared analyzer (lemma table + bounded memo)
 def preprocess_word(word):
-    word = word.lower()
-    lemmatized_word = lemmatizer.lemmatize(word, pos="v")
-    if lemmatized_word != word:
-        return lemmatized_word
-
-    # Try lemmatizing as noun
-    lemmatized_word = lemmatizer.lemmatize(word, pos="n")
-    if lemmatized_word != word:
-        return lemmatized_word
-
-    # Try lemmatizing as adjective
-    lemmatized_word = lemmatizer.lemmatize(word, pos="a")
-    if lemmatized_word != word:
-        return lemmatized_word
-
-    # Try lemmatizing as adverb
-    lemmatized_word = lemmatizer.lemmatize(word, pos="r")
-    return lemmatized_word
+    return get_analyzer().lemma(word)
 
 # Load lexicon
 def load_lexicon(lexicon_file):
@@ -47,7 +30,37 @@ def save_words_to_lexicon(lexicon_dict, new_entries, latest_id):
         if os.stat(lexicon_file).st_size == 0:
             writer.writerow(['ID', 'Word'])
         writer.writerows(new_entries)
+        file.flush()
+        os.fsync(file.fileno())
 
     # Save the latest ID
-    with open(id_file, 'w') as file:
-        file.write(str(latest_id))
\ No newline at end of file
+    save_counter(id_file, latest_id)
+
+
+# Word ids for words an upload adds to the lexicon; the lexicon file is the append-only log of them
+lexicon_lock = threading.Lock()
+
+def assign_word_ids(lexicon, words):
+    """
+    Next word ids for the words not in the lexicon yet. Nothing is written: the ids are logged with
+    the postings that use them, then to the lexicon file by save_word_ids (callers serialize the two,
+    under the upload commit lock), and callers publish the new words once their postings are searchable.
+    """
+    with lexicon_lock:
+        latest_id = load_latest_id()
+        new_ids = {}
+        for word in words:
+            if word not in lexicon and word not in new_ids:
+                latest_id += 1
+                new_ids[word] = latest_id
+    return new_ids
+
+
+def save_word_ids(lexicon, new_ids):
+    """Append the word ids past the id counter to the lexicon file (ids it already holds are skipped); returns those written"""
+    with lexicon_lock:
+        latest_id = load_latest_id()
+        new_entries = sorted([word_id, word] for word, word_id in new_ids.items() if word_id > latest_id)
+        if new_entries:
+            save_words_to_lexicon(lexicon, new_entries, new_entries[-1][0])
+    return new_entries
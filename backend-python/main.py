@@ -1,12 +1,27 @@
-from config import lexicon_file, csv_file
+from config import lexicon_file, csv_file, index_workers, processed_file, scrapped_file, lengths_file, snapshot_file, inverted_index_folder, lemma_table_file
 from index import iterate_dataset, create_inverted_index
+from lexicon_utils import load_lexicon
+from analyzer import get_analyzer
+from snapshot import write_snapshot
 import time as t
+import os
 
 # Iterating the dataset, then making the inverted index!!!!!!!!!!!
 a = t.time()
-iterate_dataset(csv_file, lexicon_file)
-print(t.time() - a)
+indexed = iterate_dataset(csv_file, lexicon_file)
+elapsed = t.time() - a
+print(elapsed)
+print(f"Indexed {indexed} documents ({indexed / elapsed if elapsed else 0:.1f} docs/sec, {index_workers} workers)")
 
 b = t.time()
 create_inverted_index()
-print(t.time() - b)
\ No newline at end of file
+print(t.time() - b)
+
+# Lemma table for the lexicon's words, used by the next indexing run, uploads and queries
+get_analyzer().save_lemma_table(lemma_table_file, load_lexicon(lexicon_file))
+
+# Snapshot for fast restarts (needs the scraped metadata and lengths as well)
+if os.path.exists(scrapped_file) and os.path.exists(lengths_file):
+    c = t.time()
+    write_snapshot(snapshot_file, lexicon_file, processed_file, scrapped_file, lengths_file, inverted_index_folder)
+    print(t.time() - c)
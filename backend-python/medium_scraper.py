@@ -1,3 +1,5 @@
+import asyncio
+import aiohttp
 import requests
 import csv
 import os
@@ -6,10 +8,11 @@ import re
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 from datetime import datetime
-from csv_utils import load_processed_to_dict, load_scrapped_to_dict
+from csv_utils import load_processed_to_dict, load_scrapped_to_dict, save_counter, DuplicateIndex
 from nltk.corpus import stopwords
 from lexicon_utils import load_lexicon
 from update_barrels import add_scraped_article_to_index
+from http_cache import cached_get, cached_fetch
 
 # Field size limit for CSV
 csv.field_size_limit(100_000_000)
@@ -57,22 +60,22 @@ def is_medium_or_freedium_url(url):
 
 def check_if_already_processed(url, title, processed_articles_dict):
     """
-    Check if article has already been processed based on URL or title
+    Check if article has already been processed based on its canonical URL or normalized title
     Returns: True if already processed, False otherwise
     """
-    # Check by URL first (most reliable)
-    for article in processed_articles_dict.values():
-        if article.get('url') == url:
-            return True
-    
-    # Check by title as backup (in case URL format changed)
-    if title:
-        title_lower = title.lower().strip()
-        for article in processed_articles_dict.values():
-            if article.get('title', '').lower().strip() == title_lower:
-                return True
-    
-    return False
+    # The document store's views carry a hash index; a plain dict gets one built for this call
+    duplicates = getattr(processed_articles_dict, 'duplicates', None)
+    if duplicates is None:
+        duplicates = DuplicateIndex.from_rows(processed_articles_dict.values())
+    return duplicates.contains(url, title)
+
+SCRAPE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
 
 def scrape_medium_article(url):
     """
@@ -80,200 +83,215 @@ def scrape_medium_article(url):
     Returns: dict with article data or None if failed
     """
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-        }
-        
-        response = requests.get(url, headers=headers, timeout=15)
+        # Through the on-disk response cache (revalidated with ETag / Last-Modified once stale)
+        response = cached_get(url, headers=SCRAPE_HEADERS, timeout=15)
         response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Extract title
-        title = None
-        title_selectors = [
-            'h1[data-testid="storyTitle"]',
-            'h1.graf--title',
-            'h1',
-            'title'
-        ]
-        
-        for selector in title_selectors:
-            title_elem = soup.select_one(selector)
-            if title_elem:
-                title = title_elem.get_text().strip()
-                if title and title != 'Medium':
-                    break
-        
-        if not title:
-            return None
-        
-        # Extract content/text
-        content_parts = []
-        content_selectors = [
-            'article section p',
-            'div[data-testid="storyContent"] p',
-            '.postArticle-content p',
-            'article p',
-            '.section-content p'
-        ]
-        
-        for selector in content_selectors:
-            paragraphs = soup.select(selector)
-            if paragraphs:
-                content_parts = [p.get_text().strip() for p in paragraphs if p.get_text().strip()]
-                break
-        
-        # If no content found, try alternative approach
-        if not content_parts:
-            article = soup.find('article')
-            if article:
-                content_parts = [p.get_text().strip() for p in article.find_all('p') if p.get_text().strip()]
-        
-        text = '\\n'.join(content_parts) if content_parts else ""
-        
-        # Extract authors
-        authors = []
-        author_selectors = [
-            'a[rel="author"]',
-            'a[data-testid="authorName"]',
-            '.author-name a',
-            'meta[name="author"]',
-            'span[data-testid="authorName"]'
-        ]
-        
-        for selector in author_selectors:
-            author_elems = soup.select(selector)
-            for elem in author_elems:
-                if elem.name == 'meta':
-                    author_text = elem.get('content', '').strip()
-                else:
-                    author_text = elem.get_text().strip()
-                
-                if author_text and author_text not in authors:
-                    authors.append(author_text)
-        
-        # Extract timestamp
-        timestamp = None
-        time_selectors = [
-            'time[datetime]',
-            'span[data-testid="storyPublishDate"]',
-            'meta[property="article:published_time"]'
-        ]
-        
-        for selector in time_selectors:
-            time_elem = soup.select_one(selector)
-            if time_elem:
-                if time_elem.name == 'meta':
-                    timestamp = time_elem.get('content', '')
-                elif time_elem.has_attr('datetime'):
-                    timestamp = time_elem['datetime']
-                else:
-                    timestamp = time_elem.get_text().strip()
-                break
-        
-        # Extract tags
-        tags = []
-        
-        # Try meta keywords first
-        meta_keywords = soup.find('meta', {'name': 'keywords'})
-        if meta_keywords:
-            keywords = meta_keywords.get('content', '')
-            tags.extend([tag.strip() for tag in keywords.split(',') if tag.strip()])
-        
-        # Try tag links
-        tag_selectors = [
-            'a[href*="/tag/"]',
-            '.tags a',
-            'a[data-testid="tag"]'
-        ]
-        
-        for selector in tag_selectors:
-            tag_elems = soup.select(selector)
-            for elem in tag_elems:
-                tag_text = elem.get_text().strip()
-                if tag_text and tag_text not in tags:
-                    tags.append(tag_text)
-        
-        # Extract thumbnail/image
-        thumbnail = None
-        img_selectors = [
-            'meta[property="og:image"]',
-            'meta[name="twitter:image"]',
-            'article img',
-            'figure img'
-        ]
-        
-        for selector in img_selectors:
-            img_elem = soup.select_one(selector)
-            if img_elem:
-                if img_elem.name == 'meta':
-                    thumbnail = img_elem.get('content', '')
-                else:
-                    thumbnail = img_elem.get('src', '')
-                if thumbnail:
-                    break
-        
-        # Extract description
-        description = ""
-        desc_selectors = [
-            'meta[property="og:description"]',
-            'meta[name="description"]',
-            'meta[name="twitter:description"]'
-        ]
-        
-        for selector in desc_selectors:
-            desc_elem = soup.select_one(selector)
-            if desc_elem:
-                description = desc_elem.get('content', '').strip()
-                if description:
-                    break
-        
-        # Check if members only
-        members_only = False
-        
-        # Look for member paywall indicators
-        paywall_indicators = [
-            '.paywall',
-            '[data-testid="paywall"]',
-            'div:contains("Member-only")',
-            'div:contains("This story is published in")',
-            '.meteredContent'
-        ]
-        
-        for indicator in paywall_indicators:
-            if soup.select(indicator):
-                members_only = True
-                break
-        
-        # Check for "Member" text in various places
-        if not members_only:
-            body_text = soup.get_text().lower()
-            if 'member-only story' in body_text or 'members only' in body_text:
-                members_only = True
-        
-        return {
-            'title': title,
-            'text': text,
-            'url': url,
-            'authors': authors,
-            'timestamp': timestamp,
-            'tags': tags,
-            'thumbnail': thumbnail,
-            'description': description,
-            'members_only': members_only,
-            'status_code': response.status_code
-        }
+        return parse_medium_article(response.content, url, response.status_code)
         
     except requests.RequestException as e:
         return {'error': f'Request failed: {str(e)}', 'status_code': getattr(e.response, 'status_code', 0) if hasattr(e, 'response') else 0}
     except Exception as e:
         return {'error': f'Scraping failed: {str(e)}', 'status_code': 0}
 
+async def scrape_medium_article_async(url, session, executor=None):
+    """
+    scrape_medium_article for request handlers: the page comes over the app's pooled aiohttp
+    session and is parsed in `executor` (the default thread pool if None), so the event loop is never blocked
+    """
+    try:
+        page = await cached_fetch(session, url, headers=SCRAPE_HEADERS, timeout=15)
+        if page.status >= 400:
+            return {'error': f'Request failed: {page.status} error for url: {url}', 'status_code': page.status}
+        return await asyncio.get_running_loop().run_in_executor(executor, parse_medium_article, page.body, url, page.status)
+    
+    except (aiohttp.ClientError, asyncio.TimeoutError, requests.RequestException) as e:
+        return {'error': f'Request failed: {str(e) or type(e).__name__}', 'status_code': 0}
+    except Exception as e:
+        return {'error': f'Scraping failed: {str(e)}', 'status_code': 0}
+
+def parse_medium_article(content, url, status_code):
+    """
+    Extract the article fields from a fetched page
+    Returns: dict with article data or None if it has no title
+    """
+    soup = BeautifulSoup(content, 'html.parser')
+    
+    # Extract title
+    title = None
+    title_selectors = [
+        'h1[data-testid="storyTitle"]',
+        'h1.graf--title',
+        'h1',
+        'title'
+    ]
+    
+    for selector in title_selectors:
+        title_elem = soup.select_one(selector)
+        if title_elem:
+            title = title_elem.get_text().strip()
+            if title and title != 'Medium':
+                break
+    
+    if not title:
+        return None
+    
+    # Extract content/text
+    content_parts = []
+    content_selectors = [
+        'article section p',
+        'div[data-testid="storyContent"] p',
+        '.postArticle-content p',
+        'article p',
+        '.section-content p'
+    ]
+    
+    for selector in content_selectors:
+        paragraphs = soup.select(selector)
+        if paragraphs:
+            content_parts = [p.get_text().strip() for p in paragraphs if p.get_text().strip()]
+            break
+    
+    # If no content found, try alternative approach
+    if not content_parts:
+        article = soup.find('article')
+        if article:
+            content_parts = [p.get_text().strip() for p in article.find_all('p') if p.get_text().strip()]
+    
+    text = '\\n'.join(content_parts) if content_parts else ""
+    
+    # Extract authors
+    authors = []
+    author_selectors = [
+        'a[rel="author"]',
+        'a[data-testid="authorName"]',
+        '.author-name a',
+        'meta[name="author"]',
+        'span[data-testid="authorName"]'
+    ]
+    
+    for selector in author_selectors:
+        author_elems = soup.select(selector)
+        for elem in author_elems:
+            if elem.name == 'meta':
+                author_text = elem.get('content', '').strip()
+            else:
+                author_text = elem.get_text().strip()
+            
+            if author_text and author_text not in authors:
+                authors.append(author_text)
+    
+    # Extract timestamp
+    timestamp = None
+    time_selectors = [
+        'time[datetime]',
+        'span[data-testid="storyPublishDate"]',
+        'meta[property="article:published_time"]'
+    ]
+    
+    for selector in time_selectors:
+        time_elem = soup.select_one(selector)
+        if time_elem:
+            if time_elem.name == 'meta':
+                timestamp = time_elem.get('content', '')
+            elif time_elem.has_attr('datetime'):
+                timestamp = time_elem['datetime']
+            else:
+                timestamp = time_elem.get_text().strip()
+            break
+    
+    # Extract tags
+    tags = []
+    
+    # Try meta keywords first
+    meta_keywords = soup.find('meta', {'name': 'keywords'})
+    if meta_keywords:
+        keywords = meta_keywords.get('content', '')
+        tags.extend([tag.strip() for tag in keywords.split(',') if tag.strip()])
+    
+    # Try tag links
+    tag_selectors = [
+        'a[href*="/tag/"]',
+        '.tags a',
+        'a[data-testid="tag"]'
+    ]
+    
+    for selector in tag_selectors:
+        tag_elems = soup.select(selector)
+        for elem in tag_elems:
+            tag_text = elem.get_text().strip()
+            if tag_text and tag_text not in tags:
+                tags.append(tag_text)
+    
+    # Extract thumbnail/image
+    thumbnail = None
+    img_selectors = [
+        'meta[property="og:image"]',
+        'meta[name="twitter:image"]',
+        'article img',
+        'figure img'
+    ]
+    
+    for selector in img_selectors:
+        img_elem = soup.select_one(selector)
+        if img_elem:
+            if img_elem.name == 'meta':
+                thumbnail = img_elem.get('content', '')
+            else:
+                thumbnail = img_elem.get('src', '')
+            if thumbnail:
+                break
+    
+    # Extract description
+    description = ""
+    desc_selectors = [
+        'meta[property="og:description"]',
+        'meta[name="description"]',
+        'meta[name="twitter:description"]'
+    ]
+    
+    for selector in desc_selectors:
+        desc_elem = soup.select_one(selector)
+        if desc_elem:
+            description = desc_elem.get('content', '').strip()
+            if description:
+                break
+    
+    # Check if members only
+    members_only = False
+    
+    # Look for member paywall indicators
+    paywall_indicators = [
+        '.paywall',
+        '[data-testid="paywall"]',
+        'div:contains("Member-only")',
+        'div:contains("This story is published in")',
+        '.meteredContent'
+    ]
+    
+    for indicator in paywall_indicators:
+        if soup.select(indicator):
+            members_only = True
+            break
+    
+    # Check for "Member" text in various places
+    if not members_only:
+        body_text = soup.get_text().lower()
+        if 'member-only story' in body_text or 'members only' in body_text:
+            members_only = True
+    
+    return {
+        'title': title,
+        'text': text,
+        'url': url,
+        'authors': authors,
+        'timestamp': timestamp,
+        'tags': tags,
+        'thumbnail': thumbnail,
+        'description': description,
+        'members_only': members_only,
+        'status_code': status_code
+    }
+
 def add_to_processed_dict(article_data, doc_id, processed_articles_dict):
     """
     Add article to the processed articles dictionary
@@ -286,123 +304,69 @@ def add_to_processed_dict(article_data, doc_id, processed_articles_dict):
         'timestamp': article_data['timestamp'],
         'tags': article_data['tags']
     }
+    duplicates = getattr(processed_articles_dict, 'duplicates', None)
+    if duplicates is not None:
+        duplicates.add(article_data['url'], article_data['title'])
 
 def add_to_scraped_dict(article_data, doc_id, scraped_articles_dict):
     """
     Add article scraping metadata to the scraped articles dictionary
     """
+    # Same values as the row written to scraped.csv (whose URL column is the thumbnail)
     scraped_articles_dict[doc_id] = {
-        'url': article_data.get('url', ''),
+        'url': article_data.get('thumbnail', ''),
         'description': article_data.get('description', ''),
         'member only': 'Yes' if article_data.get('members_only', False) else 'No',
-        'code': article_data.get('status_code', 0)
+        'code': str(article_data.get('status_code', 0))
     }
 
 def add_to_lengths_dict(doc_id, lengths_dict, article_length):
     lengths_dict[doc_id] = article_length
 
-def append_to_processed_csv(article_data, doc_id, processed_file):
-    """
-    Append article to processed CSV file
-    """
-    os.makedirs("indexes", exist_ok=True)
-    
-    # Prepare row data
-    new_entry = [
-        doc_id,
-        article_data['title'],
-        article_data['url'],
-        json.dumps(article_data['authors']) if article_data['authors'] else '[]',
-        article_data['timestamp'] or '',
-        json.dumps(article_data['tags']) if article_data['tags'] else '[]'
-    ]
-    
-    # Check if file exists and write header if needed
-    file_exists = os.path.exists(processed_file) and os.path.getsize(processed_file) > 0
-    
-    with open(processed_file, mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        if not file_exists:
-            writer.writerow(['ID', 'title', 'url', 'authors', 'timestamp', 'tags'])
-        writer.writerow(new_entry)
-
-def append_to_scraped_csv(article_data, doc_id, scraped_file):
-    """
-    Append article to scraped CSV file with scraping metadata
-    """
-    os.makedirs("indexes", exist_ok=True)
-    
-    # Prepare row data
-    status_code = article_data.get('status_code', 0)
-    description = article_data.get('description', '')
-    members_only = article_data.get('members_only', False)
-    
-    new_entry = [
-        doc_id,
-        article_data['thumbnail'],
-        description,
-        'Yes' if members_only else 'No',
-        status_code
-    ]
-    
-    # Check if file exists and write header if needed
-    file_exists = os.path.exists(scraped_file) and os.path.getsize(scraped_file) > 0
-    
-    with open(scraped_file, mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        if not file_exists:
-            writer.writerow(['ID', 'URL', 'Description', 'Member Only', 'Code'])
-        writer.writerow(new_entry)
-
-def update_latest_doc_id(latest_doc_id, doc_id_file):
-    """
-    Update the latest document ID file
-    """
-    
-    with open(doc_id_file, 'w') as file:
-        file.write(str(latest_doc_id))
+NOT_AN_ARTICLE = {
+    'success': False,
+    'message': 'URL is not a Medium or Freedium article',
+    'data': None
+}
 
-def update_lengths(latest_doc_id, lengths_file, article_length):
-    """
-    Update the latestdocument length
+def scrape_article_for_upload(url):
     """
-    with open(lengths_file, 'a', newline='', encoding='utf-8') as file:
-        writer = csv.DictWriter(file, fieldnames=['ID', 'length'])
-        writer.writerow({'ID': latest_doc_id, 'length': article_length})
-
-def scrape_and_add_article(url, processed_articles_dict, scraped_articles_dict, lengths_dict, latest_doc_id, processed_file, scraped_file, lengths_file, doc_id_file):
-    """
-    Main function to scrape and add an article if it's valid and not already processed
+    Scrape an article and check it can be added (the slow, network-bound half of an upload)
     
     Returns:
         dict: {
             'success': bool,
             'message': str,
-            'data': dict or None,
-            'doc_id': int or None
+            'data': dict or None
         }
     """
     # Check if it's a Medium or Freedium URL
-    site_type = is_medium_or_freedium_url(url)
-    if not site_type:
-        return {
-            'success': False,
-            'message': 'URL is not a Medium or Freedium article',
-            'data': None,
-            'doc_id': None
-        }
+    if not is_medium_or_freedium_url(url):
+        return dict(NOT_AN_ARTICLE)
     
     # Scrape the article
-    article_data = scrape_medium_article(url)
-    
+    return checked_article(scrape_medium_article(url))
+
+async def scrape_article_for_upload_async(url, session, executor=None):
+    """
+    scrape_article_for_upload for the upload queue: fetched over the app's pooled aiohttp session
+    and parsed in `executor`, like scrape_medium_article_async
+    """
+    if not is_medium_or_freedium_url(url):
+        return dict(NOT_AN_ARTICLE)
+    return checked_article(await scrape_medium_article_async(url, session, executor))
+
+def checked_article(article_data):
+    """
+    Check a scraped article can be added (shared by both scrape_article_for_upload versions)
+    """
     # Check for scraping errors
     if not article_data or 'error' in article_data:
         error_msg = article_data.get('error', 'Unknown scraping error') if article_data else 'Failed to scrape article'
         return {
             'success': False,
             'message': error_msg,
-            'data': article_data,
-            'doc_id': None
+            'data': article_data
         }
     
     # Check if article was successfully scraped
@@ -410,40 +374,104 @@ def scrape_and_add_article(url, processed_articles_dict, scraped_articles_dict,
         return {
             'success': False,
             'message': 'Could not extract title or content from article',
-            'data': article_data,
-            'doc_id': None
-        }
-    
-    # Check if already processed
-    if check_if_already_processed(url, article_data['title'], processed_articles_dict):
-        return {
-            'success': False,
-            'message': 'Article has already been processed',
-            'data': article_data,
-            'doc_id': None
+            'data': article_data
         }
     
-    # Increment document ID
-    new_doc_id = latest_doc_id + 1
-    
-    # Add to processed dictionary
-    add_to_processed_dict(article_data, new_doc_id, processed_articles_dict)
-    add_to_scraped_dict(article_data, new_doc_id, scraped_articles_dict)
-    
-    # Append to CSV files
-    append_to_processed_csv(article_data, new_doc_id, processed_file)
-    append_to_scraped_csv(article_data, new_doc_id, scraped_file)
+    return {
+        'success': True,
+        'message': 'Scraped',
+        'data': article_data
+    }
+
+def append_rows(file_name, header, rows):
+    """
+    Append rows to a CSV file in one write (with the header if the file is new)
+    """
+    os.makedirs("indexes", exist_ok=True)
+    file_exists = os.path.exists(file_name) and os.path.getsize(file_name) > 0
+    with open(file_name, mode='a', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        if not file_exists:
+            writer.writerow(header)
+        writer.writerows(rows)
+        file.flush()
+        os.fsync(file.fileno())
+
+def add_scraped_articles(articles, processed_articles_dict, scraped_articles_dict, lengths_dict, latest_doc_id, processed_file, scraped_file, lengths_file, doc_id_file):
+    """
+    Add a batch of scraped articles: doc ids are assigned in order, each CSV gets one append
+    for the whole batch and the doc id counter is moved last (the commit point)
     
-    # Update latest doc ID
-    update_latest_doc_id(new_doc_id, doc_id_file)
+    Returns:
+        list: one {'success', 'message', 'data', 'doc_id'} per article
+    """
+    results = []
+    processed_rows, scraped_rows, length_rows = [], [], []
+    for article_data in articles:
+        # Check if already processed (earlier articles of the batch included)
+        if check_if_already_processed(article_data['url'], article_data['title'], processed_articles_dict):
+            results.append({
+                'success': False,
+                'message': 'Article has already been processed',
+                'data': article_data,
+                'doc_id': None
+            })
+            continue
+        
+        # Increment document ID
+        latest_doc_id += 1
+        
+        # Add to processed dictionary
+        add_to_processed_dict(article_data, latest_doc_id, processed_articles_dict)
+        add_to_scraped_dict(article_data, latest_doc_id, scraped_articles_dict)
+        add_to_lengths_dict(latest_doc_id, lengths_dict, len(article_data['text']))
+        
+        processed_rows.append([
+            latest_doc_id,
+            article_data['title'],
+            article_data['url'],
+            json.dumps(article_data['authors']) if article_data['authors'] else '[]',
+            article_data['timestamp'] or '',
+            json.dumps(article_data['tags']) if article_data['tags'] else '[]'
+        ])
+        scraped_rows.append([
+            latest_doc_id,
+            article_data['thumbnail'],
+            article_data.get('description', ''),
+            'Yes' if article_data.get('members_only', False) else 'No',
+            article_data.get('status_code', 0)
+        ])
+        length_rows.append([latest_doc_id, len(article_data['text'])])
+        results.append({
+            'success': True,
+            'message': f'Successfully processed article: {article_data["title"][:50]}...',
+            'data': article_data,
+            'doc_id': latest_doc_id
+        })
     
-    # Update latest doc length
-    add_to_lengths_dict(new_doc_id, lengths_dict, len(article_data['text']))
-    update_lengths(new_doc_id, lengths_file, len(article_data['text']))
+    if processed_rows:
+        append_rows(lengths_file, ['ID', 'length'], length_rows)
+        append_rows(scraped_file, ['ID', 'URL', 'Description', 'Member Only', 'Code'], scraped_rows)
+        append_rows(processed_file, ['ID', 'title', 'url', 'authors', 'timestamp', 'tags'], processed_rows)
+        save_counter(doc_id_file, latest_doc_id)
+    return results
+
+def scrape_and_add_article(url, processed_articles_dict, scraped_articles_dict, lengths_dict, latest_doc_id, processed_file, scraped_file, lengths_file, doc_id_file):
+    """
+    Main function to scrape and add an article if it's valid and not already processed
     
-    return {
-        'success': True,
-        'message': f'Successfully processed article: {article_data["title"][:50]}...',
-        'data': article_data,
-        'doc_id': new_doc_id
-    }
\ No newline at end of file
+    Returns:
+        dict: {
+            'success': bool,
+            'message': str,
+            'data': dict or None,
+            'doc_id': int or None
+        }
+    """
+    result = scrape_article_for_upload(url)
+    if not result['success']:
+        return {**result, 'doc_id': None}
+    return add_scraped_articles(
+        [result['data']], processed_articles_dict, scraped_articles_dict, lengths_dict, latest_doc_id,
+        processed_file, scraped_file, lengths_file, doc_id_file
+    )[0]
@@ -0,0 +1,118 @@
+import codecs
+import time
+from html.parser import HTMLParser
+from config import metadata_body_bytes
+
+#
+#   STREAMING PAGE METADATA
+#
+#   Thumbnail, description and member-only flag of an article page, read from the response as it
+#   streams in with an incremental parser (no DOM is built). Reading stops as soon as the answer is
+#   known: at a member-only marker, at </head> when the head already says whether the article is
+#   free (JSON-LD isAccessibleForFree), or `metadata_body_bytes` into the body otherwise. The
+#   marker sits near the top of the body, so the rest of the article is never downloaded.
+#
+MEMBER_ONLY_TEXT = 'member-only story'
+METERED_CLASS = 'meteredContent'
+
+
+class MetadataParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.description = None
+        self.thumbnail = None
+        self.member_only = False
+        self.accessible_for_free = None  # From the head's JSON-LD, None if it does not say
+        self.in_head = True
+        self.in_script = False
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'meta':
+            if attrs.get('name') == 'description' and self.description is None:
+                self.description = attrs.get('content')
+            elif attrs.get('property') == 'og:image' and self.thumbnail is None:
+                self.thumbnail = attrs.get('content')
+        elif tag == 'script':
+            self.in_script = True
+        elif tag == 'body':
+            self.end_head()
+        if METERED_CLASS in (attrs.get('class') or '').split():
+            self.member_only = True
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == 'script':
+            self.in_script = False
+        elif tag == 'head':
+            self.end_head()
+
+    def handle_data(self, data):
+        if self.in_script:
+            if self.in_head and '"isAccessibleForFree"' in data:
+                compact = data.replace(' ', '')
+                if '"isAccessibleForFree":false' in compact or '"isAccessibleForFree":"False"' in compact:
+                    self.accessible_for_free = False
+                elif '"isAccessibleForFree":true' in compact or '"isAccessibleForFree":"True"' in compact:
+                    self.accessible_for_free = True
+        elif data.strip().lower() == MEMBER_ONLY_TEXT:
+            self.member_only = True
+            self.done = True
+
+    def end_head(self):
+        if not self.in_head:
+            return
+        self.in_head = False
+        if self.accessible_for_free is not None:
+            self.member_only = self.member_only or not self.accessible_for_free
+            self.done = True
+
+
+class MetadataExtractor:
+    """Feed it response chunks until feed() returns True, then read result()."""
+
+    def __init__(self, max_body_bytes=metadata_body_bytes):
+        self.parser = MetadataParser()
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.max_body_bytes = max_body_bytes
+        self.bytes = 0
+        self.body_bytes = 0
+        self.cpu = 0.0
+
+    def feed(self, chunk):
+        """Parse one chunk of the raw response; True once nothing more needs to be read"""
+        started = time.process_time()
+        self.bytes += len(chunk)
+        if not self.parser.in_head:
+            self.body_bytes += len(chunk)
+        self.parser.feed(self.decoder.decode(chunk))
+        self.cpu += time.process_time() - started
+        return self.parser.done or self.body_bytes >= self.max_body_bytes
+
+    def result(self):
+        return {
+            'member_only': self.parser.member_only,
+            'description': self.parser.description,
+            'thumbnail': self.parser.thumbnail,
+            'bytes': self.bytes,
+            'cpu': self.cpu,
+        }
+
+
+def extract_metadata(chunks, max_body_bytes=metadata_body_bytes):
+    """Metadata of a page from an iterable of byte chunks (e.g. requests' iter_content), reading no further than needed"""
+    extractor = MetadataExtractor(max_body_bytes)
+    for chunk in chunks:
+        if extractor.feed(chunk):
+            break
+    return extractor.result()
+
+
+async def extract_metadata_async(stream, chunk_size=16 * 1024, max_body_bytes=metadata_body_bytes):
+    """The same from an aiohttp response's content stream"""
+    extractor = MetadataExtractor(max_body_bytes)
+    async for chunk in stream.iter_chunked(chunk_size):
+        if extractor.feed(chunk):
+            break
+    return extractor.result()
@@ -1,72 +1,47 @@
 # THIS FUNCTION WAS USED TO SCRAPE THE MEDIUM THUMBNAILS
 # CREATES SCRAPED.CSV
 
-import aiohttp
 import asyncio
 from bs4 import BeautifulSoup
 import requests
 import csv
 import os
 import time as t
-from tqdm import tqdm
+from crawler import Crawler
+from page_meta import extract_metadata, extract_metadata_async
+from http_cache import cached_get, get_http_cache
 
-global IS_429
-IS_429 = False
+# Codes after which an article is not scraped again
+FINAL_CODES = ("200", "404", "410")
+HEADER = ["ID", "URL", "Description", "Member Only", "Code"]
 
-# Asynchronous function to check if a Medium article is member-only
-async def check_medium_article(session, article_id, url):
-    try:
-        async with session.get(url, timeout=10) as response:
-            response.raise_for_status()
-            html = await response.text()
-
-            # Parse the HTML content
-            soup = BeautifulSoup(html, 'html.parser')
-
-            # Check if the page contains "member-only" indicator
-            member_only = False
-            if soup.find(string="member-only story") or soup.find(class_="meteredContent"):
-                member_only = True
+# Member-only flag, description and thumbnail URL from a page's streamed metadata (page_meta.py)
+def page_fields(metadata):
+    description = metadata['description'] if metadata['description'] is not None else 'No description available'
+    thumbnail_url = metadata['thumbnail'] if metadata['thumbnail'] is not None else 'No thumbnail available'
+    return metadata['member_only'], description, thumbnail_url
 
-            # Extract a small description (meta description)
-            description_tag = soup.find('meta', attrs={'name': 'description'})
-            description = description_tag['content'] if description_tag else 'No description available'
-            
-            # Extract the thumbnail URL
-            thumbnail_tag = soup.find('meta', property='og:image')
-            url = thumbnail_tag['content'] if thumbnail_tag else 'No thumbnail available'
+# Crawler reader: only as much of each page as the metadata needs
+async def read_metadata(content):
+    return await extract_metadata_async(content)
 
-            return [article_id, url, description, "Yes" if member_only else "No", response.status]
-    except Exception as e:
-        print(f"Error fetching URL {url}: {e}")
-        if 'response' in locals():
-            if response.status == 429:
-                global IS_429
-                IS_429 = True
-        return [article_id, "Error fetching thumbnail", "Error fetching data", "Unknown", response.status if 'response' in locals() else 'No response']
+# Row of scraped.csv for one crawled article (status None when every attempt failed)
+def article_row(article_id, url, status, metadata):
+    if status is not None and status < 400:
+        member_only, description, thumbnail_url = page_fields(metadata)
+        return [article_id, thumbnail_url, description, "Yes" if member_only else "No", status]
+    return [article_id, "Error fetching thumbnail", "Error fetching data", "Unknown", status if status is not None else 'No response']
 
 
 def scrape_article(url):
     try:
-        # Send a GET request to the URL
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-
-        # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Check if the page contains "member-only" indicator
-        member_only = False
-        if soup.find(string="member-only story") or soup.find(class_="meteredContent"):
-            member_only = True
-
-        # Extract a small description (meta description)
-        description_tag = soup.find('meta', attrs={'name': 'description'})
-        description = description_tag['content'] if description_tag else 'No description available'
+        # Whole pages go through the on-disk response cache (so re-scrapes revalidate, and offline mode replays
+        # them); the metadata is still parsed only as far as it needs
+        with cached_get(url, timeout=10) as response:
+            response.raise_for_status()
+            metadata = extract_metadata(response.iter_content(16 * 1024))
 
-        # Extract the thumbnail URL
-        thumbnail_tag = soup.find('meta', property='og:image')
-        thumbnail_url = thumbnail_tag['content'] if thumbnail_tag else 'No thumbnail available'
+        member_only, description, thumbnail_url = page_fields(metadata)
 
         return member_only, description, thumbnail_url, response.status_code
 
@@ -74,24 +49,41 @@ def scrape_article(url):
         print(f"Error fetching URL {url}: {e}")
         return None, None, None, response.status_code if 'response' in locals() else None
 
-# Asynchronous function to process multiple URLs
-async def process_articles(articles, output_filename, limit=5, start=0):
-    tasks = []
-    async with aiohttp.ClientSession() as session:
-        for idx, article in enumerate(articles[start:limit]):
-            article_id = article.get("ID", "Unknown")
-            url = article.get("url", "")
-
-            if not url:
-                print(f"Skipping article with ID {article_id} due to missing URL")
-                tasks.append(asyncio.create_task(asyncio.sleep(0)))  # Dummy task to keep index alignment
-                continue
-
-            print(f"Processing article ID {article_id}: {url}")
-            tasks.append(check_medium_article(session, article_id, url))
-
-        results = await asyncio.gather(*tasks)
-        write_to_csv([result for result in results if result], output_filename)
+# Scrape every article not in the output yet, or whose last attempt did not end in a final code,
+# with one crawler (resumed from its checkpoint if an earlier crawl was cut short)
+def crawl_articles(articles, output_filename):
+    existing = {row["ID"]: row for row in read_from_csv(output_filename)} if os.path.exists(output_filename) else {}
+    jobs = []
+    for article in articles:
+        article_id = article.get("ID", "Unknown")
+        url = article.get("url", "")
+        if not url:
+            print(f"Skipping article with ID {article_id} due to missing URL")
+        elif existing.get(article_id, {}).get("Code") not in FINAL_CODES:
+            jobs.append((article_id, url))
+
+    # Bytes read and parsing CPU time, to report per article
+    transfer = {'articles': 0, 'bytes': 0, 'cpu': 0.0}
+    def handle(article_id, url, status, metadata):
+        if metadata is not None:
+            transfer['articles'] += 1
+            transfer['bytes'] += metadata['bytes']
+            transfer['cpu'] += metadata['cpu']
+        return article_row(article_id, url, status, metadata)
+
+    crawler = Crawler(output_filename + '.checkpoint', read=read_metadata, cache=get_http_cache())
+    rows = {article_id: [row[column] for column in HEADER] for article_id, row in existing.items()}
+    rows.update(asyncio.run(crawler.crawl(jobs, handle)))
+
+    # Rewritten in ID order next to the output and swapped in, then the checkpoint is not needed anymore
+    with open(output_filename + '.tmp', mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(HEADER)
+        writer.writerows(rows[article_id] for article_id in sorted(rows, key=lambda article_id: int(article_id)))
+    os.replace(output_filename + '.tmp', output_filename)
+    crawler.clear_checkpoint()
+    print(f"Data successfully written to {output_filename}")
+    return {**crawler.stats(), 'transfer': transfer}
 
 # Function to write results to a CSV file
 def write_to_csv(data, filename="medium_articles.csv"):
@@ -251,24 +243,18 @@ def save_article_to_csv(article_details, filename='received.csv'):
 def main():
     input_filename = "indexes/processed.csv"  # Input CSV file with header ID, title, url, authors, timestamp, tags
     output_filename = "scraped.csv"  # Output CSV file
-    global IS_429
 
     # Read data from the input CSV
     articles = read_from_csv(input_filename)
-    
-    latest_article_id = int(update_csv(output_filename, input_filename, output_filename))
-    
-    for i in range(latest_article_id, len(articles) - 6, 5):
-        a = t.time()
-        # Process articles asynchronously
-        asyncio.run(process_articles(articles[i:i+5], output_filename))
-        if IS_429:
-            print("Rate limit exceeded. Waiting for 15 minutes...")
-            for _ in tqdm(range(600), desc="Waiting", unit="s"):
-                t.sleep(1)
-            IS_429 = False
-        t.sleep(2)
-        print(t.time() - a)
+
+    a = t.time()
+    stats = crawl_articles(articles, output_filename)
+    print(f"Crawled {stats['fetched']} articles in {t.time() - a:.1f}s ({stats['failed']} failed)")
+    transfer = stats['transfer']
+    if transfer['articles']:
+        print(f"Parsed {transfer['bytes'] / transfer['articles'] / 1024:.1f} KB for {transfer['cpu'] / transfer['articles'] * 1000:.2f} ms CPU per article")
+    for host, host_stats in stats['hosts'].items():
+        print(f"  {host}: {host_stats['requests']} requests, {host_stats['throttled']} throttled, settled at {host_stats['rate']}/s")
 
 if __name__ == "__main__":
     main()
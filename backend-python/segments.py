@@ -0,0 +1,388 @@
+import csv
+import glob
+import json
+import mmap
+import os
+import re
+import struct
+import numpy as np
+from config import barrel_size
+
+#
+#   BINARY POSTING SEGMENTS (one .seg file per inverted barrel)
+#
+#   Layout:  header | term blocks | directory | footer
+#   Each term block holds delta-encoded doc ids, packed frequencies, one field-mask
+#   byte per posting, the flattened positions and (since version 2) one BLOCK_DTYPE
+#   record of score-bound inputs per BLOCK_SIZE postings. The directory is a sorted
+#   array of directory records, so a lookup is a single searchsorted over the mmap.
+#
+
+SEGMENT_MAGIC = b'SPSG'
+SEGMENT_VERSION = 2
+HEADER = struct.Struct('<4sI')     # magic, version
+FOOTER = struct.Struct('<QI4s')    # directory offset, number of terms, magic
+
+# Field-mask bits, one per source type used by the forward index
+SOURCE_BITS = {'T': 1, 'Te': 2, 'Ta': 4, 'A': 8}
+TITLE_BIT = SOURCE_BITS['T']
+TEXT_BIT = SOURCE_BITS['Te']
+TAG_BIT = SOURCE_BITS['Ta']
+AUTHOR_BIT = SOURCE_BITS['A']
+
+DIRECTORY_DTYPES = {
+    1: np.dtype([
+        ('word_id', '<u4'),
+        ('count', '<u4'),         # number of documents
+        ('offset', '<u8'),        # start of the term block
+        ('positions', '<u4'),     # total number of positions (sum of frequencies)
+        ('doc_width', 'u1'),      # bytes per doc id delta
+        ('freq_width', 'u1'),     # bytes per frequency
+        ('reserved', '<u2'),
+    ]),
+    2: np.dtype([
+        ('word_id', '<u4'),
+        ('count', '<u4'),
+        ('offset', '<u8'),
+        ('positions', '<u4'),
+        ('doc_width', 'u1'),
+        ('freq_width', 'u1'),
+        ('reserved', '<u2'),
+        ('blocks_offset', '<u8'),  # start of the block-max table
+    ]),
+}
+DIRECTORY_DTYPE = DIRECTORY_DTYPES[SEGMENT_VERSION]
+
+# Block-max table: enough to bound the BM25 score of every posting in a block for any avgdl
+BLOCK_SIZE = 128
+BLOCK_DTYPE = np.dtype([
+    ('last_doc', '<u4'),
+    ('max_freq', '<u4'),
+    ('min_length', '<u4'),        # 0 when lengths were not available at build time
+    ('mask', 'u1'),               # OR of the field masks in the block
+    ('reserved', 'u1', (3,)),
+])
+
+PACKED_DTYPES = {1: np.dtype('<u1'), 2: np.dtype('<u2'), 4: np.dtype('<u4')}
+POSITION_DTYPE = np.dtype('<u4')
+
+
+def segment_file(inverted_index_folder, barrel_num):
+    return f'{inverted_index_folder}/inverted_{barrel_num}.seg'
+
+
+# Smallest packed width that can hold every value of the array
+def packed_width(values):
+    largest = int(values.max()) if len(values) else 0
+    if largest < 1 << 8:
+        return 1
+    if largest < 1 << 16:
+        return 2
+    return 4
+
+
+# Per-block score-bound inputs for a posting list; `lengths` is indexed by doc id
+def compute_blocks(doc_ids, frequencies, masks, lengths=None):
+    starts = np.arange(0, len(doc_ids), BLOCK_SIZE)
+    blocks = np.zeros(len(starts), dtype=BLOCK_DTYPE)
+    if not len(starts):
+        return blocks
+    blocks['last_doc'] = doc_ids[np.minimum(starts + BLOCK_SIZE, len(doc_ids)) - 1]
+    blocks['max_freq'] = np.maximum.reduceat(frequencies, starts)
+    blocks['mask'] = np.bitwise_or.reduceat(masks.astype(np.uint8), starts)
+    if lengths is not None:
+        doc_lengths = np.zeros(len(doc_ids), dtype=np.uint32)
+        known = doc_ids < len(lengths)
+        doc_lengths[known] = lengths[doc_ids[known]]
+        blocks['min_length'] = np.minimum.reduceat(doc_lengths, starts)
+    return blocks
+
+
+# Collapse a per-occurrence source list (e.g. ['T', 'Te', 'Te']) into one mask byte
+def encode_sources(sources):
+    mask = 0
+    for source in sources:
+        mask |= SOURCE_BITS.get(source, 0)
+    return mask
+
+
+class PostingList:
+    """Decoded postings of a single word, stored as parallel NumPy arrays sorted by doc id."""
+    __slots__ = ('word_id', 'doc_ids', 'frequencies', 'masks', '_flat_positions', 'gather_positions', 'blocks')
+
+    # `gather_positions` builds the flat positions on first use (scoring never needs them)
+    def __init__(self, word_id, doc_ids, frequencies, masks, flat_positions=None, blocks=None, gather_positions=None):
+        self.word_id = word_id
+        self.doc_ids = doc_ids
+        self.frequencies = frequencies
+        self.masks = masks
+        self._flat_positions = flat_positions
+        self.gather_positions = gather_positions
+        self.blocks = blocks
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @property
+    def flat_positions(self):
+        if self.gather_positions is not None:
+            self._flat_positions = self.gather_positions()
+            self.gather_positions = None
+        return self._flat_positions
+
+    @property
+    def nbytes(self):
+        size = self.doc_ids.nbytes + self.frequencies.nbytes + self.masks.nbytes
+        if self._flat_positions is not None:
+            size += self._flat_positions.nbytes
+        if self.blocks is not None:
+            size += self.blocks.nbytes
+        return size
+
+    # Heap memory held by the decoded arrays; views straight into a segment mmap are free
+    @property
+    def decoded_nbytes(self):
+        arrays = (self.doc_ids, self.frequencies, self.masks, self._flat_positions, self.blocks)
+        return sum(array.nbytes for array in arrays if array is not None and array.flags.owndata)
+
+    # Block-max table, computed on the fly for postings that did not come from a v2 segment
+    def block_maxima(self):
+        if self.blocks is None:
+            self.blocks = compute_blocks(self.doc_ids, self.frequencies, self.masks)
+        return self.blocks
+
+    # Positions split back into one array per document
+    def positions(self):
+        if self.flat_positions is None:
+            return [np.empty(0, dtype=POSITION_DTYPE) for _ in range(len(self))]
+        return np.split(self.flat_positions, np.cumsum(self.frequencies)[:-1])
+
+    # Build from the list-of-lists representation used by the CSV barrels
+    @classmethod
+    def from_lists(cls, word_id, doc_ids, frequencies, positions, sources):
+        doc_ids = np.asarray(doc_ids, dtype=np.uint32)
+        frequencies = np.asarray(frequencies, dtype=np.uint32)
+        masks = np.array([encode_sources(source) for source in sources], dtype=np.uint8)
+        flat_positions = np.fromiter((p for doc_positions in positions for p in doc_positions),
+                                     dtype=POSITION_DTYPE)
+
+        # Postings must be ordered by doc id for delta encoding
+        if len(doc_ids) > 1 and np.any(np.diff(doc_ids.astype(np.int64)) < 0):
+            order = np.argsort(doc_ids, kind='stable')
+            per_doc = [np.asarray(positions[i], dtype=POSITION_DTYPE) for i in order]
+            flat_positions = np.concatenate(per_doc) if per_doc else flat_positions
+            doc_ids, frequencies, masks = doc_ids[order], frequencies[order], masks[order]
+        return cls(word_id, doc_ids, frequencies, masks, flat_positions)
+
+
+class SegmentWriter:
+    """Streams term blocks into a new segment; word ids must be added in increasing order."""
+
+    def __init__(self, file_name, lengths=None):
+        self.file_name = file_name
+        self.lengths = lengths
+        self.temp_file = f'{file_name}.tmp'
+        self.file = open(self.temp_file, 'wb')
+        self.file.write(HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION))
+        self.entries = []
+        self.last_word_id = -1
+
+    def add(self, posting_list):
+        word_id = posting_list.word_id
+        if word_id <= self.last_word_id:
+            raise ValueError(f'Word ids must be increasing ({word_id} after {self.last_word_id})')
+        self.last_word_id = word_id
+
+        doc_ids = posting_list.doc_ids.astype(np.int64)
+        deltas = np.diff(doc_ids, prepend=0)
+        frequencies = posting_list.frequencies
+        doc_width = packed_width(deltas)
+        freq_width = packed_width(frequencies)
+        positions = posting_list.flat_positions
+        if positions is None:
+            positions = np.empty(0, dtype=POSITION_DTYPE)
+
+        offset = self.file.tell()
+        self.file.write(deltas.astype(PACKED_DTYPES[doc_width]).tobytes())
+        self.file.write(frequencies.astype(PACKED_DTYPES[freq_width]).tobytes())
+        self.file.write(posting_list.masks.astype(np.uint8).tobytes())
+        self.file.write(positions.astype(POSITION_DTYPE).tobytes())
+        blocks_offset = self.file.tell()
+        blocks = compute_blocks(posting_list.doc_ids, frequencies, posting_list.masks, self.lengths)
+        self.file.write(blocks.tobytes())
+        self.entries.append((word_id, len(doc_ids), offset, len(positions), doc_width, freq_width, 0, blocks_offset))
+
+    # Write the directory and footer, then atomically replace the old segment
+    def close(self):
+        directory = np.array(self.entries, dtype=DIRECTORY_DTYPE)
+        directory_offset = self.file.tell()
+        self.file.write(directory.tobytes())
+        self.file.write(FOOTER.pack(directory_offset, len(directory), SEGMENT_MAGIC))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.temp_file, self.file_name)
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.temp_file):
+            os.remove(self.temp_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class Segment:
+    """Read-only, memory-mapped view of one segment file."""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        with open(file_name, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = HEADER.unpack_from(self.buffer, 0)
+        directory_offset, count, footer_magic = FOOTER.unpack_from(self.buffer, len(self.buffer) - FOOTER.size)
+        if magic != SEGMENT_MAGIC or footer_magic != SEGMENT_MAGIC:
+            raise ValueError(f'{file_name} is not a posting segment')
+        if version not in DIRECTORY_DTYPES:
+            raise ValueError(f'{file_name} has unsupported segment version {version}')
+
+        self.version = version
+        self.directory = np.frombuffer(self.buffer, dtype=DIRECTORY_DTYPES[version], count=count, offset=directory_offset)
+        self.word_ids = self.directory['word_id']
+
+    def __len__(self):
+        return len(self.directory)
+
+    def _find(self, word_id):
+        index = int(np.searchsorted(self.word_ids, word_id))
+        if index < len(self.word_ids) and self.word_ids[index] == word_id:
+            return index
+        return None
+
+    def __contains__(self, word_id):
+        return self._find(word_id) is not None
+
+    # Decode a term block straight from the mmap into NumPy arrays
+    def postings(self, word_id):
+        index = self._find(word_id)
+        if index is None:
+            return None
+        entry = self.directory[index]
+        count = int(entry['count'])
+        offset = int(entry['offset'])
+        doc_dtype = PACKED_DTYPES[int(entry['doc_width'])]
+        freq_dtype = PACKED_DTYPES[int(entry['freq_width'])]
+
+        deltas = np.frombuffer(self.buffer, dtype=doc_dtype, count=count, offset=offset)
+        offset += count * doc_dtype.itemsize
+        frequencies = np.frombuffer(self.buffer, dtype=freq_dtype, count=count, offset=offset)
+        offset += count * freq_dtype.itemsize
+        masks = np.frombuffer(self.buffer, dtype=np.uint8, count=count, offset=offset)
+        offset += count
+        flat_positions = np.frombuffer(self.buffer, dtype=POSITION_DTYPE, count=int(entry['positions']), offset=offset)
+
+        blocks = None
+        if self.version >= 2:
+            blocks = np.frombuffer(self.buffer, dtype=BLOCK_DTYPE, count=(count + BLOCK_SIZE - 1) // BLOCK_SIZE,
+                                   offset=int(entry['blocks_offset']))
+
+        doc_ids = np.cumsum(deltas, dtype=np.uint32)
+        return PostingList(int(word_id), doc_ids, frequencies.astype(np.uint32), masks, flat_positions, blocks)
+
+    # Iterate every posting list in word id order
+    def __iter__(self):
+        for word_id in self.word_ids:
+            yield self.postings(int(word_id))
+
+
+class SegmentIndex:
+    """All barrel segments of an inverted index, mapped once and looked up by word id."""
+
+    # `barrels` (e.g. a snapshot's barrel directory) skips listing the folder
+    def __init__(self, inverted_index_folder, barrels=None):
+        self.inverted_index_folder = inverted_index_folder
+        self.segments = {}
+        self.versions = {}  # barrel -> times it was remapped (what cached postings are checked against)
+        if barrels is None:
+            barrels = [int(re.search(r'inverted_(\d+)\.seg$', file_name).group(1))
+                       for file_name in glob.glob(f'{inverted_index_folder}/inverted_*.seg')]
+        for barrel_num in barrels:
+            self.reload_barrel(barrel_num)
+        print(f"Mapped {len(self.segments)} posting segments!")
+
+    def has_barrel(self, barrel_num):
+        return barrel_num in self.segments
+
+    def postings(self, word_id):
+        segment = self.segments.get(word_id // barrel_size)
+        if segment is None:
+            return None
+        return segment.postings(word_id)
+
+    def version(self, barrel_num):
+        return self.versions.get(barrel_num, 0)
+
+    # Remap a barrel after its segment file has been replaced on disk
+    def reload_barrel(self, barrel_num):
+        file_name = segment_file(self.inverted_index_folder, barrel_num)
+        if os.path.exists(file_name):
+            self.segments[barrel_num] = Segment(file_name)
+        else:
+            self.segments.pop(barrel_num, None)
+        self.versions[barrel_num] = self.version(barrel_num) + 1
+
+    # A copy with some barrels remapped; this index keeps the old mappings for searches still reading it
+    def with_reloaded(self, barrels):
+        index = object.__new__(SegmentIndex)
+        index.inverted_index_folder = self.inverted_index_folder
+        index.segments = dict(self.segments)
+        index.versions = dict(self.versions)
+        for barrel_num in barrels:
+            index.reload_barrel(barrel_num)
+        return index
+
+
+#
+#   CONVERSION FROM THE CSV BARRELS
+#
+
+# Parse one inverted CSV row into a PostingList
+def parse_inverted_row(row):
+    word_id = int(row[0])
+    doc_ids = json.loads(row[1])
+    frequencies = json.loads(row[2])
+    positions = json.loads(row[3])
+    sources = json.loads(re.sub("'", '"', row[4]))
+    return PostingList.from_lists(word_id, doc_ids, frequencies, positions, sources)
+
+
+def convert_csv_barrel(csv_file, seg_file, lengths=None):
+    posting_lists = []
+    with open(csv_file, mode='r', newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        next(reader, None)  # Skip the header
+        for row in reader:
+            if len(row) >= 5:
+                posting_lists.append(parse_inverted_row(row))
+
+    posting_lists.sort(key=lambda posting_list: posting_list.word_id)
+    with SegmentWriter(seg_file, lengths) as writer:
+        for posting_list in posting_lists:
+            writer.add(posting_list)
+
+
+# Convert every inverted_{n}.csv barrel of the folder into inverted_{n}.seg
+def convert_inverted_index(inverted_index_folder, lengths=None):
+    csv.field_size_limit(100_000_000)
+    barrel = 0
+    while os.path.isfile(f'{inverted_index_folder}/inverted_{barrel}.csv'):
+        print(f"Converting inverted barrel {barrel}...")
+        convert_csv_barrel(f'{inverted_index_folder}/inverted_{barrel}.csv', segment_file(inverted_index_folder, barrel), lengths)
+        barrel += 1
@@ -0,0 +1,287 @@
+import os
+import glob
+import json
+import mmap
+import re
+import struct
+import time
+import numpy as np
+from collections.abc import Mapping
+from lexicon_utils import load_lexicon
+from doc_store import DocStore, StringColumn, build_doc_store_columns, DOC_STORE_VERSION
+
+#
+#   SNAPSHOT FILE LAYOUT
+#
+#   header   | magic, version, number of sections
+#   sections | (name, byte offset, byte length) per section
+#   data     | every section starts on an ALIGNMENT boundary
+#
+#   Sections: 'meta' (JSON: corpus statistics, barrel directory, source CSV stats and the dtype of
+#   every array section), the sorted lexicon ('lexicon.*') and the document store columns ('docstore/*').
+#
+SNAPSHOT_MAGIC = b'SPSN'
+SNAPSHOT_VERSION = 1
+HEADER = struct.Struct('<4sII')
+SECTION = struct.Struct('<40sQQ')
+ALIGNMENT = 64
+
+
+def _source_stats(source_files):
+    stats = {}
+    for name, file_name in source_files.items():
+        stat = os.stat(file_name)
+        stats[name] = [file_name, stat.st_size, stat.st_mtime_ns]
+    return stats
+
+def _segment_barrels(inverted_index_folder):
+    return sorted(int(re.search(r'inverted_(\d+)\.seg$', file_name).group(1))
+                  for file_name in glob.glob(f'{inverted_index_folder}/inverted_*.seg'))
+
+
+###
+### Writing
+###
+# Lexicon sorted by UTF-8 bytes (same order as code points), looked up by binary search
+def _lexicon_sections(lexicon):
+    if isinstance(lexicon, MappedLexicon):
+        return lexicon.sections()
+    words = sorted(lexicon, key=lambda word: word.encode('utf-8'))
+    encoded = [word.encode('utf-8') for word in words]
+    return {
+        'lexicon.offsets': np.concatenate([[0], np.cumsum([len(word) for word in encoded], dtype=np.uint64)]).astype(np.uint64),
+        'lexicon.heap': b''.join(encoded),
+        'lexicon.ids': np.array([lexicon[word] for word in words], dtype=np.uint32),
+    }
+
+def _snapshot_sections(sources, lexicon, columns, doc_store_meta, barrels):
+    sections = _lexicon_sections(lexicon)
+    for name, column in columns.items():
+        sections[f'docstore/{name}'] = column
+
+    N = doc_store_meta['counts']['processed']
+    total_length = int(np.maximum(columns['lengths'], 0).sum())
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'created': time.time(),
+        'N': N,
+        'avgdl': total_length / N if N else 0.0,
+        'total_length': total_length,
+        'lexicon_size': len(sections['lexicon.ids']),
+        'barrels': barrels,
+        'sources': sources,
+        'doc_store': doc_store_meta,
+        'arrays': {name: section.dtype.str for name, section in sections.items() if isinstance(section, np.ndarray)},
+    }
+    return {'meta': json.dumps(meta).encode('utf-8'), **sections}
+
+def _write_sections(snapshot_file, sections):
+    # Offsets are known up front since every section's size is
+    offset = HEADER.size + SECTION.size * len(sections)
+    table = []
+    for name, section in sections.items():
+        offset += -offset % ALIGNMENT
+        length = len(section) if isinstance(section, bytes) else section.nbytes
+        table.append((name, offset, length))
+        offset += length
+
+    temp_file = snapshot_file + '.tmp'
+    with open(temp_file, 'wb') as file:
+        file.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(sections)))
+        for name, offset, length in table:
+            file.write(SECTION.pack(name.encode('utf-8'), offset, length))
+        for (name, offset, length), section in zip(table, sections.values()):
+            file.write(b'\0' * (offset - file.tell()))
+            file.write(section if isinstance(section, bytes) else np.ascontiguousarray(section).tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_file, snapshot_file)
+
+def write_snapshot(snapshot_file, lexicon_file, processed_file, scrapped_file, lengths_file, inverted_index_folder):
+    """Capture the lexicon, document store, corpus statistics and barrel directory in one file, from the CSVs"""
+    source_files = {'lexicon': lexicon_file, 'processed': processed_file, 'scraped': scrapped_file, 'lengths': lengths_file}
+    sources = _source_stats(source_files)  # Taken first, so anything written meanwhile makes the snapshot stale
+    lexicon = load_lexicon(lexicon_file)
+    columns, doc_store_meta = build_doc_store_columns(processed_file, scrapped_file, lengths_file)
+    _write_sections(snapshot_file, _snapshot_sections(sources, lexicon, columns, doc_store_meta, _segment_barrels(inverted_index_folder)))
+    print(f"Snapshot written with {len(lexicon)} words and {doc_store_meta['counts']['processed']} documents")
+
+def capture_snapshot(source_files, lexicon, doc_store, barrels):
+    """
+    Sections of a snapshot of the server's loaded lexicon and document store (mapped columns plus the
+    words and documents added since), so no CSV is parsed. The caller keeps them in step with the source
+    files while this runs (the upload commit lock); writing them with write_captured_snapshot can wait.
+    """
+    sources = _source_stats(source_files)
+    columns, doc_store_meta = doc_store.columns()
+    return _snapshot_sections(sources, lexicon, columns, doc_store_meta, barrels)
+
+def write_captured_snapshot(snapshot_file, sections):
+    _write_sections(snapshot_file, sections)
+    meta = json.loads(sections['meta'])
+    print(f"Snapshot written with {meta['lexicon_size']} words and {meta['N']} documents")
+
+
+###
+### Reading
+###
+class Snapshot:
+    """A snapshot file mapped once; arrays and string heaps are views into the mapping."""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        with open(file_name, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self.map, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{file_name} is not a snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"{file_name}: unsupported snapshot version {version}")
+        self.sections = {}
+        for i in range(count):
+            name, offset, length = SECTION.unpack_from(self.map, HEADER.size + i * SECTION.size)
+            self.sections[name.rstrip(b'\0').decode('utf-8')] = (offset, length)
+        offset, length = self.sections['meta']
+        self.meta = json.loads(self.map[offset:offset + length])
+
+    @classmethod
+    def open_if_fresh(cls, file_name, source_files):
+        """The snapshot, if it exists and was taken from exactly the current source CSVs (None otherwise)"""
+        if not os.path.exists(file_name):
+            return None
+        try:
+            snapshot = cls(file_name)
+        except (ValueError, struct.error, json.JSONDecodeError) as e:
+            print(f"Ignoring snapshot: {e}")
+            return None
+        if snapshot.meta['doc_store']['version'] != DOC_STORE_VERSION:
+            print("Ignoring snapshot: taken with an older document store version")
+            return None
+        for name, file_name in source_files.items():
+            recorded = snapshot.meta['sources'].get(name)
+            if not os.path.exists(file_name) or recorded is None:
+                print(f"Ignoring snapshot: no {name} source")
+                return None
+            stat = os.stat(file_name)
+            if [stat.st_size, stat.st_mtime_ns] != recorded[1:]:
+                print(f"Ignoring snapshot: {file_name} changed since it was taken")
+                return None
+        return snapshot
+
+    def array(self, name):
+        offset, length = self.sections[name]
+        dtype = np.dtype(self.meta['arrays'][name])
+        if length == 0:
+            return np.empty(0, dtype=dtype)
+        return np.frombuffer(self.map, dtype=dtype, count=length // dtype.itemsize, offset=offset)
+
+    def strings(self, name):
+        offset, _ = self.sections[f'{name}.heap']
+        return StringColumn(self.array(f'{name}.offsets'), self.map, base=offset)
+
+    def lexicon(self):
+        return MappedLexicon(self.strings('lexicon'), self.array('lexicon.ids'))
+
+    def doc_store(self):
+        return DocStore(SnapshotColumns(self))
+
+
+class SnapshotColumns:
+    """Document store columns embedded in a snapshot (same interface as doc_store.FolderColumns)."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.meta = snapshot.meta['doc_store']
+
+    def array(self, name):
+        return self.snapshot.array(f'docstore/{name}')
+
+    def strings(self, name):
+        return self.snapshot.strings(f'docstore/{name}')
+
+
+class MappedLexicon(Mapping):
+    """Word -> word id by binary search over the snapshot's sorted words; words added later live in a dict."""
+
+    def __init__(self, words, ids):
+        self.words = words
+        self.ids = ids
+        self.added = {}
+
+    def _word_bytes(self, i):
+        return self.words.heap[self.words.base + int(self.words.offsets[i]):self.words.base + int(self.words.offsets[i + 1])]
+
+    # Index of the first stored word not below `key` (UTF-8 bytes)
+    def _position(self, key):
+        lo, hi = 0, len(self.ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._word_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _find(self, word):
+        key = word.encode('utf-8')
+        lo = self._position(key)
+        if lo < len(self.ids) and self._word_bytes(lo) == key:
+            return int(self.ids[lo])
+        return None
+
+    # Snapshot sections with the added words merged into the stored sorted ones (the stored heap is copied in bulk)
+    def sections(self):
+        lengths = np.diff(np.asarray(self.words.offsets, dtype=np.uint64))
+        ids = np.array(self.ids, dtype=np.uint32)
+        inserts = []
+        for word, word_id in self.added.items():
+            key = word.encode('utf-8')
+            lo = self._position(key)
+            if lo < len(self.ids) and self._word_bytes(lo) == key:
+                ids[lo] = word_id
+            else:
+                inserts.append((lo, key, word_id))
+        inserts.sort()
+
+        heap = []
+        previous = 0
+        for lo, key, _ in inserts:
+            heap.append(self._word_bytes_range(previous, lo))
+            heap.append(key)
+            previous = lo
+        heap.append(self._word_bytes_range(previous, len(self.ids)))
+
+        positions = [lo for lo, _, _ in inserts]
+        lengths = np.insert(lengths, positions, [len(key) for _, key, _ in inserts]).astype(np.uint64)
+        return {
+            'lexicon.offsets': np.concatenate([[0], np.cumsum(lengths, dtype=np.uint64)]).astype(np.uint64),
+            'lexicon.heap': b''.join(heap),
+            'lexicon.ids': np.insert(ids, positions, [word_id for _, _, word_id in inserts]).astype(np.uint32),
+        }
+
+    def _word_bytes_range(self, first, last):
+        return bytes(self.words.heap[self.words.base + int(self.words.offsets[first]):self.words.base + int(self.words.offsets[last])])
+
+    def __getitem__(self, word):
+        word_id = self.added.get(word)
+        if word_id is None and isinstance(word, str):
+            word_id = self._find(word)
+        if word_id is None:
+            raise KeyError(word)
+        return word_id
+
+    def __setitem__(self, word, word_id):
+        self.added[word] = word_id
+
+    def __contains__(self, word):
+        return word in self.added or (isinstance(word, str) and self._find(word) is not None)
+
+    def __iter__(self):
+        for i in range(len(self.ids)):
+            word = self.words[i]
+            if word not in self.added:
+                yield word
+        yield from list(self.added)
+
+    def __len__(self):
+        return len(self.ids) + sum(1 for word in self.added if self._find(word) is None)
@@ -0,0 +1,57 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+###
+### Boot time broken down by stage
+###
+class StartupReport:
+    """Wall time of each boot stage, counted from `started` (a time.perf_counter() value)."""
+
+    def __init__(self, started):
+        self.started = started
+        self.stages = {}  # stage name -> seconds, in the order they ran
+        self.ready = False
+        self.total = None
+        self.error = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        a = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.stages[name] = time.perf_counter() - a
+
+    # A stage that was timed outside of stage(), e.g. the imports before the report existed
+    def record(self, name, seconds):
+        with self.lock:
+            self.stages[name] = seconds
+
+    def mark_ready(self):
+        with self.lock:
+            self.ready = True
+            self.error = None
+            self.total = time.perf_counter() - self.started
+        print("Startup report:")
+        for name, seconds in self.stages.items():
+            print(f"  {name:<20} {seconds:8.3f}s")
+        print(f"  {'total':<20} {self.total:8.3f}s")
+
+    def mark_failed(self, error):
+        with self.lock:
+            self.error = str(error)
+        print(f"Startup failed: {error}")
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'ready': self.ready,
+                'error': self.error,
+                'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+                'total': round(self.total, 4) if self.total is not None else None,
+                'uptime': round(time.perf_counter() - self.started, 4),
+            }
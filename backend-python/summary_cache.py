@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+#
+#   PERSISTENT SUMMARY CACHE (/summarize and /summarize-article)
+#
+#   Gemini summaries keyed by a SHA-256 of what they were generated from: the query and the ids of
+#   the source documents (or the article URL), the summary length and the model name. Entries live
+#   in memory in LRU order and every new one is appended to a log (one JSON object per line), which
+#   is replayed at startup, so summaries survive restarts. Entries older than `ttl_seconds` are
+#   dropped when read, and the least recently used ones once the summaries take more than
+#   `max_bytes`. The log is rewritten with only the live entries when it holds twice as many
+#   records as there are entries (and at every startup). After a restart the LRU order is the order
+#   the entries were stored in.
+#
+class SummaryCache:
+    """Summaries (any JSON value) by key, bounded by `max_bytes` of serialized values and `ttl_seconds` of age."""
+
+    def __init__(self, log_file, max_bytes, ttl_seconds):
+        self.log_file = log_file
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # key -> (value, size in bytes, created as a unix time)
+        self.current_bytes = 0
+        self.records = 0  # Lines in the log
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self._replay()
+
+    @staticmethod
+    def make_key(kind, query, sources, summary_length, model_name):
+        """Hash of what a summary depends on: `sources` are the doc ids (or the URL) it was generated from"""
+        material = json.dumps([kind, query, sources, summary_length, model_name], ensure_ascii=False)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    ###
+    ### Log
+    ###
+    def _replay(self):
+        if not os.path.exists(self.log_file):
+            return
+        with open(self.log_file, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # A torn last line from a crash mid-append
+                self._insert(record['key'], record['value'], len(line.encode('utf-8')), record['created'])
+        now = time.time()
+        for key in [key for key, (_, _, created) in self.entries.items() if now - created > self.ttl_seconds]:
+            self.current_bytes -= self.entries.pop(key)[1]
+        self.evictions = 0  # Entries pushed out by later ones while replaying do not count
+        self._compact()
+
+    @staticmethod
+    def _record(key, value, created):
+        return json.dumps({'key': key, 'value': value, 'created': created}, ensure_ascii=False) + '\n'
+
+    def _append(self, line):
+        os.makedirs(os.path.dirname(self.log_file) or '.', exist_ok=True)
+        with open(self.log_file, 'a', encoding='utf-8') as file:
+            file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+        self.records += 1
+
+    # Rewrite the log with only the live entries, in LRU order (called with the lock held)
+    def _compact(self):
+        temp_file = self.log_file + '.tmp'
+        os.makedirs(os.path.dirname(self.log_file) or '.', exist_ok=True)
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            for key, (value, _, created) in self.entries.items():
+                file.write(self._record(key, value, created))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, self.log_file)
+        self.records = len(self.entries)
+
+    ###
+    ### Entries
+    ###
+    def _insert(self, key, value, size, created):
+        if key in self.entries:
+            self.current_bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size, created)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes and self.entries:
+            _, (_, evicted_size, _) = self.entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[2] > self.ttl_seconds:
+                self.current_bytes -= self.entries.pop(key)[1]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Store a summary (blocking: it is appended to the log and synced)"""
+        created = time.time()
+        line = self._record(key, value, created)
+        size = len(line.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            self._append(line)
+            self._insert(key, value, size, created)
+            if self.records > 2 * max(len(self.entries), 1):
+                self._compact()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+            self._compact()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'log_records': self.records,
+            }
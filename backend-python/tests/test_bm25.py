@@ -0,0 +1,140 @@
+import math
+import numpy as np
+import pytest
+from bm25 import BM25Scorer, TOP_K, k, b, INTERSECTION_VAR, WORD_IN_QUERY_VAR, TITLE_VAR, AUTHOR_VAR, TAG_VAR
+from segments import PostingList, SegmentWriter, Segment, TITLE_BIT, TEXT_BIT, AUTHOR_BIT, TAG_BIT
+
+NUM_DOCS = 3000
+# Word id -> number of documents holding it (several blocks of postings each, and one rare word)
+DOCUMENT_COUNTS = {10: 2400, 11: 900, 12: 350, 13: 40, 14: 1200}
+MASKS = np.array([TEXT_BIT, TEXT_BIT, TEXT_BIT, TITLE_BIT | TEXT_BIT, AUTHOR_BIT, TAG_BIT | TEXT_BIT], dtype=np.uint8)
+
+
+# Small corpus with lots of exact ties: few distinct lengths, frequencies and masks
+@pytest.fixture(scope='module')
+def corpus():
+    rng = np.random.default_rng(2)
+    lengths = rng.choice([40, 80, 120, 300], size=NUM_DOCS).astype(np.int64)
+    postings = {}
+    for word_id, count in DOCUMENT_COUNTS.items():
+        doc_ids = np.sort(rng.choice(NUM_DOCS, size=count, replace=False)).astype(np.uint32)
+        frequencies = rng.choice([1, 1, 2, 3, 5], size=count).astype(np.uint32)
+        masks = rng.choice(MASKS, size=count)
+        postings[word_id] = PostingList(word_id, doc_ids, frequencies, masks)
+    return lengths, postings
+
+
+# The per-posting loop BM25Scorer replaced (scores rounded to float32, the accumulator's precision),
+# ranked by score with ties broken by doc id, one entry per document
+def reference_ranking(lengths, inverted_data, query_word_ids, count):
+    N = NUM_DOCS
+    avgdl = int(lengths.sum()) / N
+    intersection = None
+    for word_id in query_word_ids:
+        if word_id in inverted_data:
+            doc_ids = set(inverted_data[word_id].doc_ids.tolist())
+            intersection = doc_ids if intersection is None else intersection & doc_ids
+    intersection = intersection or set()
+
+    results_list = []
+    for word_id, postings in inverted_data.items():
+        n = len(postings)
+        IDF = math.log10((N - n + 0.5) / (n + 0.5))
+        for doc_id, frequency, mask in zip(postings.doc_ids.tolist(), postings.frequencies.tolist(), postings.masks.tolist()):
+            length = lengths[doc_id]
+            TF = frequency / (frequency + k * (1 - b + b * length / avgdl))
+            score = TF * IDF * 100
+            if doc_id in intersection:
+                score *= INTERSECTION_VAR
+            if word_id in query_word_ids:
+                score *= WORD_IN_QUERY_VAR
+            if mask & TITLE_BIT:
+                score *= TITLE_VAR
+            if mask & AUTHOR_BIT:
+                score *= AUTHOR_VAR
+            if mask & TAG_BIT:
+                score *= TAG_VAR
+            results_list.append((float(np.float32(score)), doc_id))
+
+    ranking = []
+    seen = set()
+    for score, doc_id in sorted(results_list, key=lambda pair: (-pair[0], pair[1])):
+        if doc_id not in seen:
+            seen.add(doc_id)
+            ranking.append((score, doc_id))
+    return ranking[:count]
+
+
+# Same documents in the same order; scores may differ in the last float32 digit (operation order)
+def assert_same_ranking(ranking, expected):
+    assert [doc_id for _, doc_id in ranking] == [doc_id for _, doc_id in expected]
+    assert [score for score, _ in ranking] == pytest.approx([score for score, _ in expected], rel=1e-6)
+
+
+QUERIES = [
+    [10],
+    [13],
+    [10, 11],
+    [11, 12, 13],
+    [10, 11, 12, 13, 14],
+    [12, 99],  # A query word with no postings
+]
+
+
+@pytest.mark.parametrize('query_word_ids', QUERIES)
+@pytest.mark.parametrize('count', [1, 20, TOP_K, NUM_DOCS])
+def test_score_and_top_k_match_per_posting_loop(corpus, query_word_ids, count):
+    lengths, postings = corpus
+    inverted_data = {word_id: postings[word_id] for word_id in query_word_ids if word_id in postings}
+    scorer = BM25Scorer.from_length_array(lengths, NUM_DOCS)
+
+    ranking = scorer.top_k(scorer.score(inverted_data, query_word_ids), count)
+    assert_same_ranking(ranking, reference_ranking(lengths, inverted_data, set(query_word_ids), count))
+
+
+def test_postings_outside_the_query_are_not_boosted(corpus):
+    lengths, postings = corpus
+    inverted_data = {10: postings[10], 12: postings[12]}
+    scorer = BM25Scorer.from_length_array(lengths, NUM_DOCS)
+
+    ranking = scorer.top_k(scorer.score(inverted_data, [10]), TOP_K)
+    assert_same_ranking(ranking, reference_ranking(lengths, inverted_data, {10}, TOP_K))
+
+
+def test_ties_resolve_by_doc_id():
+    lengths = np.full(10, 50, dtype=np.int64)
+    doc_ids = np.array([1, 3, 4, 7, 8], dtype=np.uint32)
+    postings = PostingList(5, doc_ids, np.ones(5, dtype=np.uint32), np.full(5, TEXT_BIT, dtype=np.uint8))
+    scorer = BM25Scorer.from_length_array(lengths, 10)
+
+    # Every document scores the same, so a cutoff inside the tie must still pick the lowest ids
+    ranking = scorer.top_k(scorer.score({5: postings}, [5]), 3)
+    assert [doc_id for _, doc_id in ranking] == [1, 3, 4]
+    assert len({score for score, _ in ranking}) == 1
+
+
+@pytest.mark.parametrize('query_word_ids', QUERIES)
+@pytest.mark.parametrize('count', [1, 20, TOP_K])
+def test_top_k_pruned_matches_exhaustive(corpus, query_word_ids, count):
+    lengths, postings = corpus
+    inverted_data = {word_id: postings[word_id] for word_id in query_word_ids if word_id in postings}
+    scorer = BM25Scorer.from_length_array(lengths, NUM_DOCS)
+
+    pruned, _ = scorer.top_k_pruned(inverted_data, query_word_ids, count)
+    assert pruned == scorer.top_k(scorer.score(inverted_data, query_word_ids), count)
+
+
+# Block-max tables written to a segment (with minimum lengths) must prune to the same results
+@pytest.mark.parametrize('query_word_ids', QUERIES)
+def test_top_k_pruned_over_a_segment_matches_exhaustive(corpus, tmp_path, query_word_ids):
+    lengths, postings = corpus
+    seg_file = str(tmp_path / 'inverted_0.seg')
+    with SegmentWriter(seg_file, lengths) as writer:
+        for word_id in sorted(postings):
+            writer.add(postings[word_id])
+    segment = Segment(seg_file)
+    inverted_data = {word_id: segment.postings(word_id) for word_id in query_word_ids if word_id in segment}
+    scorer = BM25Scorer.from_length_array(lengths, NUM_DOCS)
+
+    pruned, _ = scorer.top_k_pruned(inverted_data, query_word_ids, 20)
+    assert pruned == scorer.top_k(scorer.score(inverted_data, query_word_ids), 20)
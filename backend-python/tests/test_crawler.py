@@ -0,0 +1,63 @@
+import asyncio
+import time
+from aiohttp import web
+from benchmark_crawler import stand_in_app
+from crawler import Crawler
+from scrape import article_row, read_metadata
+
+
+def handle(key, url, status, metadata):
+    return article_row(key, url, status, metadata)
+
+
+# Crawl `jobs` (ids, or (id, host) pairs) against the benchmark's stand-in server; returns (rows, served, crawler, seconds)
+def run_crawl(limit, jobs, **crawler_options):
+    async def crawl():
+        app, served = stand_in_app(limit)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            crawler = Crawler(read=read_metadata, **crawler_options)
+            started = time.monotonic()
+            rows = await crawler.crawl([(str(i), f'http://{host}:{port}/p/{i}') for i, host in jobs], handle)
+            return rows, served, crawler, time.monotonic() - started
+        finally:
+            await runner.cleanup()
+    return asyncio.run(crawl())
+
+
+def test_every_job_finishes_with_200():
+    jobs = [(i, 'localhost' if i % 2 else '127.0.0.1') for i in range(60)]
+    rows, served, crawler, _ = run_crawl(20, jobs, rate=10, max_rate=40)
+    assert sorted(rows, key=int) == [str(i) for i in range(60)]
+    assert all(row[4] == 200 for row in rows.values())
+    assert crawler.stats()['failed'] == 0
+
+
+def test_retry_after_pauses_the_host_then_succeeds():
+    # One request per second allowed: the burst gets a 429 with Retry-After: 1 and the host waits it out
+    rows, served, crawler, seconds = run_crawl(1, [(i, '127.0.0.1') for i in range(3)], rate=50, max_rate=50, burst=3)
+    assert all(row[4] == 200 for row in rows.values())
+    assert served['throttled'] > 0
+    host = crawler.stats()['hosts']
+    assert len(host) == 1
+    [stats] = host.values()
+    assert stats['throttled'] == served['throttled']
+    assert stats['rate'] < 50  # Halved at every throttle
+    assert seconds >= 0.9
+
+
+def test_resumed_crawl_skips_checkpointed_rows(tmp_path):
+    checkpoint = str(tmp_path / 'scraped.csv.checkpoint')
+    first, served, _, _ = run_crawl(100, [(i, '127.0.0.1') for i in range(5)], checkpoint_file=checkpoint)
+    assert served['ok'] == 5
+
+    rows, served, crawler, _ = run_crawl(100, [(i, '127.0.0.1') for i in range(10)], checkpoint_file=checkpoint)
+    assert served['ok'] == 5  # Only the URLs missing from the checkpoint were fetched
+    assert crawler.stats()['fetched'] == 5
+    assert all(rows[key] == row for key, row in first.items())
+    assert sorted(rows, key=int) == [str(i) for i in range(10)]
+    assert all(row[4] == 200 for row in rows.values())
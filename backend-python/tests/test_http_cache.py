@@ -0,0 +1,98 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from http_cache import HttpCache, OfflineCacheMiss, cached_get
+
+
+# Local server sending an ETag per page and answering 304 to a matching If-None-Match
+@pytest.fixture
+def server():
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            etag = f'"{self.path}-v1"'
+            requests_seen.append((self.path, self.headers.get('If-None-Match')))
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            body = f'<html><head><title>{self.path}</title></head><body>{"x" * 500}</body></html>'.encode()
+            self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_port}', requests_seen
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_miss_is_stored_then_revalidated(server, tmp_path):
+    base, requests_seen = server
+    cache = HttpCache(str(tmp_path), 1_000_000, fresh_seconds=60)
+
+    first = cached_get(base + '/a', cache=cache)
+    assert first.status_code == 200
+    assert cache.lookup(base + '/a') is not None
+
+    # Fresh: served from disk without asking the server
+    assert cached_get(base + '/a', cache=cache).text == first.text
+    assert len(requests_seen) == 1
+
+    # Stale: revalidated with the stored ETag, and the 304 serves the stored page
+    cache.fresh_seconds = 0
+    second = cached_get(base + '/a', cache=cache)
+    assert second.status_code == 200
+    assert second.text == first.text
+    assert requests_seen[-1] == ('/a', '"/a-v1"')
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['revalidated'] == 1
+
+
+def test_offline_replays_stored_pages_only(server, tmp_path):
+    base, requests_seen = server
+    stored = cached_get(base + '/a', cache=HttpCache(str(tmp_path), 1_000_000, fresh_seconds=0))
+
+    offline = HttpCache(str(tmp_path), 1_000_000, fresh_seconds=0, offline=True)
+    assert cached_get(base + '/a', cache=offline).text == stored.text
+    with pytest.raises(OfflineCacheMiss):
+        cached_get(base + '/unknown', cache=offline)
+    assert len(requests_seen) == 1
+
+
+def test_evict_drops_oldest_entries_and_unreferenced_bodies(tmp_path):
+    cache = HttpCache(str(tmp_path), 1_000_000, fresh_seconds=60)
+    headers = {'ETag': '"v"'}
+    for i in range(4):
+        cache.store(f'http://example.com/{i}', 200, headers, bytes([i]) * 1000)
+        os.utime(cache._entry_file(f'http://example.com/{i}'), (1000 + i, 1000 + i))
+    # The least recently used entry shares its body with the newest page, which keeps it
+    cache.store('http://example.com/copy', 200, headers, bytes([3]) * 1000)
+    os.utime(cache._entry_file('http://example.com/copy'), (999, 999))
+    # A body no entry points to (as a crash between the two writes leaves behind)
+    cache._write_atomic(cache._object_file('0' * 64), b'orphan' * 100)
+
+    cache.max_bytes = 2500  # Evicts down to 2250 bytes of bodies
+    cache.evict()
+
+    assert cache.lookup('http://example.com/copy') is None
+    assert cache.lookup('http://example.com/0') is None
+    assert cache.lookup('http://example.com/1') is None
+    assert cache.lookup('http://example.com/2') is not None
+    assert cache.lookup('http://example.com/3') is not None
+    assert not os.path.exists(cache._object_file('0' * 64))
+    assert not os.path.exists(cache._object_file(cache._digest(bytes([0]) * 1000)))
+    assert not os.path.exists(cache._object_file(cache._digest(bytes([1]) * 1000)))
+    assert cache.stats()['bytes'] == 2000
+    assert cache.stats()['evictions'] == 3
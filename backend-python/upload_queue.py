@@ -0,0 +1,270 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+
+#
+#   UPLOAD JOB QUEUE
+#
+#   A job is one /upload-url or /upload-urls request: a list of URLs, each going
+#   queued -> scraping -> scraped -> indexed (or failed). Workers scrape URLs concurrently and
+#   scraped articles are committed to the index in batches. Every state change is appended to a
+#   log (one JSON object per line), so jobs cut short by a restart are picked up again. The log is
+#   written by a single task through the default executor, never on the event loop: changes made
+#   while it writes go out together, with one fsync. Finished jobs are dropped (and the log is
+#   rewritten without them) once they are `retention` seconds old, except for the latest job.
+#
+FINISHED = ('indexed', 'failed')
+REWRITE = 'rewrite'  # Queued in place of an event: rewrite the log with only the jobs kept
+
+
+class UploadJob:
+    """One upload request and the state of each of its URLs."""
+
+    def __init__(self, job_id, urls, created):
+        self.id = job_id
+        self.urls = urls
+        self.created = created
+        self.finished_at = None  # Unix time the last URL finished
+        self.items = {url: {'status': 'queued', 'message': None, 'doc_id': None} for url in urls}
+
+    def count(self, *statuses):
+        return sum(1 for item in self.items.values() if item['status'] in statuses)
+
+    @property
+    def finished(self):
+        return self.count(*FINISHED) == len(self.items)
+
+    def status(self, with_items=False):
+        """Progress of the job, in the shape /upload-status always had (plus counts)"""
+        total = len(self.items)
+        indexed = self.count('indexed')
+        failed = self.count('failed')
+        errors = [item['message'] for item in self.items.values() if item['status'] == 'failed']
+        if self.finished:
+            step = "Completed" if indexed else "Failed"
+        elif self.count('queued') == total:
+            step = "Queued for upload..."
+        else:
+            step = f"Scraping and indexing articles ({indexed + failed} of {total} done)..."
+
+        status = {
+            "job_id": self.id,
+            "is_uploading": not self.finished,
+            "current_step": step,
+            "progress": int(100 * (indexed + failed) / total) if total else 100,
+            "error": (errors[0] if total == 1 else f"{failed} of {total} URLs failed (first: {errors[0]})") if errors else None,
+            "success": self.finished and indexed > 0,
+            "total": total,
+            "indexed": indexed,
+            "failed": failed,
+        }
+        if with_items:
+            status["items"] = self.items
+        return status
+
+
+class UploadQueue:
+    """
+    Persistent upload jobs served by a pool of async scraping workers and one batch committer.
+
+    `scrape(url)` is a coroutine returning {'success', 'message', 'data'}, awaited on the event loop
+    (it should do its own blocking work elsewhere). `commit(articles)` takes a list of scraped
+    article dicts and returns one {'success', 'message', 'doc_id'} per article; it is blocking and
+    runs in the default executor.
+    """
+
+    def __init__(self, log_file, scrape, commit, workers, batch_size, batch_wait, retention):
+        self.log_file = log_file
+        self.scrape = scrape
+        self.commit = commit
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.retention = retention
+        self.jobs = {}
+        self.latest = None
+        self.pending = None   # (job, url) waiting for a worker
+        self.scraped = None   # (job, url, article data) waiting for a commit
+        self.events = None    # log events (or REWRITE) waiting for the writer
+        self.tasks = []
+        self.writer = None
+
+    ###
+    ### Log
+    ###
+    def _log(self, event):
+        self.events.put_nowait(event)
+
+    # The only task touching the log: appends what piled up, or rewrites the log if asked to
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            events = [await self.events.get()]
+            while not self.events.empty():
+                events.append(self.events.get_nowait())
+            stopping = None in events
+            events = [event for event in events if event is not None]
+            try:
+                if REWRITE in events:
+                    # The jobs' state already holds every event queued so far, so it replaces them all
+                    await loop.run_in_executor(None, self._rewrite, self._job_lines(self.jobs.values()))
+                elif events:
+                    await loop.run_in_executor(None, self._append, [json.dumps(event) + '\n' for event in events])
+            except Exception as e:
+                print(f"DEBUG: Failed to write the upload job log: {e}")
+            if stopping:
+                return
+
+    def _append(self, lines):
+        with open(self.log_file, 'a', encoding='utf-8') as file:
+            file.writelines(lines)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _rewrite(self, lines):
+        temp_file = self.log_file + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            file.writelines(lines)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, self.log_file)
+
+    @staticmethod
+    def _job_lines(jobs):
+        lines = []
+        for job in jobs:
+            lines.append(json.dumps({'event': 'job', 'job': job.id, 'urls': job.urls, 'created': job.created}) + '\n')
+            for url, item in job.items.items():
+                if item['status'] != 'queued':
+                    lines.append(json.dumps({'event': 'item', 'job': job.id, 'url': url, **item}) + '\n')
+        return lines
+
+    def _replay(self):
+        if not os.path.exists(self.log_file):
+            return
+        with open(self.log_file, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # A torn last line from a crash mid-append
+                if event['event'] == 'job':
+                    self.jobs[event['job']] = self.latest = UploadJob(event['job'], event['urls'], event['created'])
+                elif event['job'] in self.jobs:
+                    self.jobs[event['job']].items[event['url']].update(status=event['status'], message=event['message'], doc_id=event['doc_id'])
+
+        # Rewrite the log with only the jobs still running and the latest one
+        keep = [job for job in self.jobs.values() if not job.finished or job is self.latest]
+        self._rewrite(self._job_lines(keep))
+        self.jobs = {job.id: job for job in keep}
+        for job in keep:
+            if job.finished:
+                job.finished_at = time.time()
+
+    def _set(self, job, url, status, message=None, doc_id=None):
+        job.items[url].update(status=status, message=message, doc_id=doc_id)
+        if status in FINISHED and job.finished:
+            job.finished_at = time.time()
+        self._log({'event': 'item', 'job': job.id, 'url': url, 'status': status, 'message': message, 'doc_id': doc_id})
+
+    # Drop the finished jobs older than `retention` (but not the latest), and have the log rewritten without them
+    def _prune(self):
+        now = time.time()
+        expired = [job.id for job in self.jobs.values()
+                   if job is not self.latest and job.finished_at is not None and now - job.finished_at > self.retention]
+        for job_id in expired:
+            del self.jobs[job_id]
+        if expired:
+            self._log(REWRITE)
+
+    ###
+    ### Lifecycle (inside the event loop)
+    ###
+    async def start(self):
+        self.pending = asyncio.Queue()
+        self.scraped = asyncio.Queue()
+        self.events = asyncio.Queue()
+        self._replay()
+        # Scraped articles are not logged, so anything not committed yet is scraped again
+        for job in self.jobs.values():
+            for url, item in job.items.items():
+                if item['status'] not in FINISHED:
+                    self.pending.put_nowait((job, url))
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self._committer()))
+        self.writer = asyncio.create_task(self._writer())
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        # Everything logged so far is written before the queue stops
+        self._log(None)
+        await self.writer
+
+    def submit(self, urls):
+        job = UploadJob(uuid.uuid4().hex, list(dict.fromkeys(urls)), time.time())
+        self._log({'event': 'job', 'job': job.id, 'urls': job.urls, 'created': job.created})
+        self.jobs[job.id] = self.latest = job
+        for url in job.urls:
+            self.pending.put_nowait((job, url))
+        return job
+
+    ###
+    ### Workers
+    ###
+    async def _worker(self):
+        while True:
+            job, url = await self.pending.get()
+            try:
+                self._set(job, url, 'scraping')
+                result = await self.scrape(url)
+                if result['success']:
+                    self._set(job, url, 'scraped')
+                    await self.scraped.put((job, url, result['data']))
+                else:
+                    self._set(job, url, 'failed', result['message'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._set(job, url, 'failed', str(e))
+
+    # Commits whatever was scraped as one batch: up to batch_size articles, waiting at most batch_wait for more
+    async def _committer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.scraped.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(await asyncio.wait_for(self.scraped.get(), max(0, deadline - loop.time())))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                results = await loop.run_in_executor(None, self.commit, [data for _, _, data in batch])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                results = [{'success': False, 'message': str(e), 'doc_id': None}] * len(batch)
+            for (job, url, _), result in zip(batch, results):
+                if result['success']:
+                    self._set(job, url, 'indexed', doc_id=result['doc_id'])
+                else:
+                    self._set(job, url, 'failed', result['message'])
+            self._prune()
+
+    ###
+    ### Status
+    ###
+    def job(self, job_id):
+        return self.jobs.get(job_id)
+
+    def stats(self):
+        return {
+            'jobs': len(self.jobs),
+            'queued': self.pending.qsize() if self.pending else 0,
+            'awaiting_commit': self.scraped.qsize() if self.scraped else 0,
+            'workers': self.workers,
+        }